@@ -1,10 +1,12 @@
 import os
 from flask import Flask, render_template, request, jsonify
-import requests
-import time
 
 from config import config
+from services import upstream
+from services.cache import get_cache
+from services.deadline import DeadlineExceeded, with_deadline
 from services.logging_service import get_logger, log_event
+from services.metrics import get_metrics
 from services.rate_limiter import rate_limit
 
 app = Flask(__name__)
@@ -18,27 +20,19 @@ logger = get_logger()
 # Log startup
 log_event('startup', f'debug={config.DEBUG}')
 
-# Simple cache for geocoding
-_geo_cache = {}
+# Bounded cache for geocoding results
+_geo_cache = get_cache('geo')
 
+# Start warm from the last cache snapshot, and keep snapshotting
+if config.CACHE_SNAPSHOT_ENABLED:
+    from services import cache_snapshot
+    cache_snapshot.restore()
+    cache_snapshot.start()
 
-def _request_with_retry(url, params, max_retries=None, timeout=None):
-    """Make HTTP request with retry logic."""
-    max_retries = max_retries or config.API_MAX_RETRIES
-    timeout = timeout or config.API_TIMEOUT
-    
-    for attempt in range(max_retries):
-        try:
-            resp = requests.get(url, params=params, timeout=timeout)
-            resp.raise_for_status()
-            return resp.json()
-        except requests.exceptions.Timeout:
-            time.sleep(0.3 * (attempt + 1))
-        except requests.exceptions.RequestException as e:
-            if attempt == max_retries - 1:
-                log_event('api_fail', f'{url}:{str(e)[:50]}')
-            time.sleep(0.2 * (attempt + 1))
-    return None
+# Fill tomorrow's weather entries for hot locations before midnight
+if config.PREWARM_ENABLED:
+    from services import prewarm
+    prewarm.start()
 
 
 @app.route('/')
@@ -48,24 +42,29 @@ def index():
 
 @app.route('/api/search')
 @rate_limit(config.RATE_LIMIT_SEARCH)
+@with_deadline(config.DEADLINE_SEARCH)
 def search_city():
     query = request.args.get('q', '').strip()
     if len(query) < 2:
         return jsonify([])
     
     cache_key = query.lower()
-    if cache_key in _geo_cache:
-        data, ts = _geo_cache[cache_key]
-        if time.time() - ts < config.CACHE_TTL_GEO:
-            return jsonify(data)
+    cached = _geo_cache.get(cache_key)
+    if cached is not None:
+        return jsonify(cached)
     
     try:
         url = "https://geocoding-api.open-meteo.com/v1/search"
-        data = _request_with_retry(url, {"name": query, "count": 8, "language": "en"})
+        data = upstream.get_json(url, {"name": query, "count": 8, "language": "en"})
         if data:
             results = data.get('results', [])
-            _geo_cache[cache_key] = (results, time.time())
+            _geo_cache.set(cache_key, results)
             return jsonify(results)
+        # Upstream failed: remember briefly so retries do not pile on
+        _geo_cache.set_negative(cache_key, [], config.CACHE_NEGATIVE_TTL)
+        return jsonify([])
+    except DeadlineExceeded:
+        # Out of time is not an upstream failure: nothing is cached
         return jsonify([])
     except Exception as e:
         log_event('error', f'search:{str(e)[:50]}')
@@ -74,6 +73,7 @@ def search_city():
 
 @app.route('/api/uplift')
 @rate_limit(config.RATE_LIMIT_UPLIFT)
+@with_deadline(config.DEADLINE_UPLIFT)
 def api_uplift():
     from services.uplift_engine import generate_uplift_data
     try:
@@ -101,5 +101,11 @@ def health():
     return jsonify({"status": "ok"})
 
 
+@app.route('/metrics')
+def metrics():
+    """In-process metrics snapshot for this worker."""
+    return jsonify(get_metrics().snapshot())
+
+
 if __name__ == '__main__':
     app.run(debug=True, port=8080)
@@ -6,6 +6,8 @@ Uses environment variables with sensible defaults.
 import os
 from dataclasses import dataclass
 
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
 
 @dataclass(frozen=True)
 class Config:
@@ -17,12 +19,101 @@ class Config:
     # API Settings
     API_TIMEOUT: int = int(os.environ.get('API_TIMEOUT', '8'))
     API_MAX_RETRIES: int = int(os.environ.get('API_MAX_RETRIES', '3'))
+    # Request-wide upstream time budget per endpoint (seconds)
+    DEADLINE_UPLIFT: float = float(os.environ.get('DEADLINE_UPLIFT', '10'))
+    DEADLINE_SEARCH: float = float(os.environ.get('DEADLINE_SEARCH', '5'))
+    # Upstream quota (0 = unlimited): per minute in each worker process, per
+    # UTC day across workers sharing CACHE_BACKEND; prefetch and batch calls
+    # stop while less than their reserve fraction is left
+    QUOTA_PER_MINUTE: int = int(os.environ.get('QUOTA_PER_MINUTE', '600'))
+    QUOTA_PER_DAY: int = int(os.environ.get('QUOTA_PER_DAY', '10000'))
+    QUOTA_RESERVE_PREFETCH: float = float(os.environ.get('QUOTA_RESERVE_PREFETCH', '0.2'))
+    QUOTA_RESERVE_BATCH: float = float(os.environ.get('QUOTA_RESERVE_BATCH', '0.5'))
+    # Circuit breaker per upstream host and negative caching of failed loads
+    CIRCUIT_FAILURE_THRESHOLD: int = int(os.environ.get('CIRCUIT_FAILURE_THRESHOLD', '5'))
+    CIRCUIT_RESET_SEC: float = float(os.environ.get('CIRCUIT_RESET_SEC', '30'))
+    CACHE_NEGATIVE_TTL: int = int(os.environ.get('CACHE_NEGATIVE_TTL', '30'))
+    # Threads shared by concurrent fetches and background cache refreshes
+    IO_POOL_WORKERS: int = int(os.environ.get('IO_POOL_WORKERS', '8'))
+    # Shared upstream client: pooled keep-alive connections per host and
+    # full-jitter exponential backoff between attempts (seconds)
+    UPSTREAM_POOL_SIZE: int = int(os.environ.get('UPSTREAM_POOL_SIZE', '10'))
+    UPSTREAM_BACKOFF_BASE: float = float(os.environ.get('UPSTREAM_BACKOFF_BASE', '0.2'))
+    UPSTREAM_BACKOFF_MAX: float = float(os.environ.get('UPSTREAM_BACKOFF_MAX', '2.0'))
+    # Forecast misses within this window are merged into one multi-location
+    # request (0 disables batching)
+    UPSTREAM_BATCH_WINDOW_MS: float = float(os.environ.get('UPSTREAM_BATCH_WINDOW_MS', '20'))
+    UPSTREAM_BATCH_MAX: int = int(os.environ.get('UPSTREAM_BATCH_MAX', '50'))
+    # Hedged requests: a second request once the first exceeds this latency
+    # percentile, for at most UPSTREAM_HEDGE_MAX_RATIO of requests
+    UPSTREAM_HEDGE: bool = os.environ.get('UPSTREAM_HEDGE', 'false').lower() == 'true'
+    UPSTREAM_HEDGE_PERCENTILE: float = float(os.environ.get('UPSTREAM_HEDGE_PERCENTILE', '0.95'))
+    UPSTREAM_HEDGE_MAX_RATIO: float = float(os.environ.get('UPSTREAM_HEDGE_MAX_RATIO', '0.05'))
+    UPSTREAM_HEDGE_MIN_SAMPLES: int = int(os.environ.get('UPSTREAM_HEDGE_MIN_SAMPLES', '20'))
     
-    # Cache TTL (seconds)
+    # Fixed cache TTL (seconds), used when no data-aware expiry applies
     CACHE_TTL_WEATHER: int = int(os.environ.get('CACHE_TTL_WEATHER', '300'))  # 5 min
-    CACHE_TTL_SOLAR: int = int(os.environ.get('CACHE_TTL_SOLAR', '300'))  # 5 min
     CACHE_TTL_GEO: int = int(os.environ.get('CACHE_TTL_GEO', '3600'))  # 1 hour
     
+    # Forecast model grid (degrees); weather is cached and fetched per cell
+    WEATHER_GRID_DEG: float = float(os.environ.get('WEATHER_GRID_DEG', '0.1'))
+    
+    # Forecast model update cadence; weather entries expire at the next update
+    WEATHER_MODEL_UPDATE_HOURS: int = int(os.environ.get('WEATHER_MODEL_UPDATE_HOURS', '3'))
+    WEATHER_MODEL_UPDATE_DELAY_MIN: int = int(os.environ.get('WEATHER_MODEL_UPDATE_DELAY_MIN', '30'))
+    
+    # Stale-while-revalidate: seconds an expired entry may still be served
+    CACHE_GRACE_WEATHER: int = int(os.environ.get('CACHE_GRACE_WEATHER', '1800'))
+    CACHE_GRACE_SOLAR: int = int(os.environ.get('CACHE_GRACE_SOLAR', '86400'))
+    # Probabilistic early refresh for keys read at least CACHE_HOT_HITS times
+    CACHE_EARLY_REFRESH_BETA: float = float(os.environ.get('CACHE_EARLY_REFRESH_BETA', '1.0'))
+    CACHE_HOT_HITS: int = int(os.environ.get('CACHE_HOT_HITS', '3'))
+    # Lifetimes are shortened by up to this fraction so entries never expire in lockstep
+    CACHE_EXPIRY_JITTER: float = float(os.environ.get('CACHE_EXPIRY_JITTER', '0.1'))
+    
+    # Midnight pre-warm: fill tomorrow's weather entries for today's hot locations
+    PREWARM_ENABLED: bool = os.environ.get('PREWARM_ENABLED', 'true').lower() == 'true'
+    PREWARM_LEAD_MIN: int = int(os.environ.get('PREWARM_LEAD_MIN', '10'))
+    PREWARM_TOP_N: int = int(os.environ.get('PREWARM_TOP_N', '200'))
+    PREWARM_TRACK_MAX: int = int(os.environ.get('PREWARM_TRACK_MAX', '5000'))
+    
+    # Cache bounds per namespace (entries / estimated bytes)
+    CACHE_MAX_ENTRIES_WEATHER: int = int(os.environ.get('CACHE_MAX_ENTRIES_WEATHER', '2000'))
+    CACHE_MAX_BYTES_WEATHER: int = int(os.environ.get('CACHE_MAX_BYTES_WEATHER', str(16 * 1024 * 1024)))
+    CACHE_MAX_ENTRIES_SOLAR: int = int(os.environ.get('CACHE_MAX_ENTRIES_SOLAR', '20000'))
+    CACHE_MAX_BYTES_SOLAR: int = int(os.environ.get('CACHE_MAX_BYTES_SOLAR', str(8 * 1024 * 1024)))
+    CACHE_MAX_ENTRIES_GEO: int = int(os.environ.get('CACHE_MAX_ENTRIES_GEO', '2000'))
+    CACHE_MAX_BYTES_GEO: int = int(os.environ.get('CACHE_MAX_BYTES_GEO', str(4 * 1024 * 1024)))
+    # Shared L2 behind the per-worker caches: '' (none), memory, sqlite or
+    # redis; with an L2, each namespace keeps at most CACHE_L1_MAX_ENTRIES locally
+    CACHE_BACKEND: str = os.environ.get('CACHE_BACKEND', '')
+    CACHE_SQLITE_PATH: str = os.environ.get(
+        'CACHE_SQLITE_PATH', os.path.join(BASE_DIR, 'data', 'cache.sqlite3'))
+    CACHE_REDIS_URL: str = os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+    CACHE_L2_TIMEOUT: float = float(os.environ.get('CACHE_L2_TIMEOUT', '0.5'))
+    CACHE_L1_MAX_ENTRIES: int = int(os.environ.get('CACHE_L1_MAX_ENTRIES', '256'))
+    # Snapshot the caches to disk periodically and at exit, and restore them
+    # at startup within a time budget
+    CACHE_SNAPSHOT_ENABLED: bool = os.environ.get('CACHE_SNAPSHOT_ENABLED', 'true').lower() == 'true'
+    CACHE_SNAPSHOT_PATH: str = os.environ.get(
+        'CACHE_SNAPSHOT_PATH', os.path.join(BASE_DIR, 'data', 'cache_snapshot.bin'))
+    CACHE_SNAPSHOT_INTERVAL_SEC: int = int(os.environ.get('CACHE_SNAPSHOT_INTERVAL_SEC', '300'))
+    CACHE_SNAPSHOT_RESTORE_BUDGET_MS: int = int(os.environ.get('CACHE_SNAPSHOT_RESTORE_BUDGET_MS', '250'))
+    
+    # Solar
+    SOLAR_ATLAS_PATH: str = os.environ.get(
+        'SOLAR_ATLAS_PATH', os.path.join(BASE_DIR, 'data', 'daylight_atlas.bin'))
+    # Upstream fallback: 'sparse' fetches only the needed dates, 'window' the full series
+    SOLAR_UPSTREAM_MODE: str = os.environ.get('SOLAR_UPSTREAM_MODE', 'sparse')
+    # Provider: atlas, local-vectorized, local-astral or upstream
+    SOLAR_PROVIDER: str = os.environ.get('SOLAR_PROVIDER', 'atlas')
+    # Shadow provider compared against the primary on a sample of requests
+    SOLAR_SHADOW_PROVIDER: str = os.environ.get('SOLAR_SHADOW_PROVIDER', '')
+    SOLAR_SHADOW_SAMPLE_RATE: float = float(os.environ.get('SOLAR_SHADOW_SAMPLE_RATE', '0.01'))
+    SOLAR_SHADOW_ALERT_SEC: float = float(os.environ.get('SOLAR_SHADOW_ALERT_SEC', '120'))
+    # Entries in the sun-times memo (astral/suntime path)
+    SUN_TIMES_MEMO_SIZE: int = int(os.environ.get('SUN_TIMES_MEMO_SIZE', '4096'))
+    
     # Rate Limiting (requests per minute)
     RATE_LIMIT_UPLIFT: int = int(os.environ.get('RATE_LIMIT_UPLIFT', '30'))
     RATE_LIMIT_SEARCH: int = int(os.environ.get('RATE_LIMIT_SEARCH', '60'))
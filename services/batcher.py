@@ -0,0 +1,149 @@
+"""
+Micro-batching of Open-Meteo forecast requests.
+
+The forecast API accepts comma-separated latitude/longitude lists and then
+answers with one result per location. Cache misses arriving within
+UPSTREAM_BATCH_WINDOW_MS that ask for the same variables are merged into a
+single multi-location request: the first caller waits out the window (or
+until the batch is full), sends it, and fans the results back out to every
+waiting caller, each of which stores its own cache entry.
+
+A batch is sent on behalf of all its members: at the highest quota priority
+among them and under the most generous of their deadlines, on a separate
+thread. Each member waits only as long as its own deadline allows.
+"""
+
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import config
+from services import deadline, quota, upstream
+from services.metrics import get_metrics
+
+FORECAST_URL = "https://api.open-meteo.com/v1/forecast"
+
+
+# Highest priority first
+_PRIORITY_ORDER = (quota.INTERACTIVE, quota.PREFETCH, quota.BATCH)
+
+# Batches are sent here, detached from every member's context; sends never
+# submit further work, so members on the shared I/O pool cannot deadlock
+_send_pool = ThreadPoolExecutor(max_workers=config.IO_POOL_WORKERS, thread_name_prefix="batch")
+
+
+class _Batch:
+    __slots__ = ("points", "results", "done", "full", "priorities", "deadlines", "cut_short")
+
+    def __init__(self):
+        self.points = []
+        self.results = None
+        self.done = threading.Event()
+        self.full = threading.Event()
+        self.priorities = set()
+        self.deadlines = []
+        self.cut_short = False
+
+    def join(self):
+        """Record the calling member's quota priority and deadline."""
+        self.priorities.add(quota.current_priority())
+        self.deadlines.append(deadline.expires_at())
+
+    def priority(self):
+        return min(self.priorities, key=_PRIORITY_ORDER.index)
+
+    def expires_at(self):
+        """The latest member deadline, or None if any member has none."""
+        return None if None in self.deadlines else max(self.deadlines)
+
+
+def _freeze(params):
+    """Hashable form of the request parameters shared by a batch."""
+    return tuple(sorted((k, tuple(v) if isinstance(v, list) else v) for k, v in params.items()))
+
+
+class MicroBatcher:
+    """Merges concurrent single-location requests to one endpoint."""
+
+    def __init__(self, url: str, name: str):
+        self.url = url
+        self.name = name
+        self._lock = threading.Lock()
+        self._open = {}
+
+    def fetch(self, params):
+        """
+        Fetch ``params`` (one latitude/longitude) as part of a batch. Returns
+        this location's decoded result, or None on failure.
+        """
+        window = config.UPSTREAM_BATCH_WINDOW_MS / 1000.0
+        if window <= 0:
+            return upstream.get_json(self.url, params)
+
+        point = (params["latitude"], params["longitude"])
+        shared = {k: v for k, v in params.items() if k not in ("latitude", "longitude")}
+        key = _freeze(shared)
+
+        with self._lock:
+            batch = self._open.get(key)
+            leader = batch is None
+            if leader:
+                batch = _Batch()
+                self._open[key] = batch
+            if point not in batch.points:
+                batch.points.append(point)
+            index = batch.points.index(point)
+            batch.join()
+            if len(batch.points) >= config.UPSTREAM_BATCH_MAX:
+                # Closed to newcomers; the leader sends without waiting further
+                self._open.pop(key, None)
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(window)
+            with self._lock:
+                if self._open.get(key) is batch:
+                    del self._open[key]
+                # Closed: members are final
+                priority, expires_at = batch.priority(), batch.expires_at()
+            _send_pool.submit(contextvars.Context().run, self._send_for_members,
+                              batch, shared, params, priority, expires_at)
+
+        if not batch.done.wait(deadline.remaining()) or batch.cut_short:
+            get_metrics().incr("deadline.exceeded")
+            raise deadline.DeadlineExceeded(f"batch:{self.name}")
+
+        return batch.results[index] if batch.results else None
+
+    def _send_for_members(self, batch, shared, params, priority, expires_at):
+        with quota.priority(priority):
+            if expires_at is None:
+                return self._send(batch, shared, params)
+            with deadline.deadline(expires_at - time.monotonic()):
+                return self._send(batch, shared, params)
+
+    def _send(self, batch, shared, params):
+        try:
+            points = batch.points
+            if len(points) > 1:
+                params = dict(shared,
+                              latitude=",".join(str(lat) for lat, _ in points),
+                              longitude=",".join(str(lon) for _, lon in points))
+            get_metrics().observe(f"batch.{self.name}.size", len(points))
+            try:
+                data = upstream.get_json(self.url, params)
+            except deadline.DeadlineExceeded:
+                # Every member's budget is spent: not an upstream failure
+                batch.cut_short = True
+                return
+            # A single location comes back as an object, several as a list
+            if isinstance(data, dict):
+                data = [data]
+            if data and len(data) == len(points):
+                batch.results = data
+        finally:
+            batch.done.set()
+
+
+forecast = MicroBatcher(FORECAST_URL, "forecast")
@@ -0,0 +1,433 @@
+"""
+Bounded in-memory caches shared by all services.
+
+Each namespace (geo, weather, solar, ...) gets its own thread-safe TTL + LRU
+cache, limited both by entry count and by an estimate of the bytes held, so
+worker memory stays flat no matter how many coordinates or search strings
+arrive. Expired entries are swept periodically, not only when re-read.
+
+Namespaces with a grace window serve stale-while-revalidate: an entry past
+its TTL but within the grace window is still returned while a background
+refresh runs, and hot entries are refreshed probabilistically before they
+expire at all.
+
+With CACHE_BACKEND set, each cache is a small L1 in front of a shared L2
+(see services.cache_backends): writes go to both, and an L1 miss is looked
+up in the L2 before it counts as a miss, so workers share each other's
+upstream fetches.
+"""
+
+import math
+import pickle
+import random
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from config import config
+from services import io_pool, quota
+from services.cache_backends import create_backend
+from services.metrics import get_metrics
+
+# How often (seconds) a write sweeps the whole namespace for expired entries
+_SWEEP_INTERVAL = 60
+
+# Lookup states
+FRESH = "fresh"
+REFRESH = "refresh"  # still fresh, but picked for early refresh
+STALE = "stale"      # past its TTL, within the grace window
+
+_MISSING = object()
+
+
+def estimate_size(obj, _seen=None, _depth=0):
+    """Rough deep size of ``obj`` in bytes (containers, slots and __dict__)."""
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen or _depth > 8:
+        return 0
+    _seen.add(id(obj))
+    size = sys.getsizeof(obj)
+
+    if isinstance(obj, dict):
+        size += sum(estimate_size(k, _seen, _depth + 1) + estimate_size(v, _seen, _depth + 1)
+                    for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(estimate_size(v, _seen, _depth + 1) for v in obj)
+    elif hasattr(obj, "__dict__"):
+        size += estimate_size(vars(obj), _seen, _depth + 1)
+    elif hasattr(obj, "__slots__"):
+        size += sum(estimate_size(getattr(obj, name), _seen, _depth + 1)
+                    for name in obj.__slots__ if hasattr(obj, name))
+    return size
+
+
+class _Entry:
+    __slots__ = ("value", "expires_at", "stale_until", "size", "delta", "hits")
+
+    def __init__(self, value, expires_at, stale_until, size, delta):
+        self.value = value
+        self.expires_at = expires_at
+        self.stale_until = stale_until
+        self.size = size
+        self.delta = delta
+        self.hits = 0
+
+
+class TTLCache:
+    """Thread-safe TTL cache with LRU eviction by entry count and bytes."""
+
+    def __init__(self, namespace: str, ttl=None, max_entries: int = 1024,
+                 max_bytes: int = 8 * 1024 * 1024, grace: float = 0, jitter: float = 0.0,
+                 backend=None):
+        """
+        Args:
+            namespace: Name used in metrics
+            ttl: Default lifetime in seconds (None = no expiry)
+            max_entries: Maximum number of entries
+            max_bytes: Maximum estimated size of all values
+            grace: Seconds an expired entry may still be served stale
+            jitter: Fraction by which each lifetime is randomly shortened
+            backend: Shared L2 (a CacheBackend) behind this cache, if any
+        """
+        self.namespace = namespace
+        self.ttl = ttl
+        self.grace = grace
+        self.jitter = jitter
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.backend = backend
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._last_sweep = time.time()
+
+    def get(self, key, default=None):
+        """Return the cached value, or ``default`` if missing or expired."""
+        found = self.lookup(key, allow_stale=False)
+        return found[0] if found is not None else default
+
+    def lookup(self, key, allow_stale=True):
+        """
+        Return (value, state) or None. State is FRESH, REFRESH (fresh but due
+        for a probabilistic early refresh) or STALE (within the grace window).
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry.stale_until is not None and entry.stale_until <= now:
+                self._remove(key)
+                entry = None
+        if entry is None and self.backend is not None:
+            entry = self._promote(key, now)
+
+        state = None
+        with self._lock:
+            if entry is not None:
+                if entry.expires_at is None or entry.expires_at > now:
+                    entry.hits += 1
+                    state = REFRESH if self._refresh_early(entry, now) else FRESH
+                elif allow_stale:
+                    state = STALE
+            if state is not None and key in self._data:
+                self._data.move_to_end(key)
+        get_metrics().incr(f"cache.{self.namespace}.{state or 'miss'}")
+        return (entry.value, state) if state is not None else None
+
+    def peek(self, key, default=None):
+        """This worker's unexpired value for ``key``, or ``default``; no L2, no metrics."""
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or (entry.expires_at is not None and entry.expires_at <= now):
+                return default
+            return entry.value
+
+    def set(self, key, value, ttl=None, delta=0.0):
+        """
+        Store ``value``; ``ttl`` overrides the namespace default. ``delta`` is
+        how long the value took to produce, used to time early refreshes.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        if ttl is not None and self.jitter:
+            # Only ever shorten, so entries never outlive a semantic boundary,
+            # and entries written together do not expire in lockstep
+            ttl *= 1.0 - random.random() * self.jitter
+        now = time.time()
+        expires_at = now + ttl if ttl is not None else None
+        stale_until = expires_at + self.grace if expires_at is not None else None
+        size = estimate_size(value)
+
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = _Entry(value, expires_at, stale_until, size, delta)
+            self._bytes += size
+            if now - self._last_sweep >= _SWEEP_INTERVAL:
+                self._sweep(now)
+            evicted = self._evict()
+        if evicted:
+            get_metrics().incr(f"cache.{self.namespace}.evicted", evicted)
+        if self.backend is not None:
+            self._write_l2(key, value, expires_at, stale_until)
+
+    def set_negative(self, key, value, ttl):
+        """
+        Remember a failed load as ``value`` for ``ttl`` seconds, so repeat
+        misses do not hammer a failing upstream. Never replaces an existing
+        entry, which may still be served stale, and is never served stale.
+        Negative entries stay in this worker's L1.
+        """
+        now = time.time()
+        with self._lock:
+            if key in self._data:
+                return
+            self._data[key] = _Entry(value, now + ttl, now + ttl, 0, 0.0)
+            evicted = self._evict()
+        get_metrics().incr(f"cache.{self.namespace}.negative")
+        if evicted:
+            get_metrics().incr(f"cache.{self.namespace}.evicted", evicted)
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+        if self.backend is not None:
+            self._l2("delete", self._l2_key(key))
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+        if self.backend is not None:
+            self._l2("clear", self._l2_key(""))
+
+    def entries(self):
+        """(key, value, expires_at, stale_until) of live entries, most recently used first."""
+        now = time.time()
+        with self._lock:
+            return [(key, e.value, e.expires_at, e.stale_until)
+                    for key, e in reversed(self._data.items())
+                    if e.stale_until is None or e.stale_until > now]
+
+    def restore(self, key, value, expires_at=None, stale_until=None):
+        """
+        Put back an entry from a snapshot, keeping its original lifetime.
+        Restored entries queue behind the ones already here for eviction;
+        entries past their grace window and keys already present are
+        skipped. Returns True if the entry was stored.
+        """
+        if stale_until is not None and stale_until <= time.time():
+            return False
+        size = estimate_size(value)
+        with self._lock:
+            if key in self._data:
+                return False
+            self._data[key] = _Entry(value, expires_at, stale_until, size, 0.0)
+            self._data.move_to_end(key, last=False)
+            self._bytes += size
+            self._evict()
+            return key in self._data
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._data), "bytes": self._bytes,
+                    "max_entries": self.max_entries, "max_bytes": self.max_bytes}
+
+    # --- shared L2 ---
+
+    def _l2_key(self, key):
+        return f"{self.namespace}:{key}"
+
+    def _l2(self, operation, *args):
+        """Run a backend operation; an unavailable L2 only costs hits."""
+        try:
+            return getattr(self.backend, operation)(*args)
+        except Exception:
+            get_metrics().incr(f"cache.{self.namespace}.l2_error")
+            return None
+
+    def _write_l2(self, key, value, expires_at, stale_until):
+        try:
+            payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            get_metrics().incr(f"cache.{self.namespace}.l2_error")
+            return
+        self._l2("set", self._l2_key(key), payload, expires_at, stale_until)
+
+    def _promote(self, key, now):
+        """Copy ``key`` from the L2 into this L1 and return its entry, or None."""
+        found = self._l2("get", self._l2_key(key))
+        if found is None:
+            return None
+        payload, expires_at, stale_until = found
+        if stale_until is not None and stale_until <= now:
+            return None
+        try:
+            value = pickle.loads(payload)
+        except Exception:
+            get_metrics().incr(f"cache.{self.namespace}.l2_error")
+            return None
+        size = estimate_size(value)
+
+        with self._lock:
+            # A value this worker stored meanwhile is at least as recent
+            entry = self._data.get(key)
+            if entry is None:
+                entry = _Entry(value, expires_at, stale_until, size, 0.0)
+                self._data[key] = entry
+                self._bytes += size
+                self._evict()
+        get_metrics().incr(f"cache.{self.namespace}.l2_hit")
+        return entry
+
+    # --- internals (caller holds the lock) ---
+
+    def _remove(self, key):
+        entry = self._data.pop(key)
+        self._bytes -= entry.size
+
+    def _refresh_early(self, entry, now):
+        """
+        Probabilistic early expiration (XFetch) for hot entries: the closer to
+        expiry and the slower the value is to produce, the likelier a refresh.
+        """
+        if (not self.grace or entry.expires_at is None or entry.delta <= 0
+                or entry.hits < config.CACHE_HOT_HITS):
+            return False
+        jitter = -entry.delta * config.CACHE_EARLY_REFRESH_BETA * math.log(1.0 - random.random())
+        return now + jitter >= entry.expires_at
+
+    def _sweep(self, now):
+        expired = [k for k, e in self._data.items()
+                   if e.stale_until is not None and e.stale_until <= now]
+        for key in expired:
+            self._remove(key)
+        self._last_sweep = now
+
+    def _evict(self):
+        evicted = 0
+        while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+            _, entry = self._data.popitem(last=False)
+            self._bytes -= entry.size
+            evicted += 1
+        return evicted
+
+
+# Per-namespace limits: (default TTL, max entries, max bytes, grace)
+_NAMESPACE_LIMITS = {
+    "geo": (config.CACHE_TTL_GEO, config.CACHE_MAX_ENTRIES_GEO, config.CACHE_MAX_BYTES_GEO, 0),
+    "weather": (config.CACHE_TTL_WEATHER, config.CACHE_MAX_ENTRIES_WEATHER,
+                config.CACHE_MAX_BYTES_WEATHER, config.CACHE_GRACE_WEATHER),
+    # Daylight windows carry their own lifetime (one per band and local date)
+    "solar": (None, config.CACHE_MAX_ENTRIES_SOLAR, config.CACHE_MAX_BYTES_SOLAR, 0),
+}
+
+_caches = {}
+_registry_lock = threading.Lock()
+_backend = None
+_backend_created = False
+
+
+def get_backend():
+    """The shared L2 backend every namespace uses, or None (created on first use)."""
+    global _backend, _backend_created
+    with _registry_lock:
+        if not _backend_created:
+            _backend = create_backend()
+            _backend_created = True
+        return _backend
+
+
+def get_cache(namespace: str) -> TTLCache:
+    """Get (or create) the shared cache for a namespace."""
+    backend = get_backend()
+    with _registry_lock:
+        cache = _caches.get(namespace)
+        if cache is None:
+            ttl, max_entries, max_bytes, grace = _NAMESPACE_LIMITS.get(
+                namespace, (None, 1024, 8 * 1024 * 1024, 0))
+            if backend is not None:
+                # The L2 holds the working set; each worker keeps its hot part
+                max_entries = min(max_entries, config.CACHE_L1_MAX_ENTRIES)
+            cache = TTLCache(namespace, ttl=ttl, max_entries=max_entries, max_bytes=max_bytes,
+                             grace=grace, jitter=config.CACHE_EXPIRY_JITTER, backend=backend)
+            _caches[namespace] = cache
+        return cache
+
+
+def all_caches() -> dict:
+    """All caches created so far, by namespace."""
+    with _registry_lock:
+        return dict(_caches)
+
+
+# --- stale-while-revalidate ---
+
+def refresh_in_background(flight, key, fn, *args):
+    """
+    Run ``fn(*args)`` through ``flight`` on the shared I/O pool, unless a call
+    for ``key`` is already in flight. Returns True if a refresh was scheduled.
+    """
+    if flight.in_flight(key):
+        return False
+
+    def run():
+        try:
+            # Refreshes yield upstream quota to user requests
+            with quota.priority(quota.PREFETCH):
+                flight.do(key, fn, *args)
+        except Exception:
+            get_metrics().incr("cache.refresh_failed")
+
+    # Refreshes outlive the request that triggered them: no deadline
+    io_pool.submit_background(run)
+    return True
+
+
+def _load_and_store(cache, key, loader, args, ttl, seen=_MISSING):
+    # Re-check inside the flight: a caller that missed just as the previous
+    # flight stored its value takes that value instead of loading again. A
+    # refresh of ``seen`` only stands down once the entry has been replaced.
+    current = cache.peek(key, _MISSING)
+    if current is not _MISSING and current is not seen:
+        return current
+    started = time.perf_counter()
+    value = loader(*args)
+    if value:
+        # A callable ttl derives the lifetime from the value (None = default)
+        entry_ttl = ttl(value) if callable(ttl) else ttl
+        cache.set(key, value, ttl=entry_ttl, delta=time.perf_counter() - started)
+    else:
+        cache.set_negative(key, value, config.CACHE_NEGATIVE_TTL)
+    return value
+
+
+def cached_call(cache, flight, key, loader, *args, ttl=None):
+    """
+    Serve ``key`` from ``cache``, loading it with ``loader(*args)`` on a miss.
+
+    Misses are coalesced through ``flight``. Stale entries (within the
+    namespace's grace window) and entries picked for early refresh are
+    returned immediately while a background refresh runs. Falsy loader
+    results (failures) are cached only briefly, for CACHE_NEGATIVE_TTL; a
+    loader cut short by the request deadline raises instead, and nothing is
+    cached.
+    ``ttl`` may be a number or a callable computing the lifetime from the
+    loaded value.
+    """
+    found = cache.lookup(key)
+    if found is not None:
+        value, state = found
+        if state != FRESH:
+            refresh_in_background(flight, key, _load_and_store, cache, key, loader, args, ttl,
+                                  value)
+        return value
+    return flight.do(key, _load_and_store, cache, key, loader, args, ttl)
@@ -0,0 +1,337 @@
+"""
+Shared second-level (L2) cache backends.
+
+Each worker process keeps a small in-process L1 (services.cache.TTLCache);
+with CACHE_BACKEND set, entries are also written to an L2 every worker
+reads, so a cell fetched by one worker is a hit for all of them and each
+worker only holds its hot set:
+
+- ``memory``: a dict in this process (one worker; mostly for tests)
+- ``sqlite``: a WAL-mode SQLite file shared by all workers on one host
+- ``redis``: any server speaking the Redis protocol (RESP), shared across hosts
+
+Backends store opaque bytes plus the entry's expiry and grace horizon;
+TTLCache does the (pickle) serialisation, so only point CACHE_BACKEND at a
+store the app alone writes to. They also keep atomic integer counters
+(``incr``), which the quota governor uses to share its daily count.
+"""
+
+import math
+import os
+import socket
+import sqlite3
+import struct
+import threading
+import time
+from urllib.parse import urlsplit
+
+from config import config
+from services.logging_service import get_logger
+
+# Record header for backends that store one blob per key: expires_at and
+# stale_until (NaN = never)
+_RECORD_HEAD = struct.Struct("<dd")
+
+
+def pack_record(payload, expires_at, stale_until):
+    return _RECORD_HEAD.pack(
+        math.nan if expires_at is None else expires_at,
+        math.nan if stale_until is None else stale_until,
+    ) + payload
+
+
+def unpack_record(record):
+    expires_at, stale_until = _RECORD_HEAD.unpack_from(record)
+    return (record[_RECORD_HEAD.size:],
+            None if math.isnan(expires_at) else expires_at,
+            None if math.isnan(stale_until) else stale_until)
+
+
+class CacheBackend:
+    """Interface of a shared L2 store. Keys are ``<namespace>:<key>`` strings."""
+
+    name = "base"
+
+    def get(self, key):
+        """Return (payload, expires_at, stale_until), or None if missing or past its grace."""
+        raise NotImplementedError
+
+    def set(self, key, payload, expires_at=None, stale_until=None):
+        """Store ``payload`` until ``stale_until`` (None = no expiry)."""
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def clear(self, prefix=""):
+        """Delete every key starting with ``prefix``."""
+        raise NotImplementedError
+
+    def incr(self, key, amount=1, expires_at=None):
+        """
+        Atomically add ``amount`` to the counter ``key`` and return its new
+        value. A new counter starts at zero and is dropped at ``expires_at``.
+        """
+        raise NotImplementedError
+
+
+class MemoryBackend(CacheBackend):
+    """In-process L2: a plain dict of packed records."""
+
+    name = "memory"
+
+    def __init__(self):
+        self._data = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        record = self._data.get(key)
+        if record is None:
+            return None
+        found = unpack_record(record)
+        if found[2] is not None and found[2] <= time.time():
+            self.delete(key)
+            return None
+        return found
+
+    def set(self, key, payload, expires_at=None, stale_until=None):
+        with self._lock:
+            self._data[key] = pack_record(payload, expires_at, stale_until)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self, prefix=""):
+        with self._lock:
+            for key in [k for k in self._data if k.startswith(prefix)]:
+                del self._data[key]
+            for key in [k for k in self._counters if k.startswith(prefix)]:
+                del self._counters[key]
+
+    def incr(self, key, amount=1, expires_at=None):
+        now = time.time()
+        with self._lock:
+            value, expires = self._counters.get(key, (0, expires_at))
+            if expires is not None and expires <= now:
+                value, expires = 0, expires_at
+            self._counters[key] = (value + amount, expires)
+            return value + amount
+
+
+class SQLiteBackend(CacheBackend):
+    """
+    L2 in a SQLite file in WAL mode, so local workers read concurrently
+    while one writes. One connection per thread; expired rows are purged
+    every few hundred writes.
+    """
+
+    name = "sqlite"
+    _PURGE_EVERY = 500
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_entries ("
+            " key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL, stale_until REAL)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_counters ("
+            " key TEXT PRIMARY KEY, value INTEGER NOT NULL, expires_at REAL)")
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=config.CACHE_L2_TIMEOUT,
+                                   isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._connection().execute(
+            "SELECT value, expires_at, stale_until FROM cache_entries WHERE key = ?",
+            (key,)).fetchone()
+        if row is None or (row[2] is not None and row[2] <= time.time()):
+            return None
+        return bytes(row[0]), row[1], row[2]
+
+    def set(self, key, payload, expires_at=None, stale_until=None):
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache_entries (key, value, expires_at, stale_until)"
+            " VALUES (?, ?, ?, ?)", (key, payload, expires_at, stale_until))
+        self._writes += 1
+        if self._writes % self._PURGE_EVERY == 0:
+            conn.execute("DELETE FROM cache_entries WHERE stale_until <= ?", (time.time(),))
+            conn.execute("DELETE FROM cache_counters WHERE expires_at <= ?", (time.time(),))
+
+    def delete(self, key):
+        self._connection().execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+
+    def clear(self, prefix=""):
+        conn = self._connection()
+        for table in ("cache_entries", "cache_counters"):
+            conn.execute(f"DELETE FROM {table} WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+
+    def incr(self, key, amount=1, expires_at=None):
+        # One statement, so concurrent workers never lose an increment; a
+        # counter past its expiry starts over
+        now = time.time()
+        row = self._connection().execute(
+            "INSERT INTO cache_counters (key, value, expires_at) VALUES (?, ?, ?)"
+            " ON CONFLICT (key) DO UPDATE SET"
+            "  value = CASE WHEN expires_at <= ? THEN excluded.value ELSE value + excluded.value END,"
+            "  expires_at = CASE WHEN expires_at <= ? THEN excluded.expires_at ELSE expires_at END"
+            " RETURNING value",
+            (key, amount, expires_at, now, now)).fetchone()
+        return row[0]
+
+
+class RedisError(Exception):
+    """Error reply from the server."""
+
+
+class RedisBackend(CacheBackend):
+    """
+    L2 on a Redis-protocol server (``redis://[:password@]host:port/db``),
+    spoken directly over RESP with one connection per thread. Keys expire
+    server-side at the end of their grace window.
+    """
+
+    name = "redis"
+    _SCAN_COUNT = 500
+
+    def __init__(self, url: str):
+        parts = urlsplit(url)
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port or 6379
+        self.password = parts.password
+        self.db = int(parts.path.lstrip("/") or 0)
+        self._local = threading.local()
+
+    # --- RESP ---
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=config.CACHE_L2_TIMEOUT)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._local.sock = sock
+        self._local.reader = sock.makefile("rb")
+        if self.password:
+            self._send("AUTH", self.password)
+        if self.db:
+            self._send("SELECT", self.db)
+
+    def _drop(self):
+        sock = getattr(self._local, "sock", None)
+        self._local.sock = self._local.reader = None
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+    def _send(self, *args):
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        self._local.sock.sendall(b"".join(parts))
+        return self._read_reply()
+
+    def _read_reply(self):
+        line = self._local.reader.readline()
+        if not line:
+            raise ConnectionError("connection closed")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            raise RedisError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length < 0:
+                return None
+            data = self._local.reader.read(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            length = int(rest)
+            return None if length < 0 else [self._read_reply() for _ in range(length)]
+        raise ConnectionError(f"bad reply {line[:20]!r}")
+
+    def _command(self, *args):
+        """Run one command, reconnecting once if the connection went away."""
+        for attempt in range(2):
+            if getattr(self._local, "sock", None) is None:
+                self._connect()
+            try:
+                return self._send(*args)
+            except (OSError, ConnectionError):
+                self._drop()
+                if attempt:
+                    raise
+
+    # --- backend ---
+
+    def get(self, key):
+        record = self._command("GET", key)
+        return unpack_record(record) if record is not None else None
+
+    def set(self, key, payload, expires_at=None, stale_until=None):
+        record = pack_record(payload, expires_at, stale_until)
+        if stale_until is None:
+            self._command("SET", key, record)
+            return
+        ttl_ms = int((stale_until - time.time()) * 1000)
+        if ttl_ms > 0:
+            self._command("SET", key, record, "PX", ttl_ms)
+
+    def delete(self, key):
+        self._command("DEL", key)
+
+    def clear(self, prefix=""):
+        cursor = "0"
+        while True:
+            cursor, keys = self._command("SCAN", cursor, "MATCH", prefix + "*",
+                                         "COUNT", self._SCAN_COUNT)
+            cursor = cursor.decode() if isinstance(cursor, bytes) else cursor
+            if keys:
+                self._command("DEL", *keys)
+            if cursor == "0":
+                return
+
+    def incr(self, key, amount=1, expires_at=None):
+        value = self._command("INCRBY", key, amount)
+        # The increment that created the counter sets its expiry
+        if value == amount and expires_at is not None:
+            self._command("PEXPIREAT", key, int(expires_at * 1000))
+        return value
+
+
+_BACKENDS = {
+    "memory": lambda: MemoryBackend(),
+    "sqlite": lambda: SQLiteBackend(config.CACHE_SQLITE_PATH),
+    "redis": lambda: RedisBackend(config.CACHE_REDIS_URL),
+}
+
+
+def create_backend(name=None):
+    """The configured L2 backend (CACHE_BACKEND), or None for L1 only."""
+    name = (config.CACHE_BACKEND if name is None else name).lower()
+    if not name:
+        return None
+    factory = _BACKENDS.get(name)
+    if factory is None:
+        get_logger().warning(f"Unknown CACHE_BACKEND {name!r}; using in-process caches only")
+        return None
+    return factory()
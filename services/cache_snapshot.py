@@ -0,0 +1,138 @@
+"""
+Cache snapshots across restarts.
+
+The solar, weather and geocoding caches are written to one file
+periodically and at interpreter exit, and read back when the app starts, so
+a deploy or worker recycle does not begin with a burst of upstream misses.
+Entries keep their original lifetimes; those already past their grace
+window are skipped on restore.
+
+The file is a short header followed by pickled chunks of entries, most
+recently used first and interleaved across namespaces. Restoring stops once
+CACHE_SNAPSHOT_RESTORE_BUDGET_MS is spent, so a large snapshot costs cold
+start a bounded delay and still brings back the hottest entries first.
+"""
+
+import atexit
+import os
+import pickle
+import threading
+import time
+from itertools import zip_longest
+
+from config import config
+from services.cache import get_cache
+from services.logging_service import log_event
+from services.metrics import get_metrics
+
+NAMESPACES = ("solar", "weather", "geo")
+
+_MAGIC = b"SHCS\x01"
+_CHUNK = 256
+
+_lock = threading.Lock()
+_started = False
+
+
+def _chunks(namespace):
+    # Failed loads cached briefly (falsy values) are not worth keeping
+    records = [r for r in get_cache(namespace).entries() if r[1]]
+    return [(namespace, records[i:i + _CHUNK]) for i in range(0, len(records), _CHUNK)]
+
+
+def snapshot(path=None):
+    """Write the caches to ``path`` (default CACHE_SNAPSHOT_PATH). Returns entries written."""
+    path = path or config.CACHE_SNAPSHOT_PATH
+    started = time.perf_counter()
+    per_namespace = [_chunks(namespace) for namespace in NAMESPACES]
+    written = 0
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(tmp, "wb") as f:
+            f.write(_MAGIC)
+            for round_ in zip_longest(*per_namespace):
+                for chunk in round_:
+                    if chunk is not None:
+                        pickle.dump(chunk, f, protocol=pickle.HIGHEST_PROTOCOL)
+                        written += len(chunk[1])
+        # Readers (other workers starting up) never see a half-written file
+        os.replace(tmp, path)
+    except Exception as e:
+        get_metrics().incr("cache.snapshot.failed")
+        log_event('snapshot_fail', str(e)[:50])
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        return 0
+
+    metrics = get_metrics()
+    metrics.observe("cache.snapshot.write_ms", (time.perf_counter() - started) * 1000)
+    metrics.gauge("cache.snapshot.entries", written)
+    return written
+
+
+def restore(path=None, budget_ms=None):
+    """
+    Load a snapshot from ``path`` into the caches, spending at most
+    ``budget_ms`` (default CACHE_SNAPSHOT_RESTORE_BUDGET_MS). Returns the
+    number of entries restored.
+    """
+    path = path or config.CACHE_SNAPSHOT_PATH
+    budget_ms = config.CACHE_SNAPSHOT_RESTORE_BUDGET_MS if budget_ms is None else budget_ms
+    if not os.path.exists(path):
+        return 0
+
+    metrics = get_metrics()
+    started = time.perf_counter()
+    stop_at = started + budget_ms / 1000.0
+    restored = skipped = 0
+    try:
+        with open(path, "rb") as f:
+            if f.read(len(_MAGIC)) != _MAGIC:
+                metrics.incr("cache.snapshot.incompatible")
+                return 0
+            while True:
+                if time.perf_counter() >= stop_at:
+                    metrics.incr("cache.snapshot.truncated")
+                    break
+                try:
+                    namespace, records = pickle.load(f)
+                except EOFError:
+                    break
+                cache = get_cache(namespace)
+                for key, value, expires_at, stale_until in records:
+                    if cache.restore(key, value, expires_at, stale_until):
+                        restored += 1
+                    else:
+                        skipped += 1
+    except Exception as e:
+        # A damaged snapshot only costs the rest of the warm start
+        metrics.incr("cache.snapshot.failed")
+        log_event('restore_fail', str(e)[:50])
+
+    metrics.observe("cache.snapshot.restore_ms", (time.perf_counter() - started) * 1000)
+    metrics.incr("cache.snapshot.restored", restored)
+    metrics.incr("cache.snapshot.skipped", skipped)
+    return restored
+
+
+def _run():
+    while True:
+        time.sleep(config.CACHE_SNAPSHOT_INTERVAL_SEC)
+        snapshot()
+
+
+def start():
+    """Snapshot periodically and at exit (once per process). Returns True if started."""
+    global _started
+    with _lock:
+        if _started:
+            return False
+        _started = True
+    atexit.register(snapshot)
+    threading.Thread(target=_run, name="cache-snapshot", daemon=True).start()
+    return True
@@ -0,0 +1,107 @@
+"""
+Per-host circuit breakers for upstream calls.
+
+After CIRCUIT_FAILURE_THRESHOLD consecutive failed attempts a host's circuit
+opens and calls fail fast, without touching the network, for
+CIRCUIT_RESET_SEC. Then a single probe is let through (half-open): success
+closes the circuit again, failure re-opens it.
+"""
+
+import threading
+import time
+
+from config import config
+from services.metrics import get_metrics
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Gauge values for the metrics snapshot
+_STATE_GAUGE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker for one upstream host."""
+
+    def __init__(self, name: str, failure_threshold: int = None, reset_timeout: float = None):
+        self.name = name
+        self.failure_threshold = failure_threshold or config.CIRCUIT_FAILURE_THRESHOLD
+        self.reset_timeout = reset_timeout or config.CIRCUIT_RESET_SEC
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    def allow(self) -> bool:
+        """Whether a call may go out now. In half-open, only one probe at a time."""
+        with self._lock:
+            state = self._current_state(time.monotonic())
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+        get_metrics().incr(f"upstream.{self.name}.short_circuited")
+        return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._probing = False
+            self._set_state(CLOSED)
+
+    def release_probe(self):
+        """
+        End a call that says nothing about the host (cut short by our own
+        deadline): frees the half-open probe slot, keeps the failure count.
+        """
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            now = time.monotonic()
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                self._opened_at = now
+                self._probing = False
+                self._set_state(OPEN)
+
+    # --- internals (caller holds the lock) ---
+
+    def _current_state(self, now):
+        if self._state == OPEN and now - self._opened_at >= self.reset_timeout:
+            self._set_state(HALF_OPEN)
+        return self._state
+
+    def _set_state(self, state):
+        if state != self._state:
+            self._state = state
+            get_metrics().gauge(f"upstream.{self.name}.circuit", _STATE_GAUGE[state])
+
+
+_breakers = {}
+_registry_lock = threading.Lock()
+
+
+def get_breaker(host: str) -> CircuitBreaker:
+    """Get (or create) the breaker for an upstream host."""
+    with _registry_lock:
+        breaker = _breakers.get(host)
+        if breaker is None:
+            breaker = CircuitBreaker(host)
+            _breakers[host] = breaker
+        return breaker
+
+
+def reset_all():
+    """Forget every breaker (all circuits closed)."""
+    with _registry_lock:
+        _breakers.clear()
@@ -0,0 +1,69 @@
+"""
+Request-wide deadlines.
+
+A route sets a time budget once; every upstream attempt, backoff sleep and
+wait on a shared fetch below it sees how much is left through a context
+variable, so a slow upstream cannot hold a worker past the budget. Work on
+the shared I/O pool runs without a deadline; the request bounds only its
+wait for the result.
+"""
+
+import contextvars
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+_deadline = contextvars.ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request's time budget ran out before the work finished."""
+
+
+@contextmanager
+def deadline(seconds):
+    """Run the block with a budget of ``seconds`` (kept if an outer one is tighter)."""
+    expires_at = time.monotonic() + seconds
+    outer = _deadline.get()
+    token = _deadline.set(expires_at if outer is None else min(outer, expires_at))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining():
+    """Seconds left in the current budget, or None without a deadline."""
+    expires_at = _deadline.get()
+    if expires_at is None:
+        return None
+    return max(0.0, expires_at - time.monotonic())
+
+
+def expires_at():
+    """Monotonic time the current budget runs out, or None without a deadline."""
+    return _deadline.get()
+
+
+def bounded(timeout):
+    """``timeout`` shrunk to the remaining budget (None means no limit)."""
+    left = remaining()
+    if left is None:
+        return timeout
+    return left if timeout is None else min(timeout, left)
+
+
+def with_deadline(seconds: float):
+    """
+    Decorator giving a route a request-wide budget.
+
+    Args:
+        seconds: Budget for everything the route calls upstream
+    """
+    def decorator(f):
+        @wraps(f)
+        def wrapped(*args, **kwargs):
+            with deadline(seconds):
+                return f(*args, **kwargs)
+        return wrapped
+    return decorator
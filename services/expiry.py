@@ -0,0 +1,58 @@
+"""
+Data-aware cache lifetimes.
+
+Cached data stays valid until something about it actually changes: the
+location's calendar day (solar facts, forecast day indexing) or the next
+forecast model update. Fixed TTLs are only used when these are unknown.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+from config import config
+
+
+def _utc_now(now=None):
+    return now if now is not None else datetime.now(timezone.utc)
+
+
+def seconds_until_local_midnight(utc_offset, now=None):
+    """Seconds until the next midnight at a location with ``utc_offset`` (seconds)."""
+    local = _utc_now(now) + timedelta(seconds=utc_offset)
+    midnight = datetime.combine(local.date() + timedelta(days=1), datetime.min.time(), local.tzinfo)
+    return (midnight - local).total_seconds()
+
+
+def seconds_until_model_update(now=None):
+    """
+    Seconds until the next forecast model update is expected upstream.
+
+    Model runs start every WEATHER_MODEL_UPDATE_HOURS (aligned to 00 UTC) and
+    become available WEATHER_MODEL_UPDATE_DELAY_MIN minutes later.
+    """
+    now = _utc_now(now)
+    interval = timedelta(hours=config.WEATHER_MODEL_UPDATE_HOURS)
+    delay = timedelta(minutes=config.WEATHER_MODEL_UPDATE_DELAY_MIN)
+    day_start = datetime.combine(now.date(), datetime.min.time(), now.tzinfo)
+
+    # Latest run that is already available, then step to the next one
+    boundary = day_start - interval + delay
+    while boundary <= now:
+        boundary += interval
+    return (boundary - now).total_seconds()
+
+
+def semantic_ttl(utc_offset=None, model_bound=False, now=None, minimum=60):
+    """
+    TTL (seconds) ending at the earliest semantic boundary: local midnight
+    when ``utc_offset`` is known, and the next model update if
+    ``model_bound``. Returns None when no boundary applies, so the caller's
+    fixed TTL is used instead.
+    """
+    candidates = []
+    if utc_offset is not None:
+        candidates.append(seconds_until_local_midnight(utc_offset, now))
+    if model_bound:
+        candidates.append(seconds_until_model_update(now))
+    if not candidates:
+        return None
+    return max(minimum, min(candidates))
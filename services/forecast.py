@@ -0,0 +1,297 @@
+"""
+Columnar daily forecasts and their vectorised analysis.
+
+A forecast is held as packed fixed-size day records, read as NumPy
+columns, rather than a list of per-day dicts, with each day's weather code
+classified once through a lookup table. The per-day dicts the narrative
+engine reads are built from it on demand. The narrative analysis
+(temperature trend, next good/bad day, streaks, weekend and week
+character) runs as array operations over a locations x days matrix, so
+many locations are analysed in a single call.
+"""
+
+from datetime import datetime
+
+import numpy as np
+
+# Weather code classes (bit flags)
+GOOD = 1
+BAD = 2
+SNOW = 4
+
+GOOD_CODES = (0, 1, 2)  # Clear, mainly clear, partly cloudy
+BAD_CODES = (51, 53, 55, 61, 63, 65, 80, 81, 82, 95, 96, 99)  # Rain/storms
+SNOW_CODES = (71, 73, 75, 77, 85, 86)
+
+# WMO codes run 0-99; anything else (or a missing code) has no class
+_CODE_CLASS = np.zeros(100, dtype=np.uint8)
+_CODE_CLASS[list(GOOD_CODES)] = GOOD
+_CODE_CLASS[list(BAD_CODES)] = BAD
+_CODE_CLASS[list(SNOW_CODES)] = SNOW
+
+WEEKDAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+
+_MISSING_CODE = -1
+
+# Keys of an analysis dict, in order
+ANALYSIS_FIELDS = (
+    "temp_trend", "temp_change", "next_good_day", "next_good_day_index",
+    "next_bad_day", "next_bad_day_index", "good_streak_length", "bad_streak_length",
+    "weekend_outlook", "week_character", "warming_days_ahead",
+)
+
+
+def classify(codes):
+    """Class flags for a weather code or an array of codes."""
+    codes = np.asarray(codes)
+    known = (codes >= 0) & (codes < len(_CODE_CLASS))
+    return np.where(known, _CODE_CLASS[np.where(known, codes, 0)], 0).astype(np.uint8)
+
+
+def _column(values, n, dtype, fill, missing):
+    """``values[:n]`` as an array of length ``n``; None becomes ``missing``, absent days ``fill``."""
+    values = values[:n]
+    column = np.full(n, fill, dtype=dtype)
+    column[:len(values)] = [missing if v is None else v for v in values]
+    return column
+
+
+def _scalar(value):
+    """Array value back to a Python value, with NaN as None."""
+    return None if value != value else value
+
+
+# One packed record per day; a cached forecast is a single bytes object
+_DAY = np.dtype([
+    ("date", "datetime64[D]"),
+    ("code", np.int16),
+    ("cls", np.uint8),
+    ("temp_max", np.float64),
+    ("temp_min", np.float64),
+    ("precip", np.float64),
+    ("precip_prob", np.float64),
+])
+
+
+def _field(name):
+    """Column view over one field of the packed days."""
+    return property(lambda self: self.days[name])
+
+
+class Forecast:
+    """Daily forecast for one location, packed as fixed-size records per day."""
+
+    __slots__ = ("_days",)
+
+    def __init__(self, dates, codes, classes, temp_max, temp_min, precip, precip_prob):
+        days = np.empty(len(codes), dtype=_DAY)
+        days["date"] = dates
+        days["code"] = codes
+        days["cls"] = classes
+        days["temp_max"] = temp_max
+        days["temp_min"] = temp_min
+        days["precip"] = precip
+        days["precip_prob"] = precip_prob
+        self._days = days.tobytes()
+
+    @property
+    def days(self):
+        """Read-only record array over the packed days."""
+        return np.frombuffer(self._days, dtype=_DAY)
+
+    dates = _field("date")
+    codes = _field("code")
+    classes = _field("cls")
+    temp_max = _field("temp_max")
+    temp_min = _field("temp_min")
+    precip = _field("precip")
+    precip_prob = _field("precip_prob")
+
+    @classmethod
+    def from_daily(cls, daily, days=7):
+        """Build from an Open-Meteo ``daily`` block, keeping at most ``days`` days."""
+        n = min(days, len(daily.get("weathercode", [])))
+        codes = _column(daily.get("weathercode", []), n, np.int16, 0, _MISSING_CODE)
+        return cls(
+            dates=_column(daily.get("time", []), n, "datetime64[D]", "NaT", "NaT"),
+            codes=codes,
+            classes=classify(codes),
+            temp_max=_column(daily.get("temperature_2m_max", []), n, np.float64, np.nan, np.nan),
+            temp_min=_column(daily.get("temperature_2m_min", []), n, np.float64, np.nan, np.nan),
+            precip=_column(daily.get("precipitation_sum", []), n, np.float64, 0.0, np.nan),
+            precip_prob=_column(daily.get("precipitation_probability_max", []), n,
+                                np.float64, 0.0, np.nan),
+        )
+
+    @classmethod
+    def from_rows(cls, rows, temps_max=None):
+        """Build from per-day dicts (``date``, ``code``, ``is_good``, ``is_bad``, ...)."""
+        n = len(rows)
+        if temps_max is None:
+            temps_max = [row.get("temp_max") for row in rows]
+        classes = np.array([(GOOD if row.get("is_good") else 0) | (BAD if row.get("is_bad") else 0)
+                            for row in rows], dtype=np.uint8)
+        return cls(
+            dates=np.array([row.get("date") or "NaT" for row in rows], dtype="datetime64[D]"),
+            codes=_column([row.get("code") for row in rows], n, np.int16, 0, _MISSING_CODE),
+            classes=classes,
+            temp_max=_column(list(temps_max), n, np.float64, np.nan, np.nan),
+            temp_min=_column([row.get("temp_min") for row in rows], n, np.float64, np.nan, np.nan),
+            precip=_column([row.get("precip") for row in rows], n, np.float64, 0.0, np.nan),
+            precip_prob=_column([row.get("precip_prob") for row in rows], n,
+                                np.float64, 0.0, np.nan),
+        )
+
+    def __len__(self):
+        return len(self._days) // _DAY.itemsize
+
+    @property
+    def weekdays(self):
+        """Weekday index per day (Monday = 0), -1 where the date is unknown."""
+        # 1970-01-01 was a Thursday
+        days = self.dates.astype(np.int64)
+        return np.where(np.isnat(self.dates), -1, (days + 3) % 7)
+
+    def day_name(self, index):
+        weekday = self.weekdays[index]
+        return WEEKDAYS[weekday] if weekday >= 0 else f"Day {index + 1}"
+
+    def rows(self):
+        """The per-day dict view used by the narrative engine."""
+        days = self.days
+        dates = days["date"].astype(object).tolist()
+        weekdays = self.weekdays.tolist()
+        codes = days["code"].tolist()
+        classes = days["cls"].tolist()
+        temp_max = days["temp_max"].tolist()
+        temp_min = days["temp_min"].tolist()
+        precip = days["precip"].tolist()
+        precip_prob = days["precip_prob"].tolist()
+
+        rows = []
+        for i in range(len(codes)):
+            day = dates[i]
+            weekday = weekdays[i]
+            rows.append({
+                "date": datetime(day.year, day.month, day.day) if day is not None else None,
+                "weekday": WEEKDAYS[weekday] if weekday >= 0 else f"Day {i+1}",
+                "weekday_short": WEEKDAYS[weekday][:3] if weekday >= 0 else f"D{i+1}",
+                "code": codes[i] if codes[i] != _MISSING_CODE else None,
+                "temp_max": _scalar(temp_max[i]),
+                "temp_min": _scalar(temp_min[i]),
+                "precip": _scalar(precip[i]),
+                "precip_prob": _scalar(precip_prob[i]),
+                "is_good": bool(classes[i] & GOOD),
+                "is_bad": bool(classes[i] & BAD),
+            })
+        return rows
+
+
+def _first_index(mask):
+    """Per row, the first column where ``mask`` is set, or -1."""
+    if mask.shape[1] == 0:
+        return np.full(mask.shape[0], -1)
+    return np.where(mask.any(axis=1), mask.argmax(axis=1), -1)
+
+
+def _half_mean(values, present, start, stop):
+    total = values[:, start:stop].sum(axis=1)
+    return total / np.maximum(1, present[:, start:stop].sum(axis=1))
+
+
+def analyze(forecast):
+    """Narrative patterns in one location's forecast."""
+    return analyze_many([forecast])[0]
+
+
+def analyze_many(forecasts):
+    """Narrative patterns for many locations' forecasts in one pass."""
+    forecasts = list(forecasts)
+    if not forecasts:
+        return []
+    count = len(forecasts)
+    width = max(len(f) for f in forecasts)
+    if not width:
+        return [{} for _ in forecasts]
+    lengths = np.array([len(f) for f in forecasts])
+
+    # Stack into locations x days matrices; days past a forecast's end have
+    # no class and no temperature
+    classes = np.zeros((count, width), dtype=np.uint8)
+    temps = np.full((count, width), np.nan)
+    weekdays = np.full((count, width), -1)
+    for row, forecast in enumerate(forecasts):
+        n = len(forecast)
+        classes[row, :n] = forecast.classes
+        temps[row, :n] = forecast.temp_max
+        weekdays[row, :n] = forecast.weekdays
+    good = (classes & GOOD) != 0
+    bad = (classes & BAD) != 0
+    valid = np.arange(width) < lengths[:, None]
+
+    # Temperature trend: second half of the week against the first. Zero
+    # and missing maxima are left out of the averages.
+    present = np.isfinite(temps) & (temps != 0)
+    values = np.where(present, temps, 0.0)
+    today_temp = values[:, :1]
+    warmer = (present[:, 1:5] & (values[:, 1:5] > today_temp + 1)).sum(axis=1)
+    diff = _half_mean(values, present, 3, 6) - _half_mean(values, present, 0, 3)
+    has_trend = lengths >= 3
+    trend = np.select(
+        [diff > 4, diff > 2, diff < -4, diff < -2, warmer >= 3],
+        ["warming_strong", "warming", "cooling_strong", "cooling", "warming"],
+        "stable")
+
+    # Next change of weather, counted from tomorrow
+    next_good = np.where(bad[:, 0], _first_index(good[:, 1:]), -1)
+    next_bad = np.where(good[:, 0], _first_index(bad[:, 1:]), -1)
+
+    # Run of days sharing today's good/not-good status
+    same = (good[:, 1:] == good[:, :1]) & valid[:, 1:]
+    streak = 1 + np.cumprod(same, axis=1).sum(axis=1)
+
+    # Weekend outlook from the coming Saturday and Sunday
+    first_weekday = weekdays[:, 0]
+    rows = np.arange(count)
+
+    def weekend_day(weekday):
+        offset = (weekday - first_weekday) % 7
+        inside = offset < lengths
+        return inside & good[rows, np.minimum(offset, width - 1)]
+
+    sat_good = weekend_day(5)
+    sun_good = weekend_day(6)
+    weekend = np.where(
+        first_weekday < 0, "mixed",
+        np.select([sat_good & sun_good, ~sat_good & ~sun_good], ["good", "bad"], "mixed"))
+
+    good_days = good.sum(axis=1)
+    bad_days = bad.sum(axis=1)
+    character = np.select(
+        [good_days >= 5, bad_days >= 5,
+         (good_days >= 3) & (bad_days <= 2), (bad_days >= 3) & (good_days <= 2)],
+        ["mostly_good", "mostly_bad", "good_stretch", "grey_stretch"],
+        "mixed")
+
+    results = []
+    for row, forecast in enumerate(forecasts):
+        if not lengths[row]:
+            results.append({})
+            continue
+        good_index = int(next_good[row]) + 1 if next_good[row] >= 0 else -1
+        bad_index = int(next_bad[row]) + 1 if next_bad[row] >= 0 else -1
+        today_good = bool(good[row, 0])
+        results.append({
+            "temp_trend": str(trend[row]) if has_trend[row] else "stable",
+            "temp_change": round(float(diff[row]), 1) if has_trend[row] else 0,
+            "next_good_day": forecast.day_name(good_index) if good_index >= 0 else None,
+            "next_good_day_index": good_index,
+            "next_bad_day": forecast.day_name(bad_index) if bad_index >= 0 else None,
+            "next_bad_day_index": bad_index,
+            "good_streak_length": int(streak[row]) if today_good else 0,
+            "bad_streak_length": 0 if today_good else int(streak[row]),
+            "weekend_outlook": str(weekend[row]),
+            "week_character": str(character[row]),
+            "warming_days_ahead": int(warmer[row]) if has_trend[row] else 0,
+        })
+    return results
@@ -0,0 +1,25 @@
+"""
+Shared, bounded thread pool for blocking upstream I/O.
+
+The weather fetch started alongside solar, background cache refreshes and
+shadow comparisons all run here, so the number of threads waiting on
+upstream services stays bounded per worker process. Work runs detached from
+the submitting request: it carries no deadline and completes (filling the
+caches) even when the request stops waiting for it.
+"""
+
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from config import config
+
+_pool = ThreadPoolExecutor(max_workers=config.IO_POOL_WORKERS, thread_name_prefix="io")
+
+
+def submit_background(fn, *args, **kwargs):
+    """
+    Run ``fn(*args, **kwargs)`` on the shared pool detached from the current
+    request's context. Returns a Future; bound the wait with
+    ``deadline.remaining()``.
+    """
+    return _pool.submit(contextvars.Context().run, fn, *args, **kwargs)
@@ -0,0 +1,98 @@
+"""
+Minimal in-process metrics for Seasonal Horizon.
+Counters, gauges and timings, kept in memory and exposed as a JSON snapshot.
+"""
+
+import threading
+from collections import defaultdict, deque
+
+# Recent samples kept per timing for percentile estimates
+_SAMPLE_WINDOW = 512
+
+
+class _Timing:
+    """Running count/sum/max plus a window of recent samples."""
+
+    __slots__ = ("count", "total", "max", "samples")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=_SAMPLE_WINDOW)
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self.samples.append(value)
+
+    def percentile(self, q):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        idx = min(len(ordered) - 1, int(q * len(ordered)))
+        return ordered[idx]
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "avg": round(self.total / self.count, 3) if self.count else 0,
+            "max": round(self.max, 3),
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+        }
+
+
+class Metrics:
+    """Thread-safe registry of named counters, gauges and timings."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(int)
+        self._gauges = {}
+        self._timings = defaultdict(_Timing)
+
+    def incr(self, name: str, value: int = 1):
+        with self._lock:
+            self._counters[name] += value
+
+    def gauge(self, name: str, value):
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, value: float):
+        """Record one sample for a timing or distribution."""
+        with self._lock:
+            self._timings[name].add(value)
+
+    def percentile(self, name: str, q: float, min_samples: int = 1):
+        """Percentile ``q`` (0-1) of recent samples, or None with fewer than ``min_samples``."""
+        with self._lock:
+            timing = self._timings.get(name)
+            if timing is None or len(timing.samples) < min_samples:
+                return None
+            return timing.percentile(q)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "timings": {k: t.summary() for k, t in self._timings.items()},
+            }
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._timings.clear()
+
+
+# Global instance
+_metrics = Metrics()
+
+
+def get_metrics() -> Metrics:
+    """Get the global metrics registry."""
+    return _metrics
@@ -0,0 +1,112 @@
+"""
+Midnight rollover pre-warming.
+
+Weather cache keys embed the server date, so at server midnight every entry
+becomes unreachable at once and the next requests would all go upstream
+together. A background job wakes PREWARM_LEAD_MIN minutes before midnight
+and fills tomorrow's entries for the locations requested most today.
+
+Solar windows are keyed by latitude band only and advanced in place, with
+stale windows served while an upstream refresh runs, so they need no warming.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+
+from config import config
+from services import quota, weather_service
+from services.metrics import get_metrics
+from services.solar_service import _nominal_utc_offset
+
+_lock = threading.Lock()
+# grid cell (lat, lon) -> (hits today, UTC offset seconds or None), oldest first
+_hot = OrderedDict()
+_started = False
+
+
+def record(lat, lon, utc_offset=None):
+    """Note a request for a location; the hottest ones are warmed tonight."""
+    # Counted per weather grid cell, the unit that is cached and fetched
+    key = weather_service.grid_cell(lat, lon)
+    with _lock:
+        hits, known_offset = _hot.pop(key, (0, None))
+        _hot[key] = (hits + 1, utc_offset if utc_offset is not None else known_offset)
+        while len(_hot) > config.PREWARM_TRACK_MAX:
+            _hot.popitem(last=False)
+
+
+def hot_locations(n=None):
+    """The ``n`` most requested locations today as (lat, lon, utc_offset)."""
+    with _lock:
+        items = sorted(_hot.items(), key=lambda kv: kv[1][0], reverse=True)
+    return [(lat, lon, offset) for (lat, lon), (_, offset) in items[:n or config.PREWARM_TOP_N]]
+
+
+def _local_date_at(moment, utc_offset, lon):
+    """Calendar date at a location at ``moment`` (an aware datetime)."""
+    if utc_offset is None:
+        utc_offset = _nominal_utc_offset(lon)
+    return (moment + timedelta(seconds=utc_offset)).date()
+
+
+def prewarm(day=None):
+    """
+    Fill the weather cache under server date ``day`` (default tomorrow) for
+    today's hot locations, then start counting afresh. Returns the number of
+    locations warmed.
+    """
+    day = day or date.today() + timedelta(days=1)
+    # Server midnight in UTC; the forecast starts at each location's date then
+    midnight = datetime.combine(day, datetime.min.time()).astimezone(timezone.utc)
+
+    metrics = get_metrics()
+    warmed = 0
+    for lat, lon, utc_offset in hot_locations():
+        start = _local_date_at(midnight, utc_offset, lon)
+        try:
+            if weather_service.fetch_daily_weather(lat, lon, days=7, day=day, start=start):
+                warmed += 1
+                continue
+        except Exception:
+            pass
+        metrics.incr("prewarm.failed")
+
+    with _lock:
+        _hot.clear()
+    metrics.incr("prewarm.warmed", warmed)
+    return warmed
+
+
+def seconds_until_prewarm(now=None):
+    """Seconds until tonight's pre-warm window opens (0 if already open)."""
+    now = now or datetime.now()
+    midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+    opens = midnight - timedelta(minutes=config.PREWARM_LEAD_MIN)
+    return max(0.0, (opens - now).total_seconds())
+
+
+def _run():
+    while True:
+        time.sleep(seconds_until_prewarm())
+        day = date.today() + timedelta(days=1)
+        try:
+            with quota.priority(quota.PREFETCH):
+                prewarm(day)
+        except Exception:
+            get_metrics().incr("prewarm.failed")
+        # Once per night: wait until the new day has started
+        wake = datetime.combine(day, datetime.min.time())
+        time.sleep(max(1.0, (wake - datetime.now()).total_seconds() + 1))
+
+
+def start():
+    """Start the nightly pre-warm job (once per process). Returns True if started."""
+    global _started
+    with _lock:
+        if _started:
+            return False
+        _started = True
+    threading.Thread(target=_run, name="cache-prewarm", daemon=True).start()
+    return True
@@ -0,0 +1,197 @@
+"""
+Outbound quota governor.
+
+Every upstream call spends from two budgets: a per-minute token bucket,
+refilled continuously, and a per-day count that resets at the provider's
+day boundary (UTC midnight), so no more than QUOTA_PER_DAY calls go out in
+any provider day. Calls carry a priority class through a context variable -
+interactive (user requests), prefetch (cache refreshes and pre-warming) or
+batch (shadow comparisons). Lower classes may only spend while a budget
+stays above their reserve, so background work backs off well before user
+traffic is ever denied.
+
+With a shared cache backend (CACHE_BACKEND=sqlite or redis) the daily count
+is kept there, so all workers spend from one daily budget; without one, or
+while it is unreachable, each worker counts on its own. The per-minute
+bucket is always per worker process; divide the per-minute limit by the
+number of workers when configuring it.
+"""
+
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from config import config
+from services.metrics import get_metrics
+
+INTERACTIVE = "interactive"
+PREFETCH = "prefetch"
+BATCH = "batch"
+
+_priority = contextvars.ContextVar("quota_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def priority(name):
+    """Run the block's upstream calls under priority class ``name``."""
+    token = _priority.set(name)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> str:
+    return _priority.get()
+
+
+class _Bucket:
+    """Token bucket holding up to ``capacity`` tokens, refilled over ``period`` seconds."""
+
+    __slots__ = ("capacity", "rate", "tokens", "updated")
+
+    def __init__(self, capacity, period):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+# Default for QuotaGovernor(backend=...): the shared cache backend, if any
+_SHARED = object()
+
+
+def _shared_backend():
+    # Imported here: the cache module spends quota on its refreshes
+    from services.cache import get_backend
+    return get_backend()
+
+
+class _DayWindow:
+    """
+    Calls counted against a daily limit in fixed windows, one per UTC day.
+    The count lives in ``backend`` when there is one and in this process
+    otherwise (or while the backend is unreachable).
+    """
+
+    __slots__ = ("capacity", "backend", "_day", "_used", "_lock")
+
+    def __init__(self, capacity, backend):
+        self.capacity = capacity
+        self.backend = backend
+        self._day = None
+        self._used = 0
+        self._lock = threading.Lock()
+
+    def add(self, amount, now):
+        """Add ``amount`` calls to the window holding ``now`` (epoch seconds); return its count."""
+        day = datetime.fromtimestamp(now, timezone.utc).date()
+        backend = _shared_backend() if self.backend is _SHARED else self.backend
+        if backend is not None:
+            ends = datetime.combine(day + timedelta(days=1), datetime.min.time(), timezone.utc)
+            try:
+                return backend.incr(f"quota:day:{day.isoformat()}", amount, ends.timestamp())
+            except Exception:
+                get_metrics().incr("quota.shared_error")
+        with self._lock:
+            if day != self._day:
+                self._day, self._used = day, 0
+            self._used += amount
+            return self._used
+
+
+class QuotaGovernor:
+    """A per-minute token bucket and a per-day window shared by all upstream calls."""
+
+    def __init__(self, per_minute: int = None, per_day: int = None, backend=_SHARED):
+        """
+        Args:
+            per_minute: Calls per minute (0 = unlimited)
+            per_day: Calls per UTC day (0 = unlimited)
+            backend: Where the daily count is kept (default: the shared
+                cache backend; None = this process)
+        """
+        per_minute = config.QUOTA_PER_MINUTE if per_minute is None else per_minute
+        per_day = config.QUOTA_PER_DAY if per_day is None else per_day
+        self._minute = _Bucket(per_minute, 60.0) if per_minute else None
+        self._day = _DayWindow(per_day, backend) if per_day else None
+        self._lock = threading.Lock()
+
+    def _reserve(self, priority_class):
+        if priority_class == BATCH:
+            return config.QUOTA_RESERVE_BATCH
+        if priority_class == PREFETCH:
+            return config.QUOTA_RESERVE_PREFETCH
+        return 0.0
+
+    def _refund_minute(self):
+        with self._lock:
+            self._minute.tokens = min(self._minute.capacity, self._minute.tokens + 1)
+
+    def acquire(self, priority_class=None) -> bool:
+        """Spend one call for ``priority_class`` (default: the current one)."""
+        priority_class = priority_class or current_priority()
+        reserve = self._reserve(priority_class)
+        remaining = {}
+        allowed = True
+        minute = self._minute
+        if minute is not None:
+            with self._lock:
+                minute.refill(time.monotonic())
+                allowed = minute.tokens - 1 >= minute.capacity * reserve
+                if allowed:
+                    minute.tokens -= 1
+                remaining["minute"] = int(minute.tokens)
+
+        day = self._day
+        if allowed and day is not None:
+            # Count first and take it back if over: with a shared count this
+            # stays atomic across workers
+            now = time.time()
+            used = day.add(1, now)
+            allowed = day.capacity - used >= day.capacity * reserve
+            if not allowed:
+                used = day.add(-1, now)
+                if minute is not None:
+                    self._refund_minute()
+            remaining["day"] = max(0, day.capacity - used)
+
+        metrics = get_metrics()
+        for name, left in remaining.items():
+            metrics.gauge(f"quota.remaining.{name}", left)
+        if not allowed:
+            metrics.incr(f"quota.denied.{priority_class}")
+        return allowed
+
+    def refund(self):
+        """Return a call spent that never went out."""
+        if self._minute is not None:
+            self._refund_minute()
+        if self._day is not None:
+            self._day.add(-1, time.time())
+
+    def remaining(self) -> dict:
+        """Calls left per budget."""
+        remaining = {}
+        if self._minute is not None:
+            with self._lock:
+                self._minute.refill(time.monotonic())
+                remaining["minute"] = int(self._minute.tokens)
+        if self._day is not None:
+            remaining["day"] = max(0, self._day.capacity - self._day.add(0, time.time()))
+        return remaining
+
+
+# Global instance
+_governor = QuotaGovernor()
+
+
+def get_governor() -> QuotaGovernor:
+    """Get the global quota governor."""
+    return _governor
@@ -0,0 +1,68 @@
+"""
+Single-flight request coalescing.
+
+Concurrent callers asking for the same key share one in-flight call: the
+first caller runs it, the others wait and receive its result - or its
+exception. Used in front of upstream fetches on cache misses so an expiring
+popular entry causes one upstream call instead of a thundering herd.
+"""
+
+import threading
+
+from services import deadline
+from services.metrics import get_metrics
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesces concurrent calls per key."""
+
+    def __init__(self, name: str = "default"):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        Run ``fn(*args, **kwargs)`` unless a call for ``key`` is already in
+        flight, in which case wait for it and share its outcome.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            get_metrics().incr(f"singleflight.{self.name}.shared")
+            # Waiters give up at their own deadline; the call keeps running
+            if not call.done.wait(deadline.remaining()):
+                get_metrics().incr("deadline.exceeded")
+                raise deadline.DeadlineExceeded(f"singleflight:{self.name}")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def in_flight(self, key) -> bool:
+        with self._lock:
+            return key in self._calls
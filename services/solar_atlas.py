@@ -0,0 +1,125 @@
+"""
+Precomputed global daylight atlas.
+
+Day length for every latitude band x day-of-year, plus the equation of time
+per day, stored in a compact binary file and memory-mapped at runtime. All
+WSGI workers share one page-cache copy, and lookups are O(1) with bilinear
+interpolation.
+
+Build it once per deployment:
+
+    python -m services.solar_atlas [output_path]
+"""
+
+import os
+import struct
+import sys
+
+import numpy as np
+
+from config import config
+from services.solar_service import (
+    _is_leap, _nominal_utc_offset, _solar_terms, _sun_times_from_day_length,
+    _sunrise_hour_angle)
+
+_MAGIC = b"SHDA"
+_VERSION = 1
+# magic, version, n_lat, n_doy, lat_min, lat_step
+_HEADER = struct.Struct("<4sHHHff")
+_HEADER_SIZE = 64
+
+# Table is built for a leap year; other years are mapped onto it fractionally
+_N_DOY = 366
+
+
+class DaylightAtlas:
+    """Read-only view over a memory-mapped daylight atlas file."""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            header = f.read(_HEADER.size)
+        magic, version, n_lat, n_doy, lat_min, lat_step = _HEADER.unpack(header)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(f"not a daylight atlas: {path}")
+
+        self.path = path
+        self.lat_min = float(lat_min)
+        self.lat_step = float(lat_step)
+        self.n_lat = n_lat
+        self.n_doy = n_doy
+        self.day_len = np.memmap(path, dtype="<f4", mode="r", offset=_HEADER_SIZE,
+                                 shape=(n_lat, n_doy))
+        self.eqtime = np.memmap(path, dtype="<f4", mode="r",
+                                offset=_HEADER_SIZE + n_lat * n_doy * 4, shape=(n_doy,))
+
+    def lookup(self, lat, lon, dates, utc_offset=None):
+        """
+        Day length and local sunrise/sunset for ``dates`` at a location.
+
+        Returns the same dict of arrays as ``solar_service.compute_daylight``.
+        """
+        if utc_offset is None:
+            utc_offset = _nominal_utc_offset(lon)
+
+        # Latitude position within the table
+        f_lat = (min(max(lat, -90.0), 90.0) - self.lat_min) / self.lat_step
+        i0 = min(int(np.floor(f_lat)), self.n_lat - 1)
+        i1 = min(i0 + 1, self.n_lat - 1)
+        w_lat = f_lat - i0
+
+        # Day-of-year position, scaled so every year spans the whole table
+        pos = np.array([
+            (d.timetuple().tm_yday - 1) * self.n_doy / (366.0 if _is_leap(d.year) else 365.0)
+            for d in dates
+        ])
+        j0 = np.floor(pos).astype(np.int64) % self.n_doy
+        j1 = (j0 + 1) % self.n_doy
+        w_doy = pos - np.floor(pos)
+
+        row0 = self.day_len[i0] * (1.0 - w_lat) + self.day_len[i1] * w_lat
+        day_len_sec = row0[j0] * (1.0 - w_doy) + row0[j1] * w_doy
+        eqtime = self.eqtime[j0] * (1.0 - w_doy) + self.eqtime[j1] * w_doy
+
+        day_len_sec = day_len_sec.astype(np.float64)
+        eqtime = eqtime.astype(np.float64)
+        sunrise_min, sunset_min = _sun_times_from_day_length(day_len_sec, eqtime, lon, utc_offset)
+        return {
+            "day_len_sec": day_len_sec,
+            "sunrise_min": sunrise_min,
+            "sunset_min": sunset_min,
+            "eqtime_min": eqtime,
+        }
+
+
+def build_atlas(path, lat_step=0.1):
+    """Compute the atlas and write it to ``path``. Returns the file size in bytes."""
+    n_lat = int(round(180.0 / lat_step)) + 1
+    lats = -90.0 + np.arange(n_lat) * lat_step
+    year_fraction = 2.0 * np.pi / _N_DOY * np.arange(_N_DOY)
+
+    eqtime, decl = _solar_terms(year_fraction)
+    day_len = _sunrise_hour_angle(lats[:, None], decl[None, :]) * 480.0
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        header = _HEADER.pack(_MAGIC, _VERSION, n_lat, _N_DOY, -90.0, lat_step)
+        f.write(header.ljust(_HEADER_SIZE, b"\0"))
+        f.write(day_len.astype("<f4").tobytes())
+        f.write(eqtime.astype("<f4").tobytes())
+    # Atomic swap so running workers never map a half-written file
+    os.replace(tmp_path, path)
+    return os.path.getsize(path)
+
+
+def load_atlas(path):
+    """Memory-map the atlas at ``path``; returns None if it has not been built."""
+    if not path or not os.path.exists(path):
+        return None
+    return DaylightAtlas(path)
+
+
+if __name__ == "__main__":
+    out = sys.argv[1] if len(sys.argv) > 1 else config.SOLAR_ATLAS_PATH
+    size = build_atlas(out)
+    print(f"wrote {out} ({size / 1024:.0f} KiB)")
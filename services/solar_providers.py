@@ -0,0 +1,214 @@
+"""
+Solar data providers.
+
+Every provider answers the same question - day lengths for a list of dates
+at a latitude, plus the equation of time on the last date - so solar_service
+can switch between them by configuration:
+
+ - atlas:            precomputed, memory-mapped daylight atlas
+ - local-vectorized: NumPy solar position engine
+ - local-astral:     astral (or suntime) per-date computation
+ - upstream:         Open-Meteo forecast API
+
+A shadow provider can run on a sample of requests to record divergence and
+latency against the primary, without affecting the response.
+"""
+
+import math
+import random
+import time
+from datetime import datetime, timedelta
+
+from config import config
+from services import io_pool, quota, solar_service
+from services.logging_service import log_event
+from services.metrics import get_metrics
+
+
+class SolarProvider:
+    """Base provider interface."""
+
+    name = ""
+    # Local providers work on the latitude band; upstream uses the real point
+    local = True
+
+    def available(self) -> bool:
+        return True
+
+    def day_lengths(self, lat, lon, dates):
+        """
+        Return (day lengths in seconds aligned with ``dates``, equation of
+        time in minutes for the last date or None), or None on failure.
+        """
+        raise NotImplementedError
+
+
+class AtlasProvider(SolarProvider):
+    name = "atlas"
+
+    def available(self):
+        return solar_service._get_atlas() is not None
+
+    def day_lengths(self, lat, lon, dates):
+        sun = solar_service._get_atlas().lookup(lat, 0.0, dates, 0)
+        return [float(v) for v in sun["day_len_sec"]], float(sun["eqtime_min"][-1])
+
+
+class VectorizedProvider(SolarProvider):
+    name = "local-vectorized"
+
+    def day_lengths(self, lat, lon, dates):
+        sun = solar_service.compute_daylight(lat, 0.0, dates, 0)
+        return [float(v) for v in sun["day_len_sec"]], float(sun["eqtime_min"][-1])
+
+
+class AstralProvider(SolarProvider):
+    name = "local-astral"
+
+    def day_lengths(self, lat, lon, dates):
+        durations = []
+        eqtime = None
+        for d in dates:
+            try:
+                times = solar_service.get_sun_times(lat, 0.0, d)
+            except Exception:
+                # No sunrise or sunset: polar day or polar night
+                durations.append(86400.0 if _sun_up_at_noon(lat, d) else 0.0)
+                eqtime = None
+                continue
+            durations.append(float(times["day_length_seconds"]))
+            sunrise = datetime.fromisoformat(times["sunrise"])
+            sunset = datetime.fromisoformat(times["sunset"])
+            noon = sunrise + (sunset - sunrise) / 2
+            noon_min = (noon - datetime.combine(d, datetime.min.time(), noon.tzinfo)).total_seconds() / 60
+            eqtime = 720.0 - noon_min
+        return durations, eqtime
+
+
+def _sun_up_at_noon(lat, day):
+    """Whether the sun is above the horizon at noon, for polar edge cases."""
+    # Approximate declination; its sign decides which pole has polar day
+    decl = -23.44 * math.cos(2 * math.pi / 365 * (day.timetuple().tm_yday + 10))
+    return lat * decl > 0
+
+
+class UpstreamProvider(SolarProvider):
+    name = "upstream"
+    local = False
+
+    def day_lengths(self, lat, lon, dates):
+        if config.SOLAR_UPSTREAM_MODE == 'window':
+            return self._window(lat, lon, dates)
+
+        # Contiguous runs of dates become one small start/end range each.
+        # The latest run goes first: it carries today's sun times and is the
+        # one worth failing fast on.
+        values = {}
+        eqtime = None
+        for i, (start, end) in enumerate(reversed(_date_runs(dates))):
+            fetched = solar_service._upstream_days(lat, lon, start, end, with_sun_times=(i == 0))
+            if not fetched:
+                return None
+            durations, run_eqtime = fetched
+            if i == 0:
+                eqtime = run_eqtime
+            # Align from the end of the range, which is what the caller needs most
+            for back, value in enumerate(reversed(durations)):
+                values[end - timedelta(days=back)] = value
+        # Dates upstream did not return degrade to the latest value (zero delta)
+        latest = values.get(max(dates))
+        if latest is None:
+            return None
+        return [values.get(d, latest) for d in dates], eqtime
+
+    def _window(self, lat, lon, dates):
+        """Legacy mode: one past_days request covering every date (max 92 days)."""
+        series = solar_service._upstream_window_series(lat, lon, min(dates), max(dates))
+        if not series:
+            return None
+        durations, eqtime = series
+        last = max(dates)
+        picked = []
+        for d in dates:
+            idx = len(durations) - 1 - (last - d).days
+            # Dates beyond the 92-day limit fall back to the oldest value
+            picked.append(durations[max(idx, 0)])
+        return picked, eqtime
+
+
+def _date_runs(dates):
+    """Split sorted dates into (start, end) runs of consecutive days."""
+    runs = []
+    for d in sorted(set(dates)):
+        if runs and d == runs[-1][1] + timedelta(days=1):
+            runs[-1][1] = d
+        else:
+            runs.append([d, d])
+    return [tuple(r) for r in runs]
+
+
+PROVIDERS = {
+    p.name: p for p in (AtlasProvider(), VectorizedProvider(), AstralProvider(), UpstreamProvider())
+}
+
+# Fallback order after the configured provider. local-astral is only used
+# when selected explicitly.
+_FALLBACK_ORDER = ("atlas", "local-vectorized", "upstream")
+
+
+def provider_chain():
+    """Available providers to try, configured one first."""
+    names = [config.SOLAR_PROVIDER] + [n for n in _FALLBACK_ORDER if n != config.SOLAR_PROVIDER]
+    return [PROVIDERS[n] for n in names if n in PROVIDERS and PROVIDERS[n].available()]
+
+
+def _call(provider, band_lat, lat, lon, dates):
+    """Run one provider, recording latency and errors."""
+    metrics = get_metrics()
+    started = time.perf_counter()
+    try:
+        if provider.local:
+            result = provider.day_lengths(band_lat, lon, dates)
+        else:
+            result = provider.day_lengths(lat, lon, dates)
+    except Exception:
+        result = None
+    metrics.observe(f"solar.provider.{provider.name}.latency_ms",
+                    (time.perf_counter() - started) * 1000)
+    if not result:
+        metrics.incr(f"solar.provider.{provider.name}.errors")
+    return result
+
+
+def fetch_day_lengths(band_lat, lat, lon, dates):
+    """
+    Day lengths for ``dates`` from the first provider in the chain that
+    answers. Returns (durations, eqtime) or None.
+    """
+    for provider in provider_chain():
+        result = _call(provider, band_lat, lat, lon, dates)
+        if result:
+            _maybe_shadow(provider, result, band_lat, lat, lon, dates)
+            return result
+    return None
+
+
+def _maybe_shadow(primary, primary_result, band_lat, lat, lon, dates):
+    """Run the shadow provider on a sample of requests, off the request path."""
+    shadow = PROVIDERS.get(config.SOLAR_SHADOW_PROVIDER)
+    if shadow is None or shadow is primary or not shadow.available():
+        return
+    if random.random() >= config.SOLAR_SHADOW_SAMPLE_RATE:
+        return
+
+    def run():
+        with quota.priority(quota.BATCH):
+            result = _call(shadow, band_lat, lat, lon, dates)
+        if not result:
+            return
+        divergence = max(abs(a - b) for a, b in zip(primary_result[0], result[0]))
+        get_metrics().observe(f"solar.shadow.{shadow.name}.divergence_sec", divergence)
+        if divergence > config.SOLAR_SHADOW_ALERT_SEC:
+            log_event('shadow', f'{primary.name}/{shadow.name}:{divergence:.0f}s@{band_lat}')
+
+    io_pool.submit_background(run)
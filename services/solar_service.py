@@ -1,45 +1,22 @@
-import requests
-from datetime import date, timedelta, datetime
+import math
+import struct
+from datetime import date, timedelta, datetime, timezone
 import pytz
-import time
+from functools import lru_cache
 
 from config import config
+from services import batcher, deadline
+from services.cache import get_cache, refresh_in_background
+from services.singleflight import SingleFlight
 
-# Simple in-memory cache
-_cache = {}
+# NumPy powers the local daylight engine (and the forecast columns); it is
+# a hard requirement
+import numpy as np
 
-
-def _get_cached(key):
-    if key in _cache:
-        data, timestamp = _cache[key]
-        if time.time() - timestamp < config.CACHE_TTL_SOLAR:
-            return data
-        del _cache[key]
-    return None
-
-
-def _set_cached(key, data):
-    _cache[key] = (data, time.time())
-
-
-def _request_with_retry(url, params, max_retries=None, timeout=None):
-    """Make HTTP request with retry logic."""
-    max_retries = max_retries or config.API_MAX_RETRIES
-    timeout = timeout or config.API_TIMEOUT
-    last_error = None
-    
-    for attempt in range(max_retries):
-        try:
-            resp = requests.get(url, params=params, timeout=timeout)
-            resp.raise_for_status()
-            return resp.json()
-        except requests.exceptions.Timeout:
-            last_error = "timeout"
-            time.sleep(0.5 * (attempt + 1))
-        except requests.exceptions.RequestException as e:
-            last_error = str(e)
-            time.sleep(0.3 * (attempt + 1))
-    return None
+# Rolling daylight windows, keyed by latitude band. Day lengths never go
+# stale, so entries are advanced at rollover rather than expired.
+_cache = get_cache('solar')
+_flight = SingleFlight('solar')
 
 
 # try astral v3 style imports first, fallback to suntime
@@ -51,9 +28,7 @@ except Exception:
 	_ASTRAL = False
 
 if _ASTRAL:
-	def get_sun_times(lat, lon, target_date=None):
-		if target_date is None:
-			target_date = date.today()
+	def _compute_sun_times(lat, lon, target_date):
 		observer = Observer(latitude=lat, longitude=lon, elevation=0)
 		s = astral_sun(observer=observer, date=target_date, tzinfo=pytz.UTC)
 		return {
@@ -64,9 +39,7 @@ if _ASTRAL:
 else:
 	from suntime import Sun
 
-	def get_sun_times(lat, lon, target_date=None):
-		if target_date is None:
-			target_date = date.today()
+	def _compute_sun_times(lat, lon, target_date):
 		s = Sun(lat, lon)
 		sunrise_local = s.get_local_sunrise_time(target_date)
 		sunset_local = s.get_local_sunset_time(target_date)
@@ -79,81 +52,561 @@ else:
 		}
 
 
-def _get_winter_solstice_date():
+# Memoised sun times, keyed by coordinates quantized to ~1 km
+_SUN_TIMES_DECIMALS = 2
+
+
+@lru_cache(maxsize=config.SUN_TIMES_MEMO_SIZE)
+def _sun_times_memo(lat, lon, target_date):
+	return _compute_sun_times(lat, lon, target_date)
+
+
+def get_sun_times(lat, lon, target_date=None):
+	"""Sunrise, sunset (UTC ISO strings) and day length, memoised per quantized location."""
+	if target_date is None:
+		target_date = date.today()
+	times = _sun_times_memo(round(lat, _SUN_TIMES_DECIMALS), round(lon, _SUN_TIMES_DECIMALS), target_date)
+	return dict(times)
+
+
+@lru_cache(maxsize=config.SUN_TIMES_MEMO_SIZE)
+def _solstice_day_length(lat, year):
+	"""Day length on Dec 21 of ``year``; fixed for the whole year, so cached per latitude."""
+	return _compute_sun_times(lat, 0.0, date(year, 12, 21))["day_length_seconds"]
+
+
+def _get_winter_solstice_date(today=None):
     """Return the most recent winter solstice."""
-    today = date.today()
+    if today is None:
+        today = date.today()
     solstice = date(today.year, 12, 21)
     if today < solstice:
         solstice = date(today.year - 1, 12, 21)
     return solstice
 
 
-def get_daylight_delta(lat, lon):
+# Solar altitude of sunrise/sunset: refraction plus the sun's apparent radius
+_SUNRISE_ZENITH_DEG = 90.833
+
+# Precomputed daylight atlas, memory-mapped on first use (see solar_atlas)
+_atlas = None
+_atlas_checked = False
+
+
+def _get_atlas():
+    """Return the loaded daylight atlas, or None if it is not available."""
+    global _atlas, _atlas_checked
+    if not _atlas_checked:
+        _atlas_checked = True
+        try:
+            from services.solar_atlas import load_atlas
+            _atlas = load_atlas(config.SOLAR_ATLAS_PATH)
+        except Exception:
+            _atlas = None
+    return _atlas
+
+
+def _nominal_utc_offset(lon):
+    """Whole-hour UTC offset implied by longitude, used when no timezone is known."""
+    return int(round(lon / 15.0)) * 3600
+
+
+def _local_today(utc_offset):
+    """Calendar date at a location given its UTC offset in seconds."""
+    now = datetime.now(timezone.utc) + timedelta(seconds=utc_offset)
+    return now.date()
+
+
+def _is_leap(year):
+    return year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)
+
+
+def _solar_terms(year_fraction):
     """
-    Fetches solar dynamics: day length, change from yesterday, week, and solstice.
+    Equation of time (minutes) and solar declination (radians) for the
+    fractional year angle, per the NOAA approximation.
     """
-    cache_key = f"solar_{lat:.2f}_{lon:.2f}_{date.today()}"
-    cached = _get_cached(cache_key)
-    if cached:
-        return cached
+    g = year_fraction
+    eqtime = 229.18 * (0.000075 + 0.001868 * np.cos(g) - 0.032077 * np.sin(g)
+                       - 0.014615 * np.cos(2 * g) - 0.040849 * np.sin(2 * g))
+    decl = (0.006918 - 0.399912 * np.cos(g) + 0.070257 * np.sin(g)
+            - 0.006758 * np.cos(2 * g) + 0.000907 * np.sin(2 * g)
+            - 0.002697 * np.cos(3 * g) + 0.00148 * np.sin(3 * g))
+    return eqtime, decl
 
-    try:
-        solstice = _get_winter_solstice_date()
-        today = date.today()
-        days_since_solstice = (today - solstice).days
-        past_days = min(days_since_solstice, 92)
-        
-        url = "https://api.open-meteo.com/v1/forecast"
-        params = {
-            "latitude": lat,
-            "longitude": lon,
-            "daily": ["sunrise", "sunset", "daylight_duration"],
-            "timezone": "auto",
-            "past_days": past_days,
-            "forecast_days": 1
-        }
-        
-        data = _request_with_retry(url, params)
-        if not data:
-            return {}
 
-        daily = data.get("daily", {})
-        durations = daily.get("daylight_duration", [])
-        sunrises = daily.get("sunrise", [])
-        sunsets = daily.get("sunset", [])
+def _sunrise_hour_angle(lat, decl):
+    """Sunrise hour angle in degrees; 0 in polar night, 180 in polar day."""
+    lat_rad = np.radians(lat)
+    cos_ha = (np.cos(np.radians(_SUNRISE_ZENITH_DEG)) / (np.cos(lat_rad) * np.cos(decl))
+              - np.tan(lat_rad) * np.tan(decl))
+    return np.degrees(np.arccos(np.clip(cos_ha, -1.0, 1.0)))
+
+
+def _year_fraction(dates):
+    """Fractional year angle (radians) at noon for each date."""
+    doy = np.array([d.timetuple().tm_yday for d in dates], dtype=np.float64)
+    year_len = np.array([366.0 if _is_leap(d.year) else 365.0 for d in dates])
+    return 2.0 * np.pi / year_len * (doy - 1.0)
 
-        if not durations:
-            return {}
 
-        idx_today = len(durations) - 1
-        today_sec = durations[idx_today]
-        
-        yesterday_sec = durations[idx_today - 1] if idx_today > 0 else today_sec
-        delta_daily = today_sec - yesterday_sec
-        
-        idx_week = idx_today - 7
-        last_week_sec = durations[idx_week] if idx_week >= 0 else today_sec
-        delta_weekly = today_sec - last_week_sec
-        
-        solstice_sec = durations[0] if len(durations) > 7 else today_sec
-        delta_solstice = today_sec - solstice_sec
-
-        sunrise_str = sunrises[idx_today] if idx_today < len(sunrises) else ""
-        sunset_str = sunsets[idx_today] if idx_today < len(sunsets) else ""
-
-        fmt = "%Y-%m-%dT%H:%M"
-        result = {
-            "day_len_sec": today_sec,
-            "delta_daily_sec": delta_daily,
-            "delta_weekly_sec": delta_weekly,
-            "delta_solstice_sec": delta_solstice,
-            "sunrise": datetime.strptime(sunrise_str, fmt) if sunrise_str else None,
-            "sunset": datetime.strptime(sunset_str, fmt) if sunset_str else None
+def _sun_times_from_day_length(day_len_sec, eqtime, lon, utc_offset):
+    """Local sunrise/sunset minutes from day length and equation of time."""
+    noon_min = 720.0 - 4.0 * lon - eqtime + utc_offset / 60.0
+    half_day_min = day_len_sec / 120.0
+    polar = (day_len_sec <= 0) | (day_len_sec >= 86400)
+    sunrise_min = np.where(polar, np.nan, noon_min - half_day_min)
+    sunset_min = np.where(polar, np.nan, noon_min + half_day_min)
+    return sunrise_min, sunset_min
+
+
+def compute_daylight(lat, lon, dates, utc_offset=None):
+    """
+    Vectorized sunrise, sunset and day length for a sequence of dates.
+
+    Uses the NOAA solar position approximation, evaluated for all dates in a
+    single NumPy pass. Returns a dict of arrays aligned with ``dates``:
+     - day_len_sec: day length in seconds (0 in polar night, 86400 in polar day)
+     - sunrise_min / sunset_min: minutes after local midnight (NaN when the
+       sun does not rise or set)
+     - eqtime_min: equation of time in minutes
+    """
+    if utc_offset is None:
+        utc_offset = _nominal_utc_offset(lon)
+
+    eqtime, decl = _solar_terms(_year_fraction(dates))
+    day_len_sec = _sunrise_hour_angle(lat, decl) * 480.0
+    sunrise_min, sunset_min = _sun_times_from_day_length(day_len_sec, eqtime, lon, utc_offset)
+
+    return {
+        "day_len_sec": day_len_sec,
+        "sunrise_min": sunrise_min,
+        "sunset_min": sunset_min,
+        "eqtime_min": eqtime,
+    }
+
+
+# Day length depends only on latitude and date, so solar data is cached per
+# latitude band; longitude and UTC offset only shift sunrise/sunset
+_LAT_BAND_DECIMALS = 2
+
+
+# Days kept in a rolling window: today plus the seven before it
+_WINDOW_DAYS = 8
+
+# Windows are cached per local end date, since locations sharing a band can
+# be on different dates; one outlives its day in every timezone and the
+# next day's rollover, which advances it
+_WINDOW_TTL = 3 * 86400
+
+
+# Packed window header: end date and solstice ordinals, solstice day length
+# and equation of time (NaN when unknown); the day lengths follow
+_WINDOW_HEAD = struct.Struct("<iidd")
+
+
+class _DaylightWindow:
+    """
+    Rolling day-length series for one latitude band: the last eight days up
+    to ``end_date`` plus the most recent winter solstice. Instances are
+    immutable; advancing returns a new window, so concurrent readers never
+    see a half-updated series. The fields live in one packed record, which
+    keeps the thousands of cached bands small.
+    """
+
+    __slots__ = ("_packed",)
+
+    def __init__(self, end_date, days, solstice, solstice_sec, eqtime_min):
+        days = tuple(days[-_WINDOW_DAYS:])
+        self._packed = _WINDOW_HEAD.pack(
+            end_date.toordinal(), solstice.toordinal(), solstice_sec,
+            math.nan if eqtime_min is None else eqtime_min,
+        ) + struct.pack(f"<{len(days)}d", *days)
+
+    @property
+    def end_date(self):
+        return date.fromordinal(_WINDOW_HEAD.unpack_from(self._packed)[0])
+
+    @property
+    def solstice(self):
+        return date.fromordinal(_WINDOW_HEAD.unpack_from(self._packed)[1])
+
+    @property
+    def solstice_sec(self):
+        return _WINDOW_HEAD.unpack_from(self._packed)[2]
+
+    @property
+    def eqtime_min(self):
+        eqtime = _WINDOW_HEAD.unpack_from(self._packed)[3]
+        return None if math.isnan(eqtime) else eqtime
+
+    @property
+    def days(self):
+        count = (len(self._packed) - _WINDOW_HEAD.size) // 8
+        return struct.unpack_from(f"<{count}d", self._packed, _WINDOW_HEAD.size)
+
+    def advanced(self, new_days, eqtime_min, today):
+        """Window shifted forward by ``new_days`` (ending ``today``)."""
+        days = self.days + tuple(new_days)
+        solstice, solstice_sec = self.solstice, self.solstice_sec
+        current_solstice = _get_winter_solstice_date(today)
+        if current_solstice != solstice:
+            # A solstice we just stepped over is inside the new days
+            back = (today - current_solstice).days
+            solstice = current_solstice
+            solstice_sec = days[-1 - back] if back < len(days) else days[-1]
+        return _DaylightWindow(today, days, solstice, solstice_sec, eqtime_min)
+
+    def band(self):
+        """Band view consumed by _assemble_daylight."""
+        days = self.days
+        today_sec = days[-1]
+        yesterday_sec = days[-2] if len(days) > 1 else today_sec
+        last_week_sec = days[-8] if len(days) >= 8 else today_sec
+        return {
+            "day_len_sec": (self.solstice_sec, last_week_sec, yesterday_sec, today_sec),
+            "eqtime_min": self.eqtime_min
         }
-        
-        _set_cached(cache_key, result)
-        return result
-        
+
+
+def _parse_minutes(timestamp):
+    """Minutes after local midnight from an Open-Meteo ``YYYY-MM-DDTHH:MM`` string."""
+    if not timestamp:
+        return None
+    t = datetime.strptime(timestamp, "%Y-%m-%dT%H:%M")
+    return t.hour * 60 + t.minute
+
+
+def _solar_noon_eqtime(sunrise_str, sunset_str, lon, utc_offset):
+    """
+    Normalise a location's local sunrise/sunset to an equation-of-time value,
+    so an upstream band can serve sunrise/sunset for any longitude.
+    """
+    sunrise_min = _parse_minutes(sunrise_str)
+    sunset_min = _parse_minutes(sunset_str)
+    if sunrise_min is None or sunset_min is None:
+        return None
+    offset = utc_offset if utc_offset is not None else _nominal_utc_offset(lon)
+    noon_min = (sunrise_min + sunset_min) / 2.0
+    return 720.0 - 4.0 * lon + offset / 60.0 - noon_min
+
+
+def _upstream_days(lat, lon, start, end, with_sun_times=True):
+    """
+    Fetch day lengths from ``start`` to ``end`` from Open-Meteo as one small
+    date range. Returns (durations, eqtime of the last day) or None.
+    """
+    params = {
+        "latitude": lat,
+        "longitude": lon,
+        "daily": ["sunrise", "sunset", "daylight_duration"] if with_sun_times else ["daylight_duration"],
+        "timezone": "auto",
+        "start_date": start.isoformat(),
+        "end_date": end.isoformat()
+    }
+    
+    data = batcher.forecast.fetch(params)
+    if not data:
+        return None
+
+    daily = data.get("daily", {})
+    durations = daily.get("daylight_duration") or []
+    if not durations or any(v is None for v in durations):
+        return None
+
+    # Only the last day's sun times are needed
+    sunrises = daily.get("sunrise") or []
+    sunsets = daily.get("sunset") or []
+    eqtime = _solar_noon_eqtime(
+        sunrises[-1] if sunrises else "", sunsets[-1] if sunsets else "",
+        lon, data.get("utc_offset_seconds"))
+    return list(durations), eqtime
+
+
+# Merged forecast requests: the weather call also asks for these daily
+# variables and the past week, so one response serves both caches
+DAYLIGHT_VARIABLES = ["sunrise", "sunset", "daylight_duration"]
+DAYLIGHT_PAST_DAYS = _WINDOW_DAYS - 1
+
+
+def upstream_primary():
+    """Whether solar data currently comes from upstream rather than a local provider."""
+    from services.solar_providers import provider_chain
+    chain = provider_chain()
+    return bool(chain) and not chain[0].local
+
+
+def daylight_from_forecast(data, lat, lon, past_days):
+    """
+    Day lengths carried by a merged forecast response requested for
+    ``lat``: the ``past_days`` before the location's today, and today itself
+    with its equation of time. Returns the ``daylight`` argument for
+    get_daylight_delta, or None.
+    """
+    daily = data.get("daily", {})
+    times = daily.get("time") or []
+    durations = daily.get("daylight_duration") or []
+    if len(times) <= past_days or len(durations) <= past_days:
+        return None
+    rows = durations[:past_days + 1]
+    if any(v is None for v in rows):
+        return None
+
+    sunrises = daily.get("sunrise") or []
+    sunsets = daily.get("sunset") or []
+    eqtime = _solar_noon_eqtime(
+        sunrises[past_days] if len(sunrises) > past_days else "",
+        sunsets[past_days] if len(sunsets) > past_days else "",
+        lon, data.get("utc_offset_seconds"))
+    return {
+        "lat": lat,
+        "dates": tuple(date.fromisoformat(t) for t in times[:past_days + 1]),
+        "durations": tuple(float(v) for v in rows),
+        "eqtime": eqtime,
+    }
+
+
+def _upstream_window_series(lat, lon, start, end):
+    """
+    Legacy fetch: one past_days request ending at ``end`` and reaching back
+    to ``start`` (max 92 past days). Returns (durations, eqtime) or None.
+    """
+    past_days = min((end - start).days, 92)
+    
+    params = {
+        "latitude": lat,
+        "longitude": lon,
+        "daily": ["sunrise", "sunset", "daylight_duration"],
+        "timezone": "auto",
+        "past_days": past_days,
+        "forecast_days": 1
+    }
+    
+    data = batcher.forecast.fetch(params)
+    if not data:
+        return None
+
+    daily = data.get("daily", {})
+    durations = daily.get("daylight_duration", [])
+    if not durations or any(v is None for v in durations):
+        return None
+
+    sunrises = daily.get("sunrise", [])
+    sunsets = daily.get("sunset", [])
+    eqtime = _solar_noon_eqtime(
+        sunrises[-1] if sunrises else "", sunsets[-1] if sunsets else "",
+        lon, data.get("utc_offset_seconds"))
+    return list(durations), eqtime
+
+
+def _fetch_days(band_lat, lat, lon, dates, daylight=None):
+    """
+    Day lengths for ``dates`` from the configured solar provider chain.
+    Dates already carried by a merged forecast response (``daylight``) are
+    taken from it, and only the rest are fetched.
+    """
+    from services.solar_providers import fetch_day_lengths
+    # Only a response for the same local day, measured at the band's own
+    # latitude, carries the right day lengths and sun times
+    if not daylight or daylight["dates"][-1] != max(dates) or daylight["lat"] != band_lat:
+        return fetch_day_lengths(band_lat, lat, lon, dates)
+
+    known = dict(zip(daylight["dates"], daylight["durations"]))
+    missing = [d for d in dates if d not in known]
+    if missing:
+        fetched = fetch_day_lengths(band_lat, lat, lon, missing)
+        if not fetched:
+            return None
+        known.update(zip(missing, fetched[0]))
+    return [known[d] for d in dates], daylight["eqtime"]
+
+
+def _solstice_key(band_lat, solstice):
+    # Wide enough for both band and weather cell latitudes
+    return f"solar_solstice_{band_lat:.4f}_{solstice}"
+
+
+def _window_key(lat):
+    """
+    (band latitude, cache key prefix) of the windows serving ``lat``; each
+    local date's window is stored under ``<prefix>_<date>``. Upstream day
+    lengths arrive with the weather request for the weather grid cell's
+    centre, so with upstream solar the band is that cell; otherwise it is
+    the latitude rounded to _LAT_BAND_DECIMALS.
+    """
+    if upstream_primary():
+        from services.weather_service import grid_cell
+        band_lat = grid_cell(lat, 0.0)[0]
+        return band_lat, f"solar_cell_{band_lat:.4f}"
+    band_lat = round(lat, _LAT_BAND_DECIMALS)
+    return band_lat, f"solar_lat_{band_lat:.{_LAT_BAND_DECIMALS}f}"
+
+
+def _build_window(band_lat, lat, lon, today, daylight=None):
+    """Build a latitude band's window from scratch: last week plus the solstice."""
+    solstice = _get_winter_solstice_date(today)
+    week = [today - timedelta(days=i) for i in range(_WINDOW_DAYS - 1, -1, -1)]
+    back = (today - solstice).days
+    # A solstice prefetched alongside the weather request is not fetched again
+    solstice_sec = _cache.get(_solstice_key(band_lat, solstice)) if back >= _WINDOW_DAYS else None
+    dates = week if back < _WINDOW_DAYS or solstice_sec is not None else [solstice] + week
+
+    fetched = _fetch_days(band_lat, lat, lon, dates, daylight)
+    if not fetched:
+        return None
+    durations, eqtime = fetched
+
+    if back < _WINDOW_DAYS:
+        return _DaylightWindow(today, durations, solstice, durations[-1 - back], eqtime)
+    if solstice_sec is not None:
+        return _DaylightWindow(today, durations, solstice, solstice_sec, eqtime)
+    return _DaylightWindow(today, durations[1:], solstice, durations[0], eqtime)
+
+
+def _fetch_solstice(key, band_lat, lat, lon, solstice):
+    fetched = _fetch_days(band_lat, lat, lon, [solstice])
+    if fetched:
+        _cache.set(key, fetched[0][0])
+
+
+def prefetch_daylight(lat, lon, utc_offset=None):
+    """
+    Prepare what get_daylight_delta needs beyond the weather request, so it
+    can run while that request is in flight: the band's window with local
+    providers (once ``utc_offset`` is known), or the winter solstice's day
+    length - the one date a merged forecast response cannot carry - with
+    upstream.
+    """
+    if not upstream_primary():
+        # A local window is cheap to build on demand; with the offset still
+        # unknown, a guessed local date near midnight would build the wrong one
+        if utc_offset is not None:
+            _get_daylight_band(lat, lon, _local_today(utc_offset))
+        return
+
+    if utc_offset is None:
+        utc_offset = _nominal_utc_offset(lon)
+    today = _local_today(utc_offset)
+    band_lat, prefix = _window_key(lat)
+    if any(_cache.get(f"{prefix}_{today - timedelta(days=back)}") is not None
+           for back in (0, 1)):
+        return  # advancing only needs days the forecast carries
+    solstice = _get_winter_solstice_date(today)
+    if (today - solstice).days < _WINDOW_DAYS:
+        return  # inside the past week the forecast carries
+    key = _solstice_key(band_lat, solstice)
+    if _cache.get(key) is None:
+        _flight.do(key, _fetch_solstice, key, band_lat, band_lat, lon, solstice)
+
+
+def _get_daylight_band(lat, lon, today, daylight=None):
+    """
+    Day-length band for the latitude band containing ``lat`` on ``today``.
+
+    Each band keeps a rolling window per local date; on a new date only that
+    day is computed or fetched to advance yesterday's window, and the deltas
+    are recomputed from it instead of refetching from the solstice. ``daylight`` holds day
+    lengths from a merged forecast response, used before fetching.
+    """
+    band_lat, prefix = _window_key(lat)
+    cache_key = f"{prefix}_{today}"
+    window = _cache.get(cache_key)
+    if window is not None:
+        return window.band()
+
+    # One refresh per band and day, however many requests miss at once.
+    # Every day in a window is measured at the band's latitude, whichever
+    # location in it asked first.
+    refresh_args = (prefix, band_lat, band_lat, lon, today, daylight)
+
+    # When the refresh would go upstream, serve yesterday's window while it
+    # runs in the background; local refreshes are cheaper than the handoff
+    previous = _cache.get(f"{prefix}_{today - timedelta(days=1)}")
+    if previous is not None and _serve_stale(previous, today):
+        refresh_in_background(_flight, cache_key, _refresh_window, *refresh_args)
+        return previous.band()
+
+    new_window = _flight.do(cache_key, _refresh_window, *refresh_args)
+    return new_window.band() if new_window is not None else {}
+
+
+def _serve_stale(window, today):
+    """Whether a behind-by-a-bit window may be served while it is refreshed."""
+    if not 0 < (today - window.end_date).days * 86400 <= config.CACHE_GRACE_SOLAR:
+        return False
+    return upstream_primary()
+
+
+def _refresh_window(prefix, band_lat, lat, lon, today, daylight=None):
+    """Store a band's window for ``today``, advancing yesterday's or building it afresh."""
+    cache_key = f"{prefix}_{today}"
+    window = _cache.get(cache_key)
+    if window is not None:
+        return window
+
+    new_window = None
+    previous = _cache.get(f"{prefix}_{today - timedelta(days=1)}")
+    if previous is not None:
+        fetched = _fetch_days(band_lat, lat, lon, [today], daylight)
+        if fetched:
+            new_window = previous.advanced(fetched[0], fetched[1], today)
+    if new_window is None:
+        new_window = _build_window(band_lat, lat, lon, today, daylight)
+    if new_window is not None:
+        _cache.set(cache_key, new_window, ttl=_WINDOW_TTL)
+    return new_window
+
+
+def _minutes_to_datetime(day, minutes):
+    """Turn minutes after local midnight into a naive local datetime."""
+    if minutes is None:
+        return None
+    return datetime.combine(day, datetime.min.time()) + timedelta(minutes=int(round(minutes)))
+
+
+def _assemble_daylight(band, lon, utc_offset, today):
+    """Build the per-location get_daylight_delta result from a latitude band."""
+    solstice_sec, last_week_sec, yesterday_sec, today_sec = band["day_len_sec"]
+
+    sunrise = sunset = None
+    eqtime = band.get("eqtime_min")
+    if eqtime is not None and 0 < today_sec < 86400:
+        noon_min = 720.0 - 4.0 * lon - eqtime + utc_offset / 60.0
+        half_day_min = today_sec / 120.0
+        sunrise = _minutes_to_datetime(today, noon_min - half_day_min)
+        sunset = _minutes_to_datetime(today, noon_min + half_day_min)
+
+    return {
+        "day_len_sec": today_sec,
+        "delta_daily_sec": today_sec - yesterday_sec,
+        "delta_weekly_sec": today_sec - last_week_sec,
+        "delta_solstice_sec": today_sec - solstice_sec,
+        "sunrise": sunrise,
+        "sunset": sunset
+    }
+
+
+def get_daylight_delta(lat, lon, utc_offset=None, daylight=None):
+    """
+    Fetches solar dynamics: day length, change from yesterday, week, and solstice.
+
+    Computed by the configured solar provider (locally by default; see
+    solar_providers). ``utc_offset`` (seconds) controls the local sunrise/sunset times;
+    without it a longitude-derived offset is assumed. ``daylight`` passes on
+    day lengths a merged weather request already fetched (see
+    daylight_from_forecast).
+    """
+    try:
+        if utc_offset is None:
+            utc_offset = _nominal_utc_offset(lon)
+        today = _local_today(utc_offset)
+
+        band = _get_daylight_band(lat, lon, today, daylight)
+        if not band:
+            return {}
+        return _assemble_daylight(band, lon, utc_offset, today)
+    except deadline.DeadlineExceeded:
+        raise
     except Exception:
         return {}
 
@@ -172,9 +625,14 @@ def get_daylight_stats(lat, lon):
 	if today < solstice:
 		solstice = date(today.year - 1, 12, 21)
 
-	today_len = get_sun_times(lat, lon, today)["day_length_seconds"]
-	y_len = get_sun_times(lat, lon, yesterday)["day_length_seconds"]
-	s_len = get_sun_times(lat, lon, solstice)["day_length_seconds"]
+	atlas = _get_atlas()
+	if atlas is not None:
+		day_lens = atlas.lookup(lat, lon, [today, yesterday, solstice])["day_len_sec"]
+		today_len, y_len, s_len = (float(v) for v in day_lens)
+	else:
+		today_len = get_sun_times(lat, lon, today)["day_length_seconds"]
+		y_len = get_sun_times(lat, lon, yesterday)["day_length_seconds"]
+		s_len = _solstice_day_length(round(lat, _SUN_TIMES_DECIMALS), solstice.year)
 
 	delta_y = today_len - y_len
 	delta_s = today_len - s_len
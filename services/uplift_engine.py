@@ -5,10 +5,13 @@ Supports multiple languages (en, de).
 
 import random
 import hashlib
+from concurrent.futures import TimeoutError as FutureTimeout
 from datetime import date, datetime, timedelta
-from services.solar_service import get_daylight_delta
+from services.solar_service import get_daylight_delta, prefetch_daylight
 from services.weather_service import fetch_daily_weather
+from services import deadline, io_pool, prewarm
 from services import uplift_content as content
+from services.metrics import get_metrics
 
 
 # ===== HELPER: Get localized content =====
@@ -233,8 +236,31 @@ def generate_uplift_data(lat, lon, city=None, lang="en"):
     if lang not in ["en", "de"]:
         lang = "en"
     
-    solar = get_daylight_delta(lat, lon) or {}
-    weather = fetch_daily_weather(lat, lon, days=7) or {}
+    # The weather response carries the location's UTC offset, which the
+    # local solar engine needs for sunrise/sunset in local time, and the day
+    # lengths when solar data comes from upstream as well. Everything solar
+    # needs beyond that is prepared while the weather request is in flight.
+    # The fetch runs outside this request's deadline, which bounds only the
+    # wait below, so a fetch we give up on still completes and fills the cache.
+    weather_future = io_pool.submit_background(fetch_daily_weather, lat, lon, days=7)
+    try:
+        prefetch_daylight(lat, lon)
+    except Exception:
+        pass  # get_daylight_delta fetches whatever is still missing
+    
+    # Past the request's deadline, carry on with what we have
+    try:
+        weather = weather_future.result(timeout=deadline.remaining()) or {}
+    except (FutureTimeout, deadline.DeadlineExceeded):
+        get_metrics().incr("uplift.degraded.weather")
+        weather = {}
+    try:
+        solar = get_daylight_delta(lat, lon, utc_offset=weather.get("utc_offset_seconds"),
+                                   daylight=weather.get("daylight")) or {}
+    except deadline.DeadlineExceeded:
+        get_metrics().incr("uplift.degraded.solar")
+        solar = {}
+    prewarm.record(lat, lon, weather.get("utc_offset_seconds"))
     
     today = date.today()
     
@@ -0,0 +1,215 @@
+"""
+Shared upstream HTTP client.
+
+Every Open-Meteo call (forecast, geocoding) goes through one keep-alive
+``requests.Session`` per process, so cache misses reuse pooled TCP/TLS
+connections instead of paying a handshake each time. One retry policy -
+exponential backoff with full jitter - applies to all callers, a per-host
+circuit breaker fails fast while a host is down, and every attempt is
+recorded per host in the metrics registry. Opt-in hedging sends a second
+request when the first is slower than usual, within a capped budget.
+"""
+
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import config
+from services import deadline
+from services.circuit_breaker import get_breaker
+from services.logging_service import log_event
+from services.metrics import get_metrics
+from services.quota import get_governor
+
+# Attempts with less budget left than this are not started
+_MIN_ATTEMPT_SEC = 0.05
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """The process-wide pooled session, created on first use."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=config.UPSTREAM_POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def _backoff(attempt):
+    """Full-jitter exponential backoff before retry number ``attempt + 1``."""
+    ceiling = min(config.UPSTREAM_BACKOFF_MAX, config.UPSTREAM_BACKOFF_BASE * (2 ** attempt))
+    return random.uniform(0, ceiling)
+
+
+def _retryable(error):
+    """Timeouts, connection errors, 429 and 5xx are worth retrying; other 4xx are not."""
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        status = error.response.status_code
+        return status == 429 or status >= 500
+    return True
+
+
+def get_json(url, params, max_retries=None, timeout=None):
+    """
+    GET ``url`` and return the decoded JSON, or None once retries are
+    exhausted, the request is rejected outright, the host's circuit is open
+    or the quota is spent for the current priority. Raises DeadlineExceeded
+    when the request-wide deadline cuts the call short: that says nothing
+    about the upstream, so callers must not cache it as a failure.
+    """
+    max_retries = max_retries or config.API_MAX_RETRIES
+    timeout = timeout or config.API_TIMEOUT
+    host = urlsplit(url).hostname or url
+    metrics = get_metrics()
+    session = get_session()
+    breaker = get_breaker(host)
+    governor = get_governor()
+
+    for attempt in range(max_retries):
+        # Each attempt gets at most what is left of the request's budget
+        attempt_timeout = deadline.bounded(timeout)
+        if attempt_timeout < _MIN_ATTEMPT_SEC:
+            metrics.incr(f"upstream.{host}.deadline")
+            raise deadline.DeadlineExceeded(f"upstream:{host}")
+        # Every call spends shared quota; lower priorities are denied first
+        if not governor.acquire():
+            return None
+        # An open circuit fails fast instead of retrying into an outage
+        if not breaker.allow():
+            governor.refund()
+            return None
+        if attempt:
+            metrics.incr(f"upstream.{host}.retries")
+        started = time.perf_counter()
+        try:
+            if config.UPSTREAM_HEDGE:
+                data = _send_hedged(host, session, url, params, attempt_timeout)
+            else:
+                data = _send(session, url, params, attempt_timeout)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            metrics.observe(f"upstream.{host}.latency_ms", (time.perf_counter() - started) * 1000)
+            if isinstance(e, requests.exceptions.Timeout) and attempt_timeout < timeout:
+                # Our budget ran out, not the host's patience: neither a
+                # success nor a failure
+                breaker.release_probe()
+                metrics.incr(f"upstream.{host}.deadline")
+                raise deadline.DeadlineExceeded(f"upstream:{host}") from e
+            metrics.incr(f"upstream.{host}.errors")
+            retryable = _retryable(e)
+            # A rejected request still shows the host is up
+            if retryable:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            if attempt == max_retries - 1 or not retryable:
+                log_event('api_fail', f'{host}:{str(e)[:50]}')
+                return None
+            time.sleep(deadline.bounded(_backoff(attempt)))
+            continue
+        metrics.observe(f"upstream.{host}.latency_ms", (time.perf_counter() - started) * 1000)
+        breaker.record_success()
+        return data
+    return None
+
+
+def _send(session, url, params, timeout):
+    resp = session.get(url, params=params, timeout=timeout)
+    resp.raise_for_status()
+    return resp.json()
+
+
+# --- hedged requests ---
+
+class _HedgeBudget:
+    """Caps hedges at UPSTREAM_HEDGE_MAX_RATIO of requests per one-minute window."""
+
+    _WINDOW = 60.0
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._requests = 0
+        self._hedges = 0
+
+    def request(self):
+        with self._lock:
+            self._roll()
+            self._requests += 1
+
+    def allow(self) -> bool:
+        with self._lock:
+            self._roll()
+            if self._hedges + 1 > self._requests * config.UPSTREAM_HEDGE_MAX_RATIO:
+                return False
+            self._hedges += 1
+            return True
+
+    def _roll(self):
+        now = time.monotonic()
+        if now - self._started >= self._WINDOW:
+            self._started = now
+            self._requests = self._hedges = 0
+
+
+_hedge_budget = _HedgeBudget()
+# Hedged attempts run on their own pool: they never submit further work, so
+# callers already on the shared I/O pool cannot deadlock waiting for them
+_hedge_pool = ThreadPoolExecutor(max_workers=config.IO_POOL_WORKERS, thread_name_prefix="hedge")
+_hedge_slots = threading.BoundedSemaphore(config.IO_POOL_WORKERS)
+
+
+def _hedge_delay(host):
+    """Seconds to wait before hedging: the configured percentile of recent latency."""
+    latency_ms = get_metrics().percentile(
+        f"upstream.{host}.latency_ms", config.UPSTREAM_HEDGE_PERCENTILE,
+        min_samples=config.UPSTREAM_HEDGE_MIN_SAMPLES)
+    return latency_ms / 1000.0 if latency_ms is not None else None
+
+
+def _send_in_slot(session, url, params, timeout):
+    try:
+        return _send(session, url, params, timeout)
+    finally:
+        _hedge_slots.release()
+
+
+def _send_hedged(host, session, url, params, timeout):
+    """
+    Send a request; if it has not answered by the hedge delay, send an
+    identical one and take whichever succeeds first. Without enough latency
+    samples, a free slot or hedge budget, this is a plain request.
+    """
+    _hedge_budget.request()
+    delay = _hedge_delay(host)
+    if delay is None or not _hedge_slots.acquire(blocking=False):
+        return _send(session, url, params, timeout)
+
+    first = _hedge_pool.submit(_send_in_slot, session, url, params, timeout)
+    done, _ = wait([first], timeout=delay)
+    if done or not _hedge_budget.allow() or not _hedge_slots.acquire(blocking=False):
+        return first.result()
+    if not get_governor().acquire():
+        _hedge_slots.release()
+        return first.result()
+
+    get_metrics().incr(f"upstream.{host}.hedges")
+    second = _hedge_pool.submit(_send_in_slot, session, url, params, timeout)
+    done, pending = wait([first, second], return_when=FIRST_COMPLETED)
+    winner = next(iter(done))
+    if winner.exception() is not None and pending:
+        # The other request may still succeed
+        winner = next(iter(pending))
+    if winner is second:
+        get_metrics().incr(f"upstream.{host}.hedge_wins")
+    return winner.result()
@@ -1,200 +1,192 @@
-import requests
-import time
-from datetime import date, datetime
+import math
+import struct
+import sys
+from array import array
+from datetime import date, datetime, timedelta, timezone
+from functools import partial
 
 from config import config
+from services import batcher, deadline, solar_service
+from services.cache import cached_call, get_cache
+from services.expiry import semantic_ttl
+from services.forecast import ANALYSIS_FIELDS, BAD, GOOD, SNOW, Forecast, analyze, classify
+from services.singleflight import SingleFlight
 
-# Simple in-memory cache
-_cache = {}
+# Bounded, thread-safe forecast cache
+_cache = get_cache('weather')
+# Enough decimals to tell grid cell centres apart at any configured step
+_GRID_DECIMALS = 4
+_flight = SingleFlight('weather')
 
 
-def _get_cached(key):
-    if key in _cache:
-        data, timestamp = _cache[key]
-        if time.time() - timestamp < config.CACHE_TTL_WEATHER:
-            return data
-        del _cache[key]
-    return None
+def fetch_daily_weather(lat, lon, days=7, day=None, start=None):
+    """
+    Fetches 7-day weather data with detailed analysis for narrative generation.
+
+    ``day`` is the server date the entry is cached under (default today) and
+    ``start`` the first forecast date to request (default the location's
+    today); the midnight pre-warm uses both to fill tomorrow's entries.
+    """
+    # Everyone in a model grid cell gets the same forecast, so they share
+    # one entry and one upstream request for the cell centre
+    lat, lon = grid_cell(lat, lon)
+    cache_key = f"weather_{lat:.{_GRID_DECIMALS}f}_{lon:.{_GRID_DECIMALS}f}_{day or date.today()}"
+    # Concurrent misses share one upstream call; recently expired entries
+    # are served while a background refresh runs
+    ttl = _weather_ttl if day is None else partial(_weather_ttl, day=day)
+    entry = cached_call(_cache, _flight, cache_key, _fetch_weather, lat, lon, days, start,
+                        ttl=ttl)
+    return entry.as_dict() if entry else {}
+
 
+def grid_cell(lat, lon, step=None):
+    """Centre of the forecast model grid cell (``step`` degrees) containing a point."""
+    step = step or config.WEATHER_GRID_DEG
+    # Rounding first keeps points on a cell edge from slipping into the cell below
+    row = math.floor(round(lat / step, 9))
+    col = math.floor(round(((lon + 180.0) % 360.0) / step, 9))
+    cell_lat = min(max((row + 0.5) * step, -90.0 + step / 2), 90.0 - step / 2)
+    cell_lon = (col + 0.5) * step - 180.0
+    return round(cell_lat, _GRID_DECIMALS), round(cell_lon, _GRID_DECIMALS)
 
-def _set_cached(key, data):
-    _cache[key] = (data, time.time())
 
+# Packed merged-response daylight: first date's ordinal, the latitude it was
+# requested for, equation of time (NaN when unknown), then one duration per
+# consecutive day
+_DAYLIGHT_HEAD = struct.Struct("<idd")
 
-def fetch_daily_weather(lat, lon, days=7):
+
+class WeatherEntry:
     """
-    Fetches 7-day weather data with detailed analysis for narrative generation.
+    Cached forecast for one grid cell, kept packed. The analysis is run once
+    when the entry is built and kept as a tuple of values; the dict the
+    narrative engine reads is built by ``as_dict`` on demand.
+    """
+
+    __slots__ = ("forecast", "utc_offset", "_daylight", "_analysis")
+
+    def __init__(self, forecast, utc_offset=None, daylight=None):
+        self.forecast = forecast
+        self.utc_offset = utc_offset
+        self._analysis = None
+        if len(forecast):
+            analysis = analyze(forecast)
+            # The class labels repeat across every cell
+            self._analysis = tuple(sys.intern(v) if isinstance(v, str) else v
+                                   for v in (analysis[k] for k in ANALYSIS_FIELDS))
+        self._daylight = None
+        if daylight:
+            eqtime = daylight["eqtime"]
+            self._daylight = _DAYLIGHT_HEAD.pack(
+                daylight["dates"][0].toordinal(), daylight["lat"],
+                math.nan if eqtime is None else eqtime
+            ) + array("d", daylight["durations"]).tobytes()
+
+    @property
+    def daylight(self):
+        """The ``daylight`` argument for get_daylight_delta, or None."""
+        if self._daylight is None:
+            return None
+        first, lat, eqtime = _DAYLIGHT_HEAD.unpack_from(self._daylight)
+        durations = array("d")
+        durations.frombytes(self._daylight[_DAYLIGHT_HEAD.size:])
+        return {
+            "lat": lat,
+            "dates": tuple(date.fromordinal(first + i) for i in range(len(durations))),
+            "durations": tuple(durations),
+            "eqtime": None if math.isnan(eqtime) else eqtime,
+        }
+
+    def as_dict(self):
+        rows = self.forecast.rows()
+        result = {
+            "forecast": rows,
+            "today": rows[0] if rows else {},
+            "tomorrow": rows[1] if len(rows) > 1 else {},
+            "analysis": dict(zip(ANALYSIS_FIELDS, self._analysis)) if self._analysis else {},
+            "utc_offset_seconds": self.utc_offset
+        }
+        daylight = self.daylight
+        if daylight:
+            result["daylight"] = daylight
+        return result
+
+
+def _weather_ttl(entry, day=None):
+    """
+    A forecast stays valid until the next model update, or until local
+    midnight shifts its day indexing, whichever comes first. Entries
+    written ahead for server date ``day`` (the midnight pre-warm) are
+    measured from the start of that day, so they cover it instead of
+    expiring at the midnight they were fetched for. Without the location's
+    timezone its midnight is unknown, and the fixed CACHE_TTL_WEATHER caps
+    the lifetime instead.
     """
-    cache_key = f"weather_{lat:.2f}_{lon:.2f}_{date.today()}"
-    cached = _get_cached(cache_key)
-    if cached:
-        return cached
+    if entry.utc_offset is None:
+        return min(config.CACHE_TTL_WEATHER, semantic_ttl(model_bound=True))
+    if day is None or day <= date.today():
+        return semantic_ttl(entry.utc_offset, model_bound=True)
+    now = datetime.now(timezone.utc)
+    starts = datetime.combine(day, datetime.min.time()).astimezone(timezone.utc)
+    return ((starts - now).total_seconds()
+            + semantic_ttl(entry.utc_offset, model_bound=True, now=starts))
+
 
+def _fetch_weather(lat, lon, days, start=None):
+    """Fetch the forecast from Open-Meteo as a WeatherEntry ({} on failure)."""
     try:
-        url = "https://api.open-meteo.com/v1/forecast"
         params = {
             "latitude": lat,
             "longitude": lon,
             "daily": ["weathercode", "temperature_2m_max", "temperature_2m_min", 
                       "precipitation_sum", "precipitation_probability_max"],
             "timezone": "auto",
-            "forecast_days": days
         }
+        past_days = 0
+        if start is not None:
+            params["start_date"] = start.isoformat()
+            params["end_date"] = (start + timedelta(days=days - 1)).isoformat()
+        else:
+            params["forecast_days"] = days
+            # When solar data comes from upstream too, one request serves
+            # both: add the daylight variables and the past week
+            if solar_service.upstream_primary():
+                past_days = solar_service.DAYLIGHT_PAST_DAYS
+                params["daily"] += solar_service.DAYLIGHT_VARIABLES
+                params["past_days"] = past_days
         
-        resp = requests.get(url, params=params, timeout=config.API_TIMEOUT)
-        resp.raise_for_status()
-        data = resp.json()
+        data = batcher.forecast.fetch(params)
+        if not data:
+            return {}
         
         daily = data.get("daily", {})
-        dates = daily.get("time", [])
-        codes = daily.get("weathercode", [])
-        temps_max = daily.get("temperature_2m_max", [])
-        temps_min = daily.get("temperature_2m_min", [])
-        precip = daily.get("precipitation_sum", [])
-        precip_prob = daily.get("precipitation_probability_max", [])
-        
-        forecast = []
-        for i in range(min(7, len(codes))):
-            day_date = datetime.strptime(dates[i], "%Y-%m-%d") if i < len(dates) else None
-            forecast.append({
-                "date": day_date,
-                "weekday": day_date.strftime("%A") if day_date else f"Day {i+1}",
-                "weekday_short": day_date.strftime("%a") if day_date else f"D{i+1}",
-                "code": codes[i] if i < len(codes) else 0,
-                "temp_max": temps_max[i] if i < len(temps_max) else None,
-                "temp_min": temps_min[i] if i < len(temps_min) else None,
-                "precip": precip[i] if i < len(precip) else 0,
-                "precip_prob": precip_prob[i] if i < len(precip_prob) else 0,
-                "is_good": _is_good_weather(codes[i] if i < len(codes) else 0),
-                "is_bad": _is_bad_weather(codes[i] if i < len(codes) else 0),
-            })
-        
-        result = {
-            "forecast": forecast,
-            "today": forecast[0] if forecast else {},
-            "tomorrow": forecast[1] if len(forecast) > 1 else {},
-            "analysis": _analyze_forecast(forecast, temps_max)
-        }
-        
-        _set_cached(cache_key, result)
-        return result
+        daylight = None
+        if past_days:
+            daylight = solar_service.daylight_from_forecast(data, lat, lon, past_days)
+            daily = {k: v[past_days:] for k, v in daily.items()}
+        return WeatherEntry(Forecast.from_daily(daily), data.get("utc_offset_seconds"), daylight)
         
+    except deadline.DeadlineExceeded:
+        # Cut short by the caller's budget: not a failure worth caching
+        raise
     except Exception:
         return {}
 
 
 def _is_good_weather(code):
     """Check if weather code indicates good weather."""
-    return code in [0, 1, 2]  # Clear, mainly clear, partly cloudy
+    return bool(classify(code) & GOOD)  # Clear, mainly clear, partly cloudy
 
 def _is_bad_weather(code):
     """Check if weather code indicates bad/rainy weather."""
-    return code in [51, 53, 55, 61, 63, 65, 80, 81, 82, 95, 96, 99]  # Rain/storms
+    return bool(classify(code) & BAD)  # Rain/storms
 
 def _is_snow(code):
     """Check if weather code indicates snow."""
-    return code in [71, 73, 75, 77, 85, 86]
+    return bool(classify(code) & SNOW)
 
 def _analyze_forecast(forecast, temps_max):
-    """Analyze the 7-day forecast for narrative patterns."""
+    """Analyze a 7-day forecast given as per-day dicts for narrative patterns."""
     if not forecast:
         return {}
-    
-    analysis = {
-        "temp_trend": "stable",
-        "temp_change": 0,
-        "next_good_day": None,
-        "next_good_day_index": -1,
-        "next_bad_day": None,
-        "next_bad_day_index": -1,
-        "good_streak_length": 0,
-        "bad_streak_length": 0,
-        "weekend_outlook": "mixed",
-        "week_character": "mixed",
-        "warming_days_ahead": 0,  # New: count of days warmer than today
-    }
-    
-    # Temperature trend analysis
-    if temps_max and len(temps_max) >= 3:
-        today_temp = temps_max[0] if temps_max[0] else 0
-        
-        # Count how many of next days are warmer
-        warmer_count = sum(1 for t in temps_max[1:5] if t and t > today_temp + 1)
-        analysis["warming_days_ahead"] = warmer_count
-        
-        # Calculate trend from first half to second half
-        first_half = sum(t for t in temps_max[:3] if t) / max(1, len([t for t in temps_max[:3] if t]))
-        second_half = sum(t for t in temps_max[3:6] if t) / max(1, len([t for t in temps_max[3:6] if t]))
-        diff = second_half - first_half
-        analysis["temp_change"] = round(diff, 1)
-        
-        if diff > 4:
-            analysis["temp_trend"] = "warming_strong"
-        elif diff > 2:
-            analysis["temp_trend"] = "warming"
-        elif diff < -4:
-            analysis["temp_trend"] = "cooling_strong"
-        elif diff < -2:
-            analysis["temp_trend"] = "cooling"
-        # Also check if consistently warming day-over-day
-        elif warmer_count >= 3:
-            analysis["temp_trend"] = "warming"
-    
-    if forecast[0].get("is_bad", False):
-        for i, day in enumerate(forecast[1:], 1):
-            if day.get("is_good", False):
-                analysis["next_good_day"] = day.get("weekday", f"Day {i+1}")
-                analysis["next_good_day_index"] = i
-                break
-    
-    if forecast[0].get("is_good", False):
-        for i, day in enumerate(forecast[1:], 1):
-            if day.get("is_bad", False):
-                analysis["next_bad_day"] = day.get("weekday", f"Day {i+1}")
-                analysis["next_bad_day_index"] = i
-                break
-    
-    today_good = forecast[0].get("is_good", False)
-    streak = 1
-    for day in forecast[1:]:
-        if day.get("is_good", False) == today_good:
-            streak += 1
-        else:
-            break
-    
-    if today_good:
-        analysis["good_streak_length"] = streak
-    else:
-        analysis["bad_streak_length"] = streak
-    
-    today_date = forecast[0].get("date")
-    if today_date:
-        days_until_saturday = (5 - today_date.weekday()) % 7
-        days_until_sunday = (6 - today_date.weekday()) % 7
-        
-        sat_good = sun_good = False
-        if days_until_saturday < len(forecast):
-            sat_good = forecast[days_until_saturday].get("is_good", False)
-        if days_until_sunday < len(forecast):
-            sun_good = forecast[days_until_sunday].get("is_good", False)
-        
-        if sat_good and sun_good:
-            analysis["weekend_outlook"] = "good"
-        elif not sat_good and not sun_good:
-            analysis["weekend_outlook"] = "bad"
-        else:
-            analysis["weekend_outlook"] = "mixed"
-    
-    good_days = sum(1 for d in forecast if d.get("is_good", False))
-    bad_days = sum(1 for d in forecast if d.get("is_bad", False))
-    
-    if good_days >= 5:
-        analysis["week_character"] = "mostly_good"
-    elif bad_days >= 5:
-        analysis["week_character"] = "mostly_bad"
-    elif good_days >= 3 and bad_days <= 2:
-        analysis["week_character"] = "good_stretch"
-    elif bad_days >= 3 and good_days <= 2:
-        analysis["week_character"] = "grey_stretch"
-    
-    return analysis
+    return analyze(Forecast.from_rows(forecast, temps_max))
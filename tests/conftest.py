@@ -7,6 +7,10 @@ import os
 # Ensure the app module is importable
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+# No background pre-warm or snapshot jobs during tests
+os.environ.setdefault('PREWARM_ENABLED', 'false')
+os.environ.setdefault('CACHE_SNAPSHOT_ENABLED', 'false')
+
 
 @pytest.fixture(scope="session")
 def app_instance():
@@ -30,3 +34,104 @@ def reset_rate_limiter():
     limiter = get_limiter()
     limiter._requests.clear()
     yield
+
+
+@pytest.fixture(autouse=True)
+def reset_circuit_breakers():
+    """Start every test with all upstream circuits closed."""
+    from services.circuit_breaker import reset_all
+    reset_all()
+    yield
+
+
+@pytest.fixture
+def config_override():
+    """Temporarily override fields of the frozen config singleton."""
+    from config import config
+    saved = {}
+
+    def override(**values):
+        for key, value in values.items():
+            saved.setdefault(key, getattr(config, key))
+            object.__setattr__(config, key, value)
+
+    yield override
+    for key, value in saved.items():
+        object.__setattr__(config, key, value)
+
+
+@pytest.fixture
+def resp_server():
+    """
+    Minimal in-process stand-in for a Redis server (RESP: PING, AUTH,
+    SELECT, GET, SET [PX], DEL, SCAN, INCRBY, PEXPIREAT). Yields its
+    redis:// URL.
+    """
+    import fnmatch
+    import socketserver
+    import threading
+    import time
+
+    store = {}
+    lock = threading.Lock()
+
+    def live(key):
+        value, expires = store.get(key, (None, None))
+        if expires is not None and expires <= time.time():
+            store.pop(key, None)
+            return None
+        return value
+
+    def run(args):
+        name = args[0].upper()
+        with lock:
+            if name in (b"PING", b"AUTH", b"SELECT"):
+                return b"+OK\r\n"
+            if name == b"GET":
+                value = live(args[1])
+                return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+            if name == b"SET":
+                expires = None
+                if len(args) > 3 and args[3].upper() == b"PX":
+                    expires = time.time() + int(args[4]) / 1000.0
+                store[args[1]] = (args[2], expires)
+                return b"+OK\r\n"
+            if name == b"DEL":
+                removed = sum(store.pop(k, None) is not None for k in args[1:])
+                return b":%d\r\n" % removed
+            if name == b"INCRBY":
+                value = int(live(args[1]) or 0) + int(args[2])
+                store[args[1]] = (b"%d" % value, store.get(args[1], (None, None))[1])
+                return b":%d\r\n" % value
+            if name == b"PEXPIREAT":
+                if live(args[1]) is None:
+                    return b":0\r\n"
+                store[args[1]] = (store[args[1]][0], int(args[2]) / 1000.0)
+                return b":1\r\n"
+            if name == b"SCAN":
+                pattern = args[args.index(b"MATCH") + 1].decode() if b"MATCH" in args else "*"
+                keys = [k for k in list(store) if live(k) is not None
+                        and fnmatch.fnmatchcase(k.decode(), pattern)]
+                reply = b"*2\r\n$1\r\n0\r\n*%d\r\n" % len(keys)
+                return reply + b"".join(b"$%d\r\n%s\r\n" % (len(k), k) for k in keys)
+        return b"-ERR unknown command\r\n"
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            while True:
+                line = self.rfile.readline()
+                if not line:
+                    return
+                args = []
+                for _ in range(int(line[1:-2])):
+                    length = int(self.rfile.readline()[1:-2])
+                    args.append(self.rfile.read(length + 2)[:-2])
+                self.wfile.write(run(args))
+
+    socketserver.ThreadingTCPServer.allow_reuse_address = True
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    yield f"redis://127.0.0.1:{server.server_address[1]}/0"
+    server.shutdown()
+    server.server_close()
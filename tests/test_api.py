@@ -18,6 +18,17 @@ class TestHealthEndpoint:
         assert data['status'] == 'ok'
 
 
+class TestMetricsEndpoint:
+    """Tests for metrics endpoint."""
+    
+    def test_metrics_returns_snapshot(self, client):
+        """Metrics endpoint returns counters, gauges and timings."""
+        response = client.get('/metrics')
+        assert response.status_code == 200
+        data = response.get_json()
+        assert set(data) == {'counters', 'gauges', 'timings'}
+
+
 class TestSearchEndpoint:
     """Tests for city search endpoint."""
     
@@ -35,7 +46,7 @@ class TestSearchEndpoint:
     
     def test_search_valid_query(self, client):
         """Valid query returns results."""
-        with patch('app._request_with_retry') as mock_req:
+        with patch('services.upstream.get_json') as mock_req:
             mock_req.return_value = {
                 'results': [
                     {'name': 'Berlin', 'country': 'Germany', 'latitude': 52.52, 'longitude': 13.40}
@@ -2,9 +2,12 @@
 
 import pytest
 from unittest.mock import patch, MagicMock
-from datetime import date, datetime
+from datetime import date, datetime, timedelta, timezone
 import time
 
+from services.forecast import Forecast
+from services.solar_providers import PROVIDERS
+
 
 class TestSolarService:
     """Tests for solar_service module."""
@@ -16,7 +19,8 @@ class TestSolarService:
         # Clear cache
         solar_service._cache.clear()
         
-        with patch.object(solar_service, '_request_with_retry') as mock_req:
+        with patch('services.solar_providers.provider_chain', return_value=[PROVIDERS["upstream"]]), \
+             patch('services.upstream.get_json') as mock_req:
             mock_req.return_value = {
                 "daily": {
                     "daylight_duration": [28800, 29000, 29200],
@@ -25,22 +29,56 @@ class TestSolarService:
                 }
             }
             
-            # First call
+            # First call: the past week, plus the solstice once it is
+            # outside that week (sparse mode)
+            today = solar_service._local_today(solar_service._nominal_utc_offset(8.54))
+            solstice = solar_service._get_winter_solstice_date(today)
+            expected = 1 if (today - solstice).days < 8 else 2
             result1 = solar_service.get_daylight_delta(47.37, 8.54)
-            assert mock_req.call_count == 1
+            assert mock_req.call_count == expected
             
             # Second call should use cache
             result2 = solar_service.get_daylight_delta(47.37, 8.54)
-            assert mock_req.call_count == 1  # No additional call
+            assert mock_req.call_count == expected  # No additional call
             
             assert result1 == result2
     
+    def test_null_day_length_from_upstream(self):
+        """A null daylight_duration is rejected instead of failing the request."""
+        from services import solar_service
+        solar_service._cache.clear()
+        
+        with patch('services.solar_providers.provider_chain', return_value=[PROVIDERS["upstream"]]), \
+             patch('services.upstream.get_json') as mock_req:
+            mock_req.return_value = {
+                "daily": {
+                    "daylight_duration": [28800, None, 29200],
+                    "sunrise": ["2024-01-15T08:00", "2024-01-16T07:58", "2024-01-17T07:56"],
+                    "sunset": ["2024-01-15T16:00", "2024-01-16T16:03", "2024-01-17T16:06"]
+                }
+            }
+            assert solar_service._upstream_days(47.37, 8.54, date(2024, 1, 15),
+                                                date(2024, 1, 17)) is None
+            assert isinstance(solar_service.get_daylight_delta(47.37, 8.54), dict)
+    
+    def test_daylight_errors_degrade_to_empty(self):
+        """Unexpected errors give an empty result; a spent deadline still propagates."""
+        from services import deadline, solar_service
+        
+        with patch.object(solar_service, '_get_daylight_band', side_effect=ValueError):
+            assert solar_service.get_daylight_delta(47.37, 8.54) == {}
+        with patch.object(solar_service, '_get_daylight_band',
+                          side_effect=deadline.DeadlineExceeded("solar")):
+            with pytest.raises(deadline.DeadlineExceeded):
+                solar_service.get_daylight_delta(47.37, 8.54)
+    
     def test_get_daylight_delta_handles_empty_response(self):
         """Test handling of empty API response."""
         from services import solar_service
         solar_service._cache.clear()
         
-        with patch.object(solar_service, '_request_with_retry') as mock_req:
+        with patch('services.solar_providers.provider_chain', return_value=[PROVIDERS["upstream"]]), \
+             patch('services.upstream.get_json') as mock_req:
             mock_req.return_value = None
             result = solar_service.get_daylight_delta(47.37, 8.54)
             assert result == {}
@@ -50,11 +88,252 @@ class TestSolarService:
         from services import solar_service
         solar_service._cache.clear()
         
-        with patch.object(solar_service, '_request_with_retry') as mock_req:
+        with patch('services.solar_providers.provider_chain', return_value=[PROVIDERS["upstream"]]), \
+             patch('services.upstream.get_json') as mock_req:
             mock_req.return_value = {"daily": {}}
             result = solar_service.get_daylight_delta(47.37, 8.54)
             assert result == {}
 
+    def test_upstream_sparse_fetch_requests_only_needed_dates(self):
+        """Sparse mode asks for the last week plus the solstice, nothing more."""
+        from services import solar_service
+        
+        week = {
+            "daily": {
+                "daylight_duration": [30000 + 100 * i for i in range(8)],
+                "sunrise": ["2024-03-20T06:30"] * 8,
+                "sunset": ["2024-03-20T18:40"] * 8
+            },
+            "utc_offset_seconds": 3600
+        }
+        solstice = {"daily": {"daylight_duration": [29000]}}
+        
+        with patch('services.solar_providers.provider_chain', return_value=[PROVIDERS["upstream"]]), \
+             patch('services.upstream.get_json',
+                          side_effect=[week, solstice]) as mock_req:
+            window = solar_service._build_window(47.37, 47.37, 8.54, date(2024, 3, 20))
+        
+        week_params = mock_req.call_args_list[0][0][1]
+        solstice_params = mock_req.call_args_list[1][0][1]
+        assert week_params["start_date"] == "2024-03-13"
+        assert week_params["end_date"] == "2024-03-20"
+        assert "past_days" not in week_params
+        assert solstice_params["start_date"] == solstice_params["end_date"] == "2023-12-21"
+        assert window.band()["day_len_sec"] == (29000, 30000, 30600, 30700)
+    
+    def test_rollover_fetches_only_the_new_day(self):
+        """At midnight the window advances by one day instead of refetching."""
+        from services import solar_service
+        solar_service._cache.clear()
+        
+        day1 = date(2024, 3, 20)
+        day2 = date(2024, 3, 21)
+        first = solar_service._get_daylight_band(47.37, 8.54, day1)
+        
+        vectorized = PROVIDERS["local-vectorized"]
+        with patch.object(vectorized, 'day_lengths', wraps=vectorized.day_lengths) as mock_days:
+            second = solar_service._get_daylight_band(47.37, 8.54, day2)
+            assert mock_days.call_count == 1
+            assert mock_days.call_args[0][2] == [day2]
+        
+        # Yesterday's "today" is today's "yesterday"; the solstice is unchanged
+        assert second["day_len_sec"][2] == first["day_len_sec"][3]
+        assert second["day_len_sec"][0] == first["day_len_sec"][0]
+        assert second["day_len_sec"][3] > first["day_len_sec"][3]
+    
+    def test_eqtime_with_zero_utc_offset(self):
+        """A real UTC offset of zero is used, not replaced by the longitude's guess."""
+        from services import solar_service
+        # Reykjavik in January: UTC all year, solar noon around 13:37
+        eqtime = solar_service._solar_noon_eqtime("2024-01-15T11:05", "2024-01-15T16:10", -21.9, 0)
+        assert eqtime == pytest.approx(-9.9, abs=0.1)
+    
+    def test_band_serves_locations_on_different_dates(self):
+        """Locations in one band on either side of the date line keep their own windows."""
+        from services import solar_service
+        solar_service._cache.clear()
+        day1 = date(2024, 3, 20)
+        day2 = date(2024, 3, 21)
+        
+        vectorized = PROVIDERS["local-vectorized"]
+        with patch.object(vectorized, 'day_lengths', wraps=vectorized.day_lengths) as mock_days:
+            for _ in range(4):
+                west = solar_service._get_daylight_band(47.37, -170.0, day1)
+                east = solar_service._get_daylight_band(47.37, 170.0, day2)
+            assert mock_days.call_count == 2
+        
+        assert west["day_len_sec"][3] == east["day_len_sec"][2]
+    
+    def test_local_prefetch_waits_for_the_offset(self):
+        """Without a known UTC offset no local window is built for a guessed date."""
+        from services import solar_service
+        solar_service._cache.clear()
+        
+        solar_service.prefetch_daylight(47.37, 170.0)
+        assert len(solar_service._cache) == 0
+        solar_service.prefetch_daylight(47.37, 170.0, utc_offset=-11 * 3600)
+        today = solar_service._local_today(-11 * 3600)
+        assert solar_service._cache.get(f"solar_lat_47.37_{today}") is not None
+    
+    def test_rollover_over_solstice_resets_reference(self):
+        """Stepping over Dec 21 takes the new solstice from the window."""
+        from services import solar_service
+        solar_service._cache.clear()
+        
+        solar_service._get_daylight_band(47.37, 8.54, date(2024, 12, 20))
+        band = solar_service._get_daylight_band(47.37, 8.54, date(2024, 12, 22))
+        # Solstice is yesterday; deltas vs the solstice are tiny
+        assert band["day_len_sec"][0] == band["day_len_sec"][2]
+    
+    def test_get_daylight_delta_local_engine(self):
+        """Local engine answers without any upstream call."""
+        from services import solar_service
+        solar_service._cache.clear()
+        
+        with patch('services.upstream.get_json') as mock_req:
+            result = solar_service.get_daylight_delta(47.37, 8.54, utc_offset=3600)
+            assert mock_req.call_count == 0
+        
+        assert set(result) == {"day_len_sec", "delta_daily_sec", "delta_weekly_sec",
+                               "delta_solstice_sec", "sunrise", "sunset"}
+        assert 8 * 3600 < result["day_len_sec"] < 16 * 3600
+        assert isinstance(result["sunrise"], datetime)
+        assert result["sunrise"] < result["sunset"]
+    
+    def test_daylight_band_shared_across_longitudes(self):
+        """A row of cities on one latitude shares a single cache entry."""
+        from services import solar_service
+        solar_service._cache.clear()
+        
+        vectorized = PROVIDERS["local-vectorized"]
+        with patch.object(vectorized, 'day_lengths', wraps=vectorized.day_lengths) as mock_days:
+            west = solar_service.get_daylight_delta(47.37, 8.0, utc_offset=3600)
+            calls = mock_days.call_count
+            east = solar_service.get_daylight_delta(47.37, 9.0, utc_offset=3600)
+            assert mock_days.call_count == calls
+        
+        assert west["day_len_sec"] == east["day_len_sec"]
+        # One degree further east means the sun rises four minutes earlier
+        shift = (west["sunrise"] - east["sunrise"]).total_seconds() / 60
+        assert 3 <= shift <= 5
+    
+    def test_solar_provider_selected_by_config(self, config_override):
+        """The configured provider answers first; others are fallbacks."""
+        from services import solar_providers
+        config_override(SOLAR_PROVIDER='local-astral')
+        
+        chain = [p.name for p in solar_providers.provider_chain()]
+        assert chain[0] == 'local-astral'
+        assert 'upstream' in chain
+        
+        durations, eqtime = solar_providers.fetch_day_lengths(
+            47.37, 47.37, 8.54, [date(2024, 12, 21), date(2024, 6, 21)])
+        assert 8.3 < durations[0] / 3600 < 8.6
+        assert 15.8 < durations[1] / 3600 < 16.1
+        assert abs(eqtime) < 20
+    
+    def test_solar_shadow_records_divergence(self, config_override):
+        """Shadow mode compares a second provider and records the divergence."""
+        from services import solar_providers
+        from services.metrics import get_metrics
+        get_metrics().reset()
+        config_override(SOLAR_PROVIDER='local-vectorized', SOLAR_SHADOW_PROVIDER='local-astral',
+                        SOLAR_SHADOW_SAMPLE_RATE=1.0)
+        
+        with patch.object(solar_providers.io_pool, 'submit_background') as mock_submit:
+            solar_providers.fetch_day_lengths(47.37, 47.37, 8.54, [date(2024, 3, 20)])
+            # Run the shadow inline instead of on the I/O pool
+            mock_submit.call_args[0][0]()
+        
+        timings = get_metrics().snapshot()["timings"]
+        divergence = timings["solar.shadow.local-astral.divergence_sec"]
+        assert divergence["count"] == 1
+        assert divergence["max"] < 120
+        assert "solar.provider.local-astral.latency_ms" in timings
+    
+    def test_get_daylight_stats_memoized(self):
+        """Repeat stats lookups for a location cost no solar computation."""
+        from services import solar_service
+        solar_service._sun_times_memo.cache_clear()
+        solar_service._solstice_day_length.cache_clear()
+        
+        with patch.object(solar_service, '_compute_sun_times',
+                          wraps=solar_service._compute_sun_times) as mock_compute:
+            first = solar_service.get_daylight_stats(47.37, 8.54)
+            assert mock_compute.call_count == 3
+            
+            # Nearby point in the same quantized cell, then the same point again
+            solar_service.get_daylight_stats(47.371, 8.541)
+            second = solar_service.get_daylight_stats(47.37, 8.54)
+            assert mock_compute.call_count == 3
+        
+        assert first == second
+    
+    def test_get_sun_times_returns_copy(self):
+        """Callers cannot mutate the memoised entry."""
+        from services.solar_service import get_sun_times
+        
+        times = get_sun_times(47.37, 8.54, date(2024, 3, 20))
+        times["day_length_seconds"] = 0
+        assert get_sun_times(47.37, 8.54, date(2024, 3, 20))["day_length_seconds"] > 0
+    
+    def test_compute_daylight_known_values(self):
+        """Vectorized engine matches known Zurich day lengths."""
+        from services.solar_service import compute_daylight
+        
+        dates = [date(2024, 12, 21), date(2024, 6, 20), date(2024, 3, 20)]
+        sun = compute_daylight(47.37, 8.54, dates, utc_offset=3600)
+        hours = sun["day_len_sec"] / 3600
+        
+        assert 8.3 < hours[0] < 8.6   # winter solstice ~8h25m
+        assert 15.8 < hours[1] < 16.1  # summer solstice ~15h57m
+        assert 12.0 < hours[2] < 12.3  # equinox, a little over 12h
+        # Winter sunrise in Zurich is around 08:10 CET
+        assert 8 * 60 < sun["sunrise_min"][0] < 8 * 60 + 20
+    
+    def test_compute_daylight_polar(self):
+        """Polar night and midnight sun have no sunrise or sunset."""
+        from services.solar_service import compute_daylight
+        
+        sun = compute_daylight(78.0, 15.0, [date(2024, 12, 21), date(2024, 6, 21)])
+        assert sun["day_len_sec"][0] == 0
+        assert sun["day_len_sec"][1] == 86400
+        assert all(v != v for v in sun["sunrise_min"])  # NaN
+
+    def test_daylight_atlas_matches_engine(self, tmp_path):
+        """Atlas lookups agree with the vectorized engine."""
+        from services.solar_atlas import build_atlas, load_atlas
+        from services.solar_service import compute_daylight
+        
+        path = str(tmp_path / "atlas.bin")
+        build_atlas(path, lat_step=0.5)
+        atlas = load_atlas(path)
+        
+        dates = [date(2025, 1, 1), date(2025, 3, 20), date(2025, 6, 21), date(2024, 12, 31)]
+        expected = compute_daylight(47.37, 8.54, dates, utc_offset=3600)
+        actual = atlas.lookup(47.37, 8.54, dates, utc_offset=3600)
+        
+        assert max(abs(actual["day_len_sec"] - expected["day_len_sec"])) < 30
+        assert max(abs(actual["sunrise_min"] - expected["sunrise_min"])) < 1
+    
+    def test_get_daylight_delta_uses_atlas(self, tmp_path):
+        """get_daylight_delta answers from the atlas when one is loaded."""
+        from services import solar_service
+        from services.solar_atlas import build_atlas, load_atlas
+        solar_service._cache.clear()
+        
+        path = str(tmp_path / "atlas.bin")
+        build_atlas(path, lat_step=1.0)
+        atlas = load_atlas(path)
+        
+        with patch.object(solar_service, '_atlas', atlas), \
+             patch.object(solar_service, '_atlas_checked', True), \
+             patch.object(atlas, 'lookup', wraps=atlas.lookup) as mock_lookup:
+            result = solar_service.get_daylight_delta(47.37, 8.54)
+            assert mock_lookup.call_count == 1
+        
+        assert result["day_len_sec"] > 0
+
 
 class TestWeatherService:
     """Tests for weather_service module."""
@@ -64,9 +343,8 @@ class TestWeatherService:
         from services import weather_service
         weather_service._cache.clear()
         
-        with patch('services.weather_service.requests.get') as mock_get:
-            mock_response = MagicMock()
-            mock_response.json.return_value = {
+        with patch('services.upstream.get_json') as mock_get:
+            mock_get.return_value = {
                 "daily": {
                     "time": ["2024-01-15", "2024-01-16"],
                     "weathercode": [0, 3],
@@ -76,7 +354,6 @@ class TestWeatherService:
                     "precipitation_probability_max": [0, 10]
                 }
             }
-            mock_get.return_value = mock_response
             
             result1 = weather_service.fetch_daily_weather(47.37, 8.54)
             assert mock_get.call_count == 1
@@ -84,6 +361,131 @@ class TestWeatherService:
             result2 = weather_service.fetch_daily_weather(47.37, 8.54)
             assert mock_get.call_count == 1  # Cached
     
+    def test_grid_cell_snapping(self):
+        """Points snap to the centre of their model grid cell."""
+        from services.weather_service import grid_cell
+        
+        assert grid_cell(47.37, 8.54, 0.1) == (47.35, 8.55)
+        assert grid_cell(47.3, 8.5, 0.1) == (47.35, 8.55)  # cell edge belongs to the cell above
+        assert grid_cell(-0.01, -0.01, 0.1) == (-0.05, -0.05)
+        assert grid_cell(90, 180, 0.1) == (89.95, -179.95)
+        assert grid_cell(47.37, 8.54, 0.25) == (47.375, 8.625)
+    
+    def test_neighbours_share_one_cell_request(self):
+        """Nearby users share one cache entry and one upstream call for the cell centre."""
+        from services import weather_service
+        weather_service._cache.clear()
+        
+        with patch.object(weather_service, '_fetch_weather',
+                          return_value=weather_service.WeatherEntry(Forecast.from_daily({}))) as mock_fetch:
+            weather_service.fetch_daily_weather(47.37, 8.54)
+            weather_service.fetch_daily_weather(47.33, 8.58)
+        
+        assert mock_fetch.call_count == 1
+        assert mock_fetch.call_args[0][:2] == (47.35, 8.55)
+    
+    def test_merged_forecast_serves_solar(self, config_override):
+        """With upstream solar, one forecast request also fills the daylight window."""
+        from datetime import timedelta
+        from services import solar_service, weather_service
+        config_override(SOLAR_PROVIDER='upstream')
+        solar_service._cache.clear()
+        weather_service._cache.clear()
+        
+        today = solar_service._local_today(0)
+        days = [today + timedelta(days=i) for i in range(-7, 7)]
+        combined = {
+            "utc_offset_seconds": 0,
+            "daily": {
+                "time": [d.isoformat() for d in days],
+                "weathercode": [0] * 14,
+                "temperature_2m_max": [10] * 14,
+                "temperature_2m_min": [2] * 14,
+                "precipitation_sum": [0] * 14,
+                "precipitation_probability_max": [0] * 14,
+                "daylight_duration": [36000 + 60 * i for i in range(14)],
+                "sunrise": [f"{d}T07:00" for d in days],
+                "sunset": [f"{d}T17:00" for d in days],
+            }
+        }
+        solstice = {"daily": {"daylight_duration": [30000]}}
+        
+        with patch('services.upstream.get_json', side_effect=[combined, solstice]) as mock_get:
+            weather = weather_service.fetch_daily_weather(47.37, 8.54)
+            result = solar_service.get_daylight_delta(47.37, 8.54, utc_offset=0,
+                                                      daylight=weather.get("daylight"))
+        
+        forecast_params = mock_get.call_args_list[0][0][1]
+        assert forecast_params["past_days"] == 7
+        assert "daylight_duration" in forecast_params["daily"]
+        # Anything else fetched is the solstice alone
+        for call in mock_get.call_args_list[1:]:
+            assert call[0][1]["start_date"] == call[0][1]["end_date"]
+        assert len(weather["forecast"]) == 7
+        assert weather["forecast"][0]["date"].date() == today
+        assert result["day_len_sec"] == 36000 + 60 * 7
+        assert result["delta_daily_sec"] == 60
+        # Day lengths fetched for the cell centre fill the cell's window
+        assert weather["daylight"]["lat"] == 47.35
+        assert solar_service._cache.get(f"solar_cell_47.3500_{today}") is not None
+        assert solar_service._cache.get(f"solar_lat_47.37_{today}") is None
+    
+    def test_merged_daylight_only_for_its_latitude(self):
+        """Day lengths measured at another latitude are fetched for the band instead."""
+        from datetime import timedelta
+        from services import solar_service
+        today = date(2024, 3, 20)
+        dates = [today - timedelta(days=i) for i in range(2, -1, -1)]
+        daylight = {"lat": 47.45, "dates": tuple(dates), "durations": (1.0, 2.0, 3.0), "eqtime": 0.0}
+        
+        with patch('services.solar_providers.fetch_day_lengths',
+                   return_value=([4.0, 5.0, 6.0], 1.0)) as mock_fetch:
+            assert solar_service._fetch_days(47.35, 47.35, 8.54, dates, daylight) == ([4.0, 5.0, 6.0], 1.0)
+            assert mock_fetch.call_count == 1
+            assert solar_service._fetch_days(47.45, 47.45, 8.54, dates, daylight) == ([1.0, 2.0, 3.0], 0.0)
+            assert mock_fetch.call_count == 1
+    
+    def test_solstice_prefetched_alongside_weather(self, config_override):
+        """With upstream solar, the solstice fetched in parallel completes the window."""
+        from datetime import timedelta
+        from services import solar_service, weather_service
+        config_override(SOLAR_PROVIDER='upstream')
+        solar_service._cache.clear()
+        weather_service._cache.clear()
+        
+        today = solar_service._local_today(0)
+        solstice = solar_service._get_winter_solstice_date(today)
+        days = [today + timedelta(days=i) for i in range(-7, 7)]
+        combined = {
+            "utc_offset_seconds": 0,
+            "daily": {
+                "time": [d.isoformat() for d in days],
+                "weathercode": [0] * 14,
+                "temperature_2m_max": [10] * 14,
+                "temperature_2m_min": [2] * 14,
+                "precipitation_sum": [0] * 14,
+                "precipitation_probability_max": [0] * 14,
+                "daylight_duration": [36000] * 14,
+                "sunrise": [f"{d}T07:00" for d in days],
+                "sunset": [f"{d}T17:00" for d in days],
+            }
+        }
+        
+        def get_json(url, params, *args, **kwargs):
+            if params.get("start_date") == solstice.isoformat():
+                return {"daily": {"daylight_duration": [30000]}}
+            return combined
+        
+        with patch('services.upstream.get_json', side_effect=get_json) as mock_get:
+            solar_service.prefetch_daylight(47.37, 8.54, utc_offset=0)
+            weather = weather_service.fetch_daily_weather(47.37, 8.54)
+            result = solar_service.get_daylight_delta(47.37, 8.54, utc_offset=0,
+                                                      daylight=weather.get("daylight"))
+        
+        assert mock_get.call_count <= 2
+        if (today - solstice).days >= 8:
+            assert result["delta_solstice_sec"] == 6000
+    
     def test_is_good_weather(self):
         """Test weather classification."""
         from services.weather_service import _is_good_weather, _is_bad_weather
@@ -126,6 +528,1357 @@ class TestWeatherService:
         assert analysis["temp_trend"] == "stable"
 
 
+class TestForecast:
+    """Tests for the columnar forecast and its analysis."""
+    
+    def _daily(self, codes, temps, start="2024-01-15"):
+        first = datetime.strptime(start, "%Y-%m-%d")
+        return {
+            "time": [(first + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(len(codes))],
+            "weathercode": codes,
+            "temperature_2m_max": temps,
+            "temperature_2m_min": [0] * len(codes),
+            "precipitation_sum": [0] * len(codes),
+            "precipitation_probability_max": [0] * len(codes),
+        }
+    
+    def test_rows_view(self):
+        """The dict view carries the same fields the narrative engine reads."""
+        from services.forecast import Forecast
+        forecast = Forecast.from_daily(self._daily([0, 61, None], [10, None, 12]))
+        rows = forecast.rows()
+        
+        assert len(rows) == 3
+        assert rows[0]["date"] == datetime(2024, 1, 15)
+        assert rows[0]["weekday"] == "Monday" and rows[0]["weekday_short"] == "Mon"
+        assert rows[0]["is_good"] and not rows[0]["is_bad"]
+        assert rows[1]["is_bad"] and rows[1]["temp_max"] is None
+        assert rows[2]["code"] is None and not rows[2]["is_good"]
+    
+    def test_analysis_patterns(self):
+        """Streaks, next change of weather and weekend outlook."""
+        from services.forecast import Forecast, analyze
+        # Monday to Sunday: rain, rain, sun, sun, sun, sun, sun
+        analysis = analyze(Forecast.from_daily(
+            self._daily([61, 63, 0, 1, 2, 0, 0], [5, 5, 6, 10, 11, 12, 13])))
+        
+        assert analysis["bad_streak_length"] == 2
+        assert analysis["next_good_day"] == "Wednesday"
+        assert analysis["next_good_day_index"] == 2
+        assert analysis["weekend_outlook"] == "good"
+        assert analysis["week_character"] == "mostly_good"
+        assert analysis["temp_trend"] == "warming_strong"
+    
+    def test_analyze_many_matches_single(self):
+        """Analysing several locations at once gives each location's own result."""
+        from services.forecast import Forecast, analyze, analyze_many
+        forecasts = [
+            Forecast.from_daily(self._daily([0] * 7, [15] * 7)),
+            Forecast.from_daily(self._daily([61, 0, 3], [18, 12, 9], start="2024-01-19")),
+            Forecast.from_daily(self._daily([], [])),
+        ]
+        
+        results = analyze_many(forecasts)
+        assert results == [analyze(f) for f in forecasts]
+        assert results[0]["good_streak_length"] == 7
+        assert results[1]["next_good_day"] == "Saturday"
+        assert results[2] == {}
+    
+    def test_entry_keeps_its_analysis(self):
+        """A cache hit rebuilds the analysis dict without running the analysis again."""
+        from services import weather_service
+        from services.forecast import Forecast, analyze
+        forecast = Forecast.from_daily(self._daily([61, 63, 0, 1, 2, 0, 0], [5, 5, 6, 10, 11, 12, 13]))
+        entry = weather_service.WeatherEntry(forecast, 3600)
+        
+        with patch.object(weather_service, 'analyze') as mock_analyze:
+            result = entry.as_dict()
+        mock_analyze.assert_not_called()
+        assert result["analysis"] == analyze(forecast)
+        assert weather_service.WeatherEntry(Forecast.from_daily({})).as_dict()["analysis"] == {}
+
+
+class TestEntryFootprint:
+    """tracemalloc measurements of what one cached location costs."""
+    
+    def _bytes_per_call(self, fn, count):
+        import tracemalloc
+        tracemalloc.start()
+        try:
+            before = tracemalloc.take_snapshot()
+            for i in range(count):
+                fn(i)
+            after = tracemalloc.take_snapshot()
+        finally:
+            tracemalloc.stop()
+        return sum(stat.size_diff for stat in after.compare_to(before, "filename")) / count
+    
+    def test_weather_entry_bytes(self):
+        """A cached forecast cell stays well under the old dict-of-dicts size (~5.5 KB)."""
+        from services import weather_service
+        weather_service._cache.clear()
+        daily = TestForecast()._daily([0, 3, 61, 71, 2, 1, 0],
+                                      [10.5, 12.1, 9.8, -1.2, 3.4, 7.7, 8.8])
+        
+        with patch('services.upstream.get_json', return_value={"daily": daily}):
+            per_location = self._bytes_per_call(
+                lambda i: weather_service.fetch_daily_weather(30 + i * 0.1, 8.55), 100)
+        
+        assert len(weather_service._cache) == 100
+        assert per_location < 2500
+    
+    def test_solar_window_bytes(self):
+        """A cached latitude band window is one small packed record (was ~690 B)."""
+        from services import solar_service
+        solar_service._cache.clear()
+        today = date(2024, 3, 1)
+        
+        def store(i):
+            days = [40000.0 + i + d * 120.5 for d in range(8)]
+            window = solar_service._DaylightWindow(today, days, date(2023, 12, 22), 30000.0 + i, 3.5)
+            solar_service._cache.set(f"solar_lat_{i / 10:.1f}", window)
+        
+        per_band = self._bytes_per_call(store, 100)
+        
+        assert len(solar_service._cache) == 100
+        assert per_band < 450
+
+
+class TestCache:
+    """Tests for the shared cache module."""
+    
+    def test_ttl_expiry(self):
+        """Entries disappear once their TTL has passed."""
+        from services.cache import TTLCache
+        
+        cache = TTLCache("test", ttl=60)
+        cache.set("a", 1)
+        assert cache.get("a") == 1
+        
+        with patch('services.cache.time.time', return_value=time.time() + 61):
+            assert cache.get("a") is None
+        assert len(cache) == 0
+    
+    def test_lru_eviction_by_count(self):
+        """Least recently used entries are evicted beyond max_entries."""
+        from services.cache import TTLCache
+        
+        cache = TTLCache("test", max_entries=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")  # touch a, so b is the LRU entry
+        cache.set("c", 3)
+        
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+        assert cache.get("c") == 3
+    
+    def test_eviction_by_bytes(self):
+        """Byte budget bounds the cache regardless of entry count."""
+        from services.cache import TTLCache
+        
+        cache = TTLCache("test", max_entries=1000, max_bytes=20000)
+        for i in range(100):
+            cache.set(i, "x" * 1000)
+        
+        stats = cache.stats()
+        assert stats["bytes"] <= 20000
+        assert 0 < stats["entries"] < 100
+        assert cache.get(99) is not None
+    
+    def test_expired_entries_swept_without_reads(self):
+        """Writes periodically drop expired entries that are never read again."""
+        from services.cache import TTLCache
+        
+        cache = TTLCache("test", ttl=1)
+        for i in range(10):
+            cache.set(i, i)
+        
+        later = time.time() + 120
+        with patch('services.cache.time.time', return_value=later):
+            cache.set("fresh", 1)
+        assert len(cache) == 1
+    
+    def test_thread_safety(self):
+        """Concurrent writers keep the cache within its bounds."""
+        import threading
+        from services.cache import TTLCache
+        
+        cache = TTLCache("test", max_entries=50)
+        
+        def writer(offset):
+            for i in range(500):
+                cache.set(offset + i, i)
+                cache.get(offset + i // 2)
+        
+        threads = [threading.Thread(target=writer, args=(n * 1000,)) for n in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        
+        assert len(cache) == 50
+        assert cache.stats()["bytes"] == sum(e.size for e in cache._data.values())
+
+
+class TestStaleWhileRevalidate:
+    """Tests for stale-while-revalidate serving."""
+    
+    def test_stale_entry_within_grace(self):
+        """Expired entries are served stale within grace, dropped after it."""
+        from services.cache import TTLCache, STALE
+        
+        cache = TTLCache("test", ttl=10, grace=30)
+        cache.set("k", "v")
+        now = time.time()
+        
+        with patch('services.cache.time.time', return_value=now + 20):
+            assert cache.get("k") is None  # plain get never returns stale
+            assert cache.lookup("k") == ("v", STALE)
+        with patch('services.cache.time.time', return_value=now + 41):
+            assert cache.lookup("k") is None
+    
+    def test_cached_call_serves_stale_and_refreshes(self):
+        """A stale hit returns at once and refreshes in the background."""
+        from services.cache import TTLCache, cached_call
+        from services.singleflight import SingleFlight
+        
+        cache = TTLCache("test", ttl=10, grace=30)
+        flight = SingleFlight("test")
+        loader = MagicMock(side_effect=["old", "new"])
+        
+        assert cached_call(cache, flight, "k", loader) == "old"
+        with patch('services.cache.time.time', return_value=time.time() + 20):
+            assert cached_call(cache, flight, "k", loader) == "old"
+            for _ in range(200):
+                if cache.get("k") == "new":
+                    break
+                time.sleep(0.01)
+            assert cache.get("k") == "new"
+        
+        assert loader.call_count == 2
+    
+    def test_flight_rechecks_cache(self):
+        """A miss that reaches the flight after the value was stored does not load again."""
+        from services.cache import TTLCache, _load_and_store
+        
+        cache = TTLCache("test", ttl=10, grace=30)
+        cache.set("k", "v")
+        loader = MagicMock(return_value="other")
+        assert _load_and_store(cache, "k", loader, (), None) == "v"
+        # A refresh stands down only once its entry has been replaced
+        assert _load_and_store(cache, "k", loader, (), None, seen="old") == "v"
+        loader.assert_not_called()
+        assert _load_and_store(cache, "k", loader, (), None, seen="v") == "other"
+        assert loader.call_count == 1
+    
+    def test_hot_keys_refresh_early(self):
+        """Hot entries near expiry are picked for early refresh."""
+        from services.cache import TTLCache, FRESH, REFRESH
+        
+        cache = TTLCache("test", ttl=10, grace=30)
+        cache.set("k", "v", delta=2.0)
+        cache.lookup("k")
+        cache.lookup("k")
+        
+        # 9 s in, a 2 s load time makes an early refresh very likely
+        with patch('services.cache.time.time', return_value=time.time() + 9.5), \
+             patch('services.cache.random.random', return_value=0.9):
+            assert cache.lookup("k") == ("v", REFRESH)
+        # A cold entry is never refreshed early
+        cache.set("cold", "v", delta=2.0)
+        with patch('services.cache.time.time', return_value=time.time() + 9.5), \
+             patch('services.cache.random.random', return_value=0.9):
+            assert cache.lookup("cold") == ("v", FRESH)
+    
+    def test_solar_serves_yesterdays_window_when_upstream(self, config_override):
+        """With an upstream provider, rollover serves the old window at once."""
+        from services import solar_service
+        solar_service._cache.clear()
+        window = solar_service._build_window(47.35, 47.35, 8.54, date(2024, 3, 20))
+        config_override(SOLAR_PROVIDER='upstream')
+        solar_service._cache.set("solar_cell_47.3500_2024-03-20", window)
+        
+        with patch.object(solar_service, 'refresh_in_background') as mock_refresh:
+            band = solar_service._get_daylight_band(47.37, 8.54, date(2024, 3, 21))
+        
+        assert mock_refresh.call_count == 1
+        assert band == window.band()
+
+
+class TestExpiry:
+    """Tests for data-aware cache lifetimes."""
+    
+    def test_seconds_until_local_midnight(self):
+        """Midnight is computed in the location's local time."""
+        from datetime import timezone
+        from services.expiry import seconds_until_local_midnight
+        
+        now = datetime(2024, 3, 21, 20, 0, tzinfo=timezone.utc)
+        assert seconds_until_local_midnight(0, now) == 4 * 3600
+        assert seconds_until_local_midnight(3600, now) == 3 * 3600
+        # UTC+9 is already at 05:00 the next day
+        assert seconds_until_local_midnight(9 * 3600, now) == 19 * 3600
+    
+    def test_seconds_until_model_update(self, config_override):
+        """The next model update follows the run cadence plus availability delay."""
+        from datetime import timezone
+        from services.expiry import seconds_until_model_update
+        config_override(WEATHER_MODEL_UPDATE_HOURS=6, WEATHER_MODEL_UPDATE_DELAY_MIN=30)
+        
+        assert seconds_until_model_update(datetime(2024, 3, 21, 0, 15, tzinfo=timezone.utc)) == 15 * 60
+        assert seconds_until_model_update(datetime(2024, 3, 21, 0, 30, tzinfo=timezone.utc)) == 6 * 3600
+        assert seconds_until_model_update(datetime(2024, 3, 21, 22, 0, tzinfo=timezone.utc)) == 2.5 * 3600
+    
+    def test_semantic_ttl_picks_earliest_boundary(self, config_override):
+        """The TTL ends at whichever boundary comes first, never below the minimum."""
+        from datetime import timezone
+        from services.expiry import semantic_ttl
+        config_override(WEATHER_MODEL_UPDATE_HOURS=6, WEATHER_MODEL_UPDATE_DELAY_MIN=30)
+        now = datetime(2024, 3, 21, 23, 0, tzinfo=timezone.utc)
+        
+        assert semantic_ttl(now=now) is None
+        assert semantic_ttl(0, now=now) == 3600
+        assert semantic_ttl(0, model_bound=True, now=now) == 3600
+        assert semantic_ttl(-3 * 3600, model_bound=True, now=now) == 1.5 * 3600
+        assert semantic_ttl(0, now=datetime(2024, 3, 21, 23, 59, 59, tzinfo=timezone.utc)) == 60
+    
+    def test_weather_entry_expires_at_semantic_boundary(self):
+        """Weather entries take their lifetime from the response's timezone."""
+        from services import weather_service
+        weather_service._cache.clear()
+        
+        response = {
+            "utc_offset_seconds": 3600,
+            "daily": {"time": ["2024-01-15"], "weathercode": [0],
+                      "temperature_2m_max": [10], "temperature_2m_min": [2],
+                      "precipitation_sum": [0], "precipitation_probability_max": [0]}
+        }
+        with patch('services.upstream.get_json', return_value=response), \
+             patch('services.weather_service.semantic_ttl', return_value=1234) as mock_ttl, \
+             patch.object(weather_service._cache, 'set') as mock_set:
+            weather_service.fetch_daily_weather(47.37, 8.54)
+        
+        mock_ttl.assert_called_once_with(3600, model_bound=True)
+        assert mock_set.call_args.kwargs["ttl"] == 1234
+    
+    def test_weather_ttl_falls_back_without_timezone(self, config_override):
+        """Without a timezone the fixed weather TTL caps the lifetime."""
+        from services import weather_service
+        config_override(CACHE_TTL_WEATHER=300)
+        entry = weather_service.WeatherEntry(Forecast.from_daily({}))
+        
+        with patch('services.weather_service.semantic_ttl', return_value=1234):
+            assert weather_service._weather_ttl(entry) == 300
+            assert weather_service._weather_ttl(entry, day=date.today() + timedelta(days=1)) == 300
+
+
+class TestPrewarm:
+    """Tests for midnight pre-warming and jittered expiry."""
+    
+    def test_expiry_jitter_only_shortens(self):
+        """Jittered lifetimes spread below the TTL, never above it."""
+        from services.cache import TTLCache
+        
+        cache = TTLCache("test", ttl=1000, jitter=0.2)
+        now = time.time()
+        for i in range(50):
+            cache.set(i, "v")
+        expiries = [cache._data[i].expires_at - now for i in range(50)]
+        assert all(790 <= e <= 1001 for e in expiries)
+        assert len({round(e) for e in expiries}) > 1
+    
+    def test_hot_locations_ranked_by_hits(self):
+        """The most requested grid cells come first, with their known offset."""
+        from services import prewarm
+        prewarm._hot.clear()
+        
+        prewarm.record(47.37, 8.54, 3600)
+        prewarm.record(40.71, -74.01)
+        prewarm.record(40.71, -74.01, -18000)
+        
+        assert prewarm.hot_locations() == [(40.75, -74.05, -18000), (47.35, 8.55, 3600)]
+        assert prewarm.hot_locations(1) == [(40.75, -74.05, -18000)]
+        prewarm._hot.clear()
+    
+    def test_prewarmed_entry_fresh_after_midnight(self):
+        """A pre-warmed entry covers the day it is keyed under, past the midnight it was warmed for."""
+        from datetime import timedelta
+        from services import prewarm, weather_service
+        from services.cache import FRESH
+        prewarm._hot.clear()
+        weather_service._cache.clear()
+        prewarm.record(51.5, 0.0, 0)
+        day = date.today() + timedelta(days=1)
+        midnight = datetime.combine(day, datetime.min.time()).timestamp()
+        
+        with patch.object(weather_service, '_fetch_weather',
+                          return_value=weather_service.WeatherEntry(Forecast.from_daily({}), 0)):
+            assert prewarm.prewarm(day) == 1
+        
+        lat, lon = weather_service.grid_cell(51.5, 0.0)
+        key = f"weather_{lat:.4f}_{lon:.4f}_{day}"
+        with patch('services.cache.time.time', return_value=midnight + 60):
+            found = weather_service._cache.lookup(key)
+        assert found is not None and found[1] == FRESH
+    
+    def test_prewarm_fills_tomorrows_key(self):
+        """Tomorrow's entry is fetched from the location's date at server midnight."""
+        from datetime import timedelta
+        from services import prewarm, weather_service
+        prewarm._hot.clear()
+        weather_service._cache.clear()
+        
+        # Far enough east that it is already tomorrow there at server midnight
+        prewarm.record(35.68, 139.69, 14 * 3600)
+        day = date.today() + timedelta(days=1)
+        with patch.object(weather_service, '_fetch_weather',
+                          return_value=weather_service.WeatherEntry(Forecast.from_daily({}))) as mock_fetch:
+            assert prewarm.prewarm(day) == 1
+        
+        lat, lon, days, start = mock_fetch.call_args[0]
+        assert (lat, lon, days) == (35.65, 139.65, 7)
+        assert start >= day
+        # Served from the warmed entry
+        assert weather_service.fetch_daily_weather(35.68, 139.69, day=day)["forecast"] == []
+        assert mock_fetch.call_count == 1
+        assert prewarm.hot_locations() == []
+    
+    def test_seconds_until_prewarm(self, config_override):
+        """The job wakes PREWARM_LEAD_MIN minutes before server midnight."""
+        from services.prewarm import seconds_until_prewarm
+        config_override(PREWARM_LEAD_MIN=10)
+        
+        assert seconds_until_prewarm(datetime(2024, 3, 21, 23, 0)) == 50 * 60
+        assert seconds_until_prewarm(datetime(2024, 3, 21, 23, 55)) == 0
+
+
+class TestSingleFlight:
+    """Tests for single-flight request coalescing."""
+    
+    def _run_concurrently(self, fn, n=8):
+        import threading
+        results, errors = [], []
+        
+        def call():
+            try:
+                results.append(fn())
+            except Exception as e:
+                errors.append(e)
+        
+        threads = [threading.Thread(target=call) for _ in range(n)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return results, errors
+    
+    def test_concurrent_calls_share_one_execution(self):
+        """Only one call per key runs; the others get its result."""
+        import threading
+        from services.singleflight import SingleFlight
+        
+        flight = SingleFlight("test")
+        release = threading.Event()
+        calls = []
+        
+        def slow():
+            calls.append(1)
+            release.wait(2)
+            return "value"
+        
+        timer = threading.Timer(0.2, release.set)
+        timer.start()
+        results, errors = self._run_concurrently(lambda: flight.do("k", slow))
+        
+        assert len(calls) == 1
+        assert results == ["value"] * 8
+        assert not errors
+        assert not flight.in_flight("k")
+    
+    def test_errors_are_shared(self):
+        """Waiters see the leader's exception instead of retrying upstream."""
+        import threading
+        from services.singleflight import SingleFlight
+        
+        flight = SingleFlight("test")
+        calls = []
+        
+        def failing():
+            calls.append(1)
+            time.sleep(0.2)
+            raise RuntimeError("upstream down")
+        
+        results, errors = self._run_concurrently(lambda: flight.do("k", failing))
+        assert len(calls) == 1
+        assert len(errors) == 8
+        assert all(isinstance(e, RuntimeError) for e in errors)
+    
+    def test_weather_misses_coalesce(self):
+        """Concurrent weather misses for one cell make a single upstream call."""
+        from services import weather_service
+        weather_service._cache.clear()
+        
+        def slow_get(*args, **kwargs):
+            time.sleep(0.2)
+            return {
+                "daily": {"time": ["2024-01-15"], "weathercode": [0],
+                          "temperature_2m_max": [10], "temperature_2m_min": [2],
+                          "precipitation_sum": [0], "precipitation_probability_max": [0]}
+            }
+        
+        with patch('services.upstream.get_json', side_effect=slow_get) as mock_get:
+            results, errors = self._run_concurrently(
+                lambda: weather_service.fetch_daily_weather(47.37, 8.54))
+        
+        assert mock_get.call_count == 1
+        assert all(r["today"]["code"] == 0 for r in results)
+
+
+class TestUpstream:
+    """Tests for the shared upstream HTTP client."""
+    
+    def _response(self, status=200, data=None):
+        import requests
+        response = MagicMock()
+        response.status_code = status
+        response.json.return_value = data
+        if status >= 400:
+            response.raise_for_status.side_effect = requests.exceptions.HTTPError(response=response)
+        return response
+    
+    def test_session_is_shared(self):
+        """Every caller reuses one pooled session."""
+        from services import upstream
+        assert upstream.get_session() is upstream.get_session()
+    
+    def test_retries_server_errors_with_backoff(self):
+        """5xx responses are retried after a jittered, growing backoff."""
+        from services import upstream
+        from services.metrics import get_metrics
+        get_metrics().reset()
+        
+        responses = [self._response(503), self._response(200, {"ok": 1})]
+        with patch.object(upstream.get_session(), 'get', side_effect=responses) as mock_get, \
+             patch('services.upstream.time.sleep') as mock_sleep:
+            assert upstream.get_json("https://api.example.com/v1/x", {}) == {"ok": 1}
+        
+        assert mock_get.call_count == 2
+        assert 0 <= mock_sleep.call_args[0][0] <= 0.2
+        snapshot = get_metrics().snapshot()
+        assert snapshot["counters"]["upstream.api.example.com.errors"] == 1
+        assert snapshot["counters"]["upstream.api.example.com.retries"] == 1
+        assert snapshot["timings"]["upstream.api.example.com.latency_ms"]["count"] == 2
+    
+    def test_client_errors_fail_fast(self):
+        """4xx responses other than 429 are not retried."""
+        from services import upstream
+        
+        with patch.object(upstream.get_session(), 'get', return_value=self._response(404)) as mock_get, \
+             patch('services.upstream.time.sleep') as mock_sleep:
+            assert upstream.get_json("https://api.example.com/v1/x", {}) is None
+        
+        assert mock_get.call_count == 1
+        assert mock_sleep.call_count == 0
+    
+    def _slow_then_fast(self, calls):
+        def get(*args, **kwargs):
+            calls.append(1)
+            if len(calls) == 1:
+                time.sleep(0.5)
+                return self._response(200, {"from": "slow"})
+            return self._response(200, {"from": "hedge"})
+        return get
+    
+    def test_hedge_takes_the_faster_response(self, config_override):
+        """A request slower than the latency percentile is hedged; the first answer wins."""
+        from services import upstream
+        from services.metrics import get_metrics
+        config_override(UPSTREAM_HEDGE=True, UPSTREAM_HEDGE_MAX_RATIO=1.0)
+        metrics = get_metrics()
+        metrics.reset()
+        for _ in range(20):
+            metrics.observe("upstream.api.example.com.latency_ms", 20)
+        
+        calls = []
+        with patch.object(upstream, '_hedge_budget', upstream._HedgeBudget()), \
+             patch.object(upstream.get_session(), 'get', side_effect=self._slow_then_fast(calls)):
+            started = time.perf_counter()
+            data = upstream.get_json("https://api.example.com/v1/x", {})
+            elapsed = time.perf_counter() - started
+        
+        assert data == {"from": "hedge"}
+        assert elapsed < 0.4
+        counters = metrics.snapshot()["counters"]
+        assert counters["upstream.api.example.com.hedges"] == 1
+        assert counters["upstream.api.example.com.hedge_wins"] == 1
+    
+    def test_hedges_capped_by_ratio(self, config_override):
+        """With the hedge budget spent, slow requests are simply waited for."""
+        from services import upstream
+        from services.metrics import get_metrics
+        config_override(UPSTREAM_HEDGE=True, UPSTREAM_HEDGE_MAX_RATIO=0.0)
+        metrics = get_metrics()
+        metrics.reset()
+        for _ in range(20):
+            metrics.observe("upstream.api.example.com.latency_ms", 20)
+        
+        calls = []
+        with patch.object(upstream, '_hedge_budget', upstream._HedgeBudget()), \
+             patch.object(upstream.get_session(), 'get', side_effect=self._slow_then_fast(calls)):
+            data = upstream.get_json("https://api.example.com/v1/x", {})
+        
+        assert data == {"from": "slow"}
+        assert len(calls) == 1
+    
+    def test_no_hedge_without_latency_history(self, config_override):
+        """Hedging waits until enough latency samples exist to pick a delay."""
+        from services import upstream
+        from services.metrics import get_metrics
+        config_override(UPSTREAM_HEDGE=True, UPSTREAM_HEDGE_MAX_RATIO=1.0)
+        get_metrics().reset()
+        
+        assert upstream._hedge_delay("api.example.com") is None
+    
+    def test_backoff_is_capped(self, config_override):
+        """Backoff grows exponentially up to UPSTREAM_BACKOFF_MAX."""
+        from services.upstream import _backoff
+        config_override(UPSTREAM_BACKOFF_BASE=0.5, UPSTREAM_BACKOFF_MAX=1.0)
+        
+        with patch('services.upstream.random.uniform', side_effect=lambda a, b: b):
+            assert [_backoff(i) for i in range(4)] == [0.5, 1.0, 1.0, 1.0]
+
+
+class TestDeadline:
+    """Tests for request-wide deadline propagation."""
+    
+    def test_budget_shrinks_and_nests(self):
+        """Timeouts shrink to the remaining budget; inner budgets never extend outer ones."""
+        from services import deadline
+        
+        assert deadline.remaining() is None
+        assert deadline.bounded(8) == 8
+        with deadline.deadline(1.0):
+            assert 0.9 < deadline.bounded(8) <= 1.0
+            with deadline.deadline(5.0):
+                assert deadline.remaining() <= 1.0
+        assert deadline.remaining() is None
+    
+    def test_upstream_attempts_respect_deadline(self):
+        """Attempts get the remaining budget; once it is spent the call raises."""
+        from services import deadline, upstream
+        
+        response = MagicMock()
+        response.json.return_value = {"ok": 1}
+        with patch.object(upstream.get_session(), 'get', return_value=response) as mock_get:
+            with deadline.deadline(1.0):
+                upstream.get_json("https://api.example.com/v1/x", {})
+            assert mock_get.call_args.kwargs["timeout"] <= 1.0
+            
+            with deadline.deadline(0), pytest.raises(deadline.DeadlineExceeded):
+                upstream.get_json("https://api.example.com/v1/x", {})
+            assert mock_get.call_count == 1
+    
+    def test_timeout_cut_by_budget_raises(self):
+        """A timeout caused by the shrunk budget is not counted against the host."""
+        import requests
+        from services import deadline, upstream
+        from services.circuit_breaker import get_breaker, CLOSED
+        
+        with patch.object(upstream.get_session(), 'get',
+                          side_effect=requests.exceptions.Timeout("slow")) as mock_get:
+            with deadline.deadline(0.5), pytest.raises(deadline.DeadlineExceeded):
+                upstream.get_json("https://slow.example.com/v1/x", {})
+        assert mock_get.call_count == 1
+        assert get_breaker("slow.example.com").state == CLOSED
+    
+    def test_deadline_cut_load_not_negative_cached(self):
+        """A weather load cut short by one request's budget leaves nothing behind."""
+        from services import deadline, weather_service
+        weather_service._cache.clear()
+        daily = TestForecast()._daily([0, 3], [10, 12])
+        
+        with patch('services.upstream.get_json',
+                   side_effect=[deadline.DeadlineExceeded("x"), {"daily": daily}]) as mock_get:
+            with deadline.deadline(1.0), pytest.raises(deadline.DeadlineExceeded):
+                weather_service.fetch_daily_weather(47.37, 8.54)
+            # The next request, with a full budget, goes upstream again
+            result = weather_service.fetch_daily_weather(47.37, 8.54)
+        
+        assert mock_get.call_count == 2
+        assert result["today"]["code"] == 0
+    
+    def test_deadline_cut_search_not_negative_cached(self, client):
+        """Geocoding that ran out of time is retried by the next request."""
+        from services import deadline
+        data = {"results": [{"name": "Zurich"}]}
+        
+        with patch('services.upstream.get_json',
+                   side_effect=[deadline.DeadlineExceeded("x"), data]) as mock_get:
+            assert client.get('/api/search?q=Deadlinetown').get_json() == []
+            assert client.get('/api/search?q=Deadlinetown').get_json() == [{"name": "Zurich"}]
+        assert mock_get.call_count == 2
+    
+    def test_pool_work_runs_without_deadline(self):
+        """Work on the I/O pool does not inherit the submitting request's deadline."""
+        from services import deadline, io_pool
+        
+        with deadline.deadline(5.0):
+            assert io_pool.submit_background(deadline.remaining).result() is None
+    
+    def test_singleflight_waiter_gives_up_at_deadline(self):
+        """A waiter stops waiting at its own deadline while the call carries on."""
+        import threading
+        from services import deadline
+        from services.singleflight import SingleFlight
+        
+        flight = SingleFlight("test")
+        release = threading.Event()
+        leader = threading.Thread(target=flight.do, args=("k", release.wait, 2))
+        leader.start()
+        while not flight.in_flight("k"):
+            time.sleep(0.01)
+        
+        with deadline.deadline(0.1), pytest.raises(deadline.DeadlineExceeded):
+            flight.do("k", lambda: None)
+        release.set()
+        leader.join()
+    
+    def test_uplift_degrades_instead_of_overrunning(self):
+        """A slow forecast is dropped at the deadline; the response still renders."""
+        from services import deadline
+        from services.uplift_engine import generate_uplift_data
+        
+        def slow_weather(*args, **kwargs):
+            time.sleep(1.0)
+            return {}
+        
+        with patch('services.uplift_engine.fetch_daily_weather', side_effect=slow_weather):
+            started = time.perf_counter()
+            with deadline.deadline(0.2):
+                result = generate_uplift_data(47.37, 8.54, "Zurich")
+            elapsed = time.perf_counter() - started
+        
+        assert elapsed < 0.8
+        assert result["text"]
+    
+    def test_abandoned_weather_fetch_fills_cache(self):
+        """The weather fetch outlives the request that gave up on it."""
+        from services import deadline, weather_service
+        from services.uplift_engine import generate_uplift_data
+        weather_service._cache.clear()
+        daily = TestForecast()._daily([0, 3], [10, 12])
+        
+        def slow_get_json(url, params):
+            time.sleep(0.4)
+            return {"daily": daily}
+        
+        with patch('services.upstream.get_json', side_effect=slow_get_json) as mock_get:
+            with deadline.deadline(0.1):
+                generate_uplift_data(47.37, 8.54, "Zurich")
+            time.sleep(0.6)
+            weather = weather_service.fetch_daily_weather(47.37, 8.54)
+        
+        assert mock_get.call_count == 1
+        assert weather["today"]["code"] == 0
+
+
+class TestCircuitBreaker:
+    """Tests for per-host circuit breaking and negative caching."""
+    
+    def test_breaker_opens_and_probes(self):
+        """Consecutive failures open the circuit; after the reset time one probe goes out."""
+        from services.circuit_breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+        
+        breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=10)
+        breaker.record_failure()
+        assert breaker.state == CLOSED
+        breaker.record_failure()
+        assert breaker.state == OPEN
+        assert not breaker.allow()
+        
+        with patch('services.circuit_breaker.time.monotonic', return_value=time.monotonic() + 11):
+            assert breaker.state == HALF_OPEN
+            assert breaker.allow()
+            assert not breaker.allow()  # one probe at a time
+            breaker.record_success()
+            assert breaker.state == CLOSED
+    
+    def test_failed_probe_reopens(self):
+        """A failing half-open probe re-opens the circuit at once."""
+        from services.circuit_breaker import CircuitBreaker, OPEN
+        
+        breaker = CircuitBreaker("test", failure_threshold=5, reset_timeout=10)
+        for _ in range(5):
+            breaker.record_failure()
+        with patch('services.circuit_breaker.time.monotonic', return_value=time.monotonic() + 11):
+            assert breaker.allow()
+            breaker.record_failure()
+            assert breaker.state == OPEN
+    
+    def test_open_circuit_fails_fast(self, config_override):
+        """Once a host's circuit is open, calls return without touching the network."""
+        import requests
+        from services import upstream
+        config_override(CIRCUIT_FAILURE_THRESHOLD=3)
+        
+        with patch.object(upstream.get_session(), 'get',
+                          side_effect=requests.exceptions.ConnectionError) as mock_get, \
+             patch('services.upstream.time.sleep'):
+            assert upstream.get_json("https://down.example.com/x", {}) is None
+            assert upstream.get_json("https://down.example.com/x", {}) is None
+        
+        assert mock_get.call_count == 3
+    
+    def test_deadline_cut_attempts_do_not_reset_failures(self, config_override):
+        """Timeouts cut by the request deadline leave the failure count alone."""
+        import requests
+        from services import deadline, upstream
+        from services.circuit_breaker import get_breaker, CLOSED, OPEN
+        config_override(CIRCUIT_FAILURE_THRESHOLD=3, API_MAX_RETRIES=1)
+        breaker = get_breaker("flaky.example.com")
+        
+        with patch.object(upstream.get_session(), 'get') as mock_get:
+            for _ in range(2):
+                mock_get.side_effect = requests.exceptions.ConnectionError
+                assert upstream.get_json("https://flaky.example.com/x", {}) is None
+                mock_get.side_effect = requests.exceptions.Timeout("slow")
+                with deadline.deadline(0.5), pytest.raises(deadline.DeadlineExceeded):
+                    upstream.get_json("https://flaky.example.com/x", {})
+                assert breaker.state == CLOSED
+            mock_get.side_effect = requests.exceptions.ConnectionError
+            assert upstream.get_json("https://flaky.example.com/x", {}) is None
+        
+        assert breaker.state == OPEN
+    
+    def test_deadline_cut_probe_frees_half_open_slot(self):
+        """A probe cut by the deadline lets the next call probe instead."""
+        from services.circuit_breaker import CircuitBreaker, HALF_OPEN
+        
+        breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=10)
+        breaker.record_failure()
+        with patch('services.circuit_breaker.time.monotonic', return_value=time.monotonic() + 11):
+            assert breaker.allow()
+            breaker.release_probe()
+            assert breaker.state == HALF_OPEN
+            assert breaker.allow()
+    
+    def test_failed_loads_are_negatively_cached(self):
+        """A failing loader is not retried until the negative entry expires."""
+        from services.cache import TTLCache, cached_call
+        from services.singleflight import SingleFlight
+        
+        cache = TTLCache("test", ttl=100)
+        loader = MagicMock(return_value={})
+        flight = SingleFlight("test")
+        
+        assert cached_call(cache, flight, "k", loader) == {}
+        assert cached_call(cache, flight, "k", loader) == {}
+        assert loader.call_count == 1
+        
+        with patch('services.cache.time.time', return_value=time.time() + 31):
+            cached_call(cache, flight, "k", loader)
+        assert loader.call_count == 2
+    
+    def test_negative_entry_keeps_stale_value(self):
+        """A failed refresh never replaces a value that can still be served stale."""
+        from services.cache import TTLCache, STALE
+        
+        cache = TTLCache("test", ttl=10, grace=60)
+        cache.set("k", "good")
+        with patch('services.cache.time.time', return_value=time.time() + 20):
+            cache.set_negative("k", {}, 30)
+            assert cache.lookup("k") == ("good", STALE)
+    
+    def test_solar_falls_back_to_local_when_circuit_open(self, config_override):
+        """With the upstream circuit open, solar is computed locally."""
+        from services import solar_service, upstream
+        from services.circuit_breaker import get_breaker
+        config_override(SOLAR_PROVIDER='upstream')
+        solar_service._cache.clear()
+        
+        breaker = get_breaker("api.open-meteo.com")
+        for _ in range(breaker.failure_threshold):
+            breaker.record_failure()
+        
+        with patch.object(upstream.get_session(), 'get') as mock_get:
+            result = solar_service.get_daylight_delta(47.37, 8.54, utc_offset=3600)
+        
+        assert mock_get.call_count == 0
+        assert 8 * 3600 < result["day_len_sec"] < 16 * 3600
+
+
+class TestQuota:
+    """Tests for the upstream quota governor."""
+    
+    def test_lower_priorities_back_off_first(self, config_override):
+        """Batch stops at its reserve, prefetch at its own, interactive uses the rest."""
+        from services.quota import QuotaGovernor, INTERACTIVE, PREFETCH, BATCH
+        config_override(QUOTA_RESERVE_PREFETCH=0.2, QUOTA_RESERVE_BATCH=0.5)
+        
+        governor = QuotaGovernor(per_minute=0, per_day=10)
+        assert sum(governor.acquire(BATCH) for _ in range(10)) == 5
+        assert sum(governor.acquire(PREFETCH) for _ in range(10)) == 3
+        assert sum(governor.acquire(INTERACTIVE) for _ in range(10)) == 2
+    
+    def test_minute_budget_refills(self):
+        """The per-minute bucket refills continuously; remaining budget is a gauge."""
+        from services.quota import QuotaGovernor
+        from services.metrics import get_metrics
+        
+        governor = QuotaGovernor(per_minute=60, per_day=0)
+        assert all(governor.acquire() for _ in range(60))
+        assert not governor.acquire()
+        assert get_metrics().snapshot()["gauges"]["quota.remaining.minute"] == 0
+        
+        with patch('services.quota.time.monotonic', return_value=time.monotonic() + 2):
+            assert governor.remaining()["minute"] >= 1
+            assert governor.acquire()
+    
+    def test_day_budget_resets_at_utc_midnight(self):
+        """The daily budget does not refill during the day and starts over at UTC midnight."""
+        from services.quota import QuotaGovernor
+        noon = datetime(2024, 3, 1, 12, 0, tzinfo=timezone.utc).timestamp()
+        governor = QuotaGovernor(per_minute=0, per_day=3, backend=None)
+        
+        with patch('services.quota.time.time', return_value=noon):
+            assert all(governor.acquire() for _ in range(3))
+            assert not governor.acquire()
+        with patch('services.quota.time.time', return_value=noon + 11.9 * 3600):
+            assert not governor.acquire()
+            assert governor.remaining() == {"day": 0}
+        with patch('services.quota.time.time', return_value=noon + 12 * 3600 + 1):
+            assert governor.remaining() == {"day": 3}
+            assert governor.acquire()
+    
+    def test_workers_share_day_budget(self):
+        """Governors counting in one backend spend from one daily budget."""
+        from services.cache_backends import MemoryBackend
+        from services.quota import QuotaGovernor
+        backend = MemoryBackend()
+        first = QuotaGovernor(per_minute=0, per_day=4, backend=backend)
+        second = QuotaGovernor(per_minute=60, per_day=4, backend=backend)
+        
+        assert all(first.acquire() for _ in range(3))
+        assert second.acquire()
+        assert not second.acquire() and not first.acquire()
+        assert second.remaining() == {"minute": 59, "day": 0}
+        
+        first.refund()
+        assert second.remaining()["day"] == 1
+    
+    def test_priority_follows_context(self):
+        """Background refreshes run at prefetch priority."""
+        from services import quota
+        from services.cache import refresh_in_background
+        from services.singleflight import SingleFlight
+        
+        assert quota.current_priority() == quota.INTERACTIVE
+        seen = []
+        refresh_in_background(SingleFlight("test"), "k", lambda: seen.append(quota.current_priority()))
+        for _ in range(100):
+            if seen:
+                break
+            time.sleep(0.01)
+        assert seen == [quota.PREFETCH]
+    
+    def test_upstream_denied_without_quota(self):
+        """Once the quota is spent, calls fail fast without going out."""
+        from services import upstream
+        from services.quota import QuotaGovernor
+        
+        with patch('services.upstream.get_governor', return_value=QuotaGovernor(per_minute=0, per_day=1)), \
+             patch.object(upstream.get_session(), 'get') as mock_get:
+            mock_get.return_value.json.return_value = {"ok": 1}
+            assert upstream.get_json("https://api.example.com/v1/x", {}) == {"ok": 1}
+            assert upstream.get_json("https://api.example.com/v1/x", {}) is None
+        
+        assert mock_get.call_count == 1
+
+
+class TestCacheBackends:
+    """Tests for the shared L2 cache backends and L1/L2 tiering."""
+    
+    @pytest.fixture(params=["memory", "sqlite", "redis"])
+    def backend(self, request, tmp_path):
+        from services import cache_backends
+        if request.param == "memory":
+            return cache_backends.MemoryBackend()
+        if request.param == "sqlite":
+            return cache_backends.SQLiteBackend(str(tmp_path / "cache.sqlite3"))
+        return cache_backends.RedisBackend(request.getfixturevalue("resp_server"))
+    
+    def test_round_trip_and_expiry(self, backend):
+        """Records come back with their horizons and vanish after the grace window."""
+        now = time.time()
+        backend.set("weather:a", b"payload", now + 60, now + 120)
+        backend.set("weather:gone", b"old", now - 10, now - 1)
+        backend.set("solar:b", b"forever")
+        
+        assert backend.get("weather:a") == (b"payload", now + 60, now + 120)
+        assert backend.get("weather:gone") is None
+        assert backend.get("solar:b") == (b"forever", None, None)
+        
+        backend.delete("weather:a")
+        assert backend.get("weather:a") is None
+    
+    def test_clear_by_prefix(self, backend):
+        """Clearing a namespace leaves the others alone."""
+        backend.set("weather:a", b"1")
+        backend.set("weather:b", b"2")
+        backend.set("geo:a", b"3")
+        
+        backend.clear("weather:")
+        
+        assert backend.get("weather:a") is None and backend.get("weather:b") is None
+        assert backend.get("geo:a") == (b"3", None, None)
+    
+    def test_counters(self, backend):
+        """Counters add atomically and start over once expired."""
+        now = time.time()
+        assert backend.incr("quota:a", 1, now + 60) == 1
+        assert backend.incr("quota:a", 2, now + 60) == 3
+        assert backend.incr("quota:a", -1) == 2
+        assert backend.incr("quota:a", 0) == 2
+        
+        backend.incr("quota:old", 5, now - 1)
+        assert backend.incr("quota:old", 1, now + 60) == 1
+    
+    def test_workers_share_entries(self, backend):
+        """A value one worker stored is an L2 hit for another worker's empty L1."""
+        from services.cache import FRESH, TTLCache
+        from services.metrics import get_metrics
+        worker_a = TTLCache("l2test", ttl=60, max_entries=2, backend=backend)
+        worker_b = TTLCache("l2test", ttl=60, max_entries=2, backend=backend)
+        worker_a.clear()
+        hits_before = get_metrics().snapshot()["counters"].get("cache.l2test.l2_hit", 0)
+        
+        worker_a.set("cell", {"forecast": [1, 2, 3]})
+        
+        assert worker_b.lookup("cell") == ({"forecast": [1, 2, 3]}, FRESH)
+        assert get_metrics().snapshot()["counters"]["cache.l2test.l2_hit"] == hits_before + 1
+        # Now in worker B's L1
+        assert worker_b.lookup("cell") == ({"forecast": [1, 2, 3]}, FRESH)
+        assert get_metrics().snapshot()["counters"]["cache.l2test.l2_hit"] == hits_before + 1
+    
+    def test_small_l1_backed_by_l2(self, backend):
+        """Entries evicted from a small L1 are still served from the L2."""
+        from services.cache import TTLCache
+        cache = TTLCache("l2small", ttl=60, max_entries=2, backend=backend)
+        cache.clear()
+        for i in range(5):
+            cache.set(f"k{i}", i)
+        
+        assert len(cache) == 2
+        assert [cache.get(f"k{i}") for i in range(5)] == [0, 1, 2, 3, 4]
+    
+    def test_weather_entries_survive_serialisation(self, backend):
+        """Packed weather entries round-trip through the L2."""
+        from services.cache import TTLCache
+        from services.weather_service import WeatherEntry
+        entry = WeatherEntry(Forecast.from_daily(TestForecast()._daily([0, 61], [5.5, 7.0])), 3600)
+        writer = TTLCache("l2weather", ttl=60, backend=backend)
+        reader = TTLCache("l2weather", ttl=60, backend=backend)
+        writer.clear()
+        
+        writer.set("cell", entry)
+        
+        assert reader.get("cell").as_dict() == entry.as_dict()
+    
+    def test_sqlite_shared_between_connections(self, tmp_path):
+        """Separate SQLite backends on one file (one per worker) see each other's writes."""
+        from services.cache_backends import SQLiteBackend
+        path = str(tmp_path / "shared.sqlite3")
+        first, second = SQLiteBackend(path), SQLiteBackend(path)
+        
+        first.set("geo:zurich", b"[]")
+        
+        assert second.get("geo:zurich") == (b"[]", None, None)
+        mode = second._connection().execute("PRAGMA journal_mode").fetchone()[0]
+        assert mode == "wal"
+    
+    def test_unreachable_l2_degrades_to_l1(self, config_override):
+        """Without its L2 server the cache still works, counting errors."""
+        import socket
+        from services.cache import TTLCache
+        from services.cache_backends import RedisBackend
+        from services.metrics import get_metrics
+        config_override(CACHE_L2_TIMEOUT=0.2)
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        cache = TTLCache("l2down", ttl=60, backend=RedisBackend(f"redis://127.0.0.1:{port}/0"))
+        
+        cache.set("a", 1)
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+        assert get_metrics().snapshot()["counters"]["cache.l2down.l2_error"] >= 2
+    
+    def test_get_cache_caps_l1_with_backend(self, config_override):
+        """With an L2 configured, namespaces keep only a small L1."""
+        from services import cache
+        config_override(CACHE_BACKEND="memory", CACHE_L1_MAX_ENTRIES=16)
+        saved = (cache._backend, cache._backend_created, dict(cache._caches))
+        cache._backend_created = False
+        cache._caches.pop("l2tiered", None)
+        try:
+            tiered = cache.get_cache("l2tiered")
+            assert tiered.backend is not None and tiered.max_entries == 16
+        finally:
+            cache._backend, cache._backend_created = saved[0], saved[1]
+            cache._caches.clear()
+            cache._caches.update(saved[2])
+
+
+class TestCacheSnapshot:
+    """Tests for cache snapshots and warm restore."""
+    
+    @pytest.fixture
+    def caches(self):
+        from services.cache import get_cache
+        from services.cache_snapshot import NAMESPACES
+        caches = {ns: get_cache(ns) for ns in NAMESPACES}
+        for cache in caches.values():
+            cache.clear()
+        yield caches
+        for cache in caches.values():
+            cache.clear()
+    
+    def test_round_trip(self, caches, tmp_path):
+        """Live entries come back with their values and lifetimes; failures are not kept."""
+        from services import cache_snapshot, solar_service
+        from services.weather_service import WeatherEntry
+        path = str(tmp_path / "snapshot.bin")
+        entry = WeatherEntry(Forecast.from_daily(TestForecast()._daily([0, 61], [5.5, 7.0])), 3600)
+        window = solar_service._DaylightWindow(date(2024, 3, 1), [40000.0] * 8,
+                                               date(2023, 12, 22), 30000.0, 3.5)
+        caches["weather"].set("weather_47.3500_8.5500_2024-03-01", entry, ttl=600)
+        caches["solar"].set("solar_lat_47.4", window)
+        caches["geo"].set("geo_zurich_en", [{"name": "Zurich"}])
+        caches["geo"].set_negative("geo_nowhere_en", [], 30)
+        expires_at = caches["weather"].entries()[0][2]
+        
+        assert cache_snapshot.snapshot(path) == 3
+        for cache in caches.values():
+            cache.clear()
+        assert cache_snapshot.restore(path) == 3
+        
+        restored = caches["weather"].entries()[0]
+        assert restored[1].as_dict() == entry.as_dict()
+        assert restored[2] == expires_at
+        assert caches["solar"].get("solar_lat_47.4").days == window.days
+        assert caches["geo"].get("geo_zurich_en") == [{"name": "Zurich"}]
+        assert "geo_nowhere_en" not in caches["geo"]
+    
+    def test_expired_entries_skipped(self, caches, tmp_path):
+        """Entries that expired while the app was down are not restored."""
+        from services import cache_snapshot
+        path = str(tmp_path / "snapshot.bin")
+        caches["geo"].set("geo_short_en", [{"name": "Short"}], ttl=0.05)
+        caches["geo"].set("geo_long_en", [{"name": "Long"}], ttl=600)
+        assert cache_snapshot.snapshot(path) == 2
+        caches["geo"].clear()
+        
+        time.sleep(0.06)
+        assert cache_snapshot.restore(path) == 1
+        assert caches["geo"].get("geo_long_en") == [{"name": "Long"}]
+        assert "geo_short_en" not in caches["geo"]
+    
+    def test_restore_bounded_by_budget(self, caches, tmp_path):
+        """Restoring stops once the time budget is spent."""
+        from services import cache_snapshot
+        from services.metrics import get_metrics
+        path = str(tmp_path / "snapshot.bin")
+        for i in range(600):
+            caches["geo"].set(f"geo_{i}_en", [{"name": str(i)}], ttl=600)
+        cache_snapshot.snapshot(path)
+        caches["geo"].clear()
+        truncated = get_metrics().snapshot()["counters"].get("cache.snapshot.truncated", 0)
+        
+        assert cache_snapshot.restore(path, budget_ms=0) == 0
+        assert get_metrics().snapshot()["counters"]["cache.snapshot.truncated"] == truncated + 1
+        assert cache_snapshot.restore(path) == 600
+    
+    def test_hottest_entries_kept_when_full(self, caches, tmp_path):
+        """A smaller cache after restart keeps the most recently used entries."""
+        from services import cache_snapshot
+        path = str(tmp_path / "snapshot.bin")
+        for i in range(10):
+            caches["geo"].set(f"geo_{i}_en", [{"name": str(i)}], ttl=600)
+        caches["geo"].get("geo_0_en")  # Now the most recently used
+        cache_snapshot.snapshot(path)
+        caches["geo"].clear()
+        
+        saved = caches["geo"].max_entries
+        caches["geo"].max_entries = 3
+        try:
+            cache_snapshot.restore(path)
+            assert sorted(k for k, *_ in caches["geo"].entries()) == ["geo_0_en", "geo_8_en", "geo_9_en"]
+        finally:
+            caches["geo"].max_entries = saved
+    
+    def test_unreadable_snapshot_ignored(self, caches, tmp_path):
+        """Missing, foreign or damaged files restore nothing."""
+        from services import cache_snapshot
+        assert cache_snapshot.restore(str(tmp_path / "missing.bin")) == 0
+        foreign = tmp_path / "foreign.bin"
+        foreign.write_bytes(b"not a snapshot")
+        assert cache_snapshot.restore(str(foreign)) == 0
+        damaged = tmp_path / "damaged.bin"
+        damaged.write_bytes(cache_snapshot._MAGIC + b"\x80\x05garbage")
+        assert cache_snapshot.restore(str(damaged)) == 0
+
+
+class TestMicroBatcher:
+    """Tests for multi-location micro-batching."""
+    
+    def _concurrently(self, fns):
+        import threading
+        results = {}
+        threads = [threading.Thread(target=lambda i=i, fn=fn: results.__setitem__(i, fn()))
+                   for i, fn in enumerate(fns)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return [results[i] for i in range(len(fns))]
+    
+    def test_concurrent_misses_share_one_request(self, config_override):
+        """Requests within the window go out as one multi-location call and fan back out."""
+        from services.batcher import MicroBatcher
+        config_override(UPSTREAM_BATCH_WINDOW_MS=100)
+        batcher = MicroBatcher("https://api.example.com/v1/forecast", "test")
+        
+        def get_json(url, params):
+            lats = str(params["latitude"]).split(",")
+            return [{"lat": float(lat)} for lat in lats]
+        
+        points = [(10.0 + i, 20.0) for i in range(4)]
+        with patch('services.upstream.get_json', side_effect=get_json) as mock_get:
+            results = self._concurrently([
+                lambda p=p: batcher.fetch({"latitude": p[0], "longitude": p[1], "daily": ["x"]})
+                for p in points])
+        
+        assert mock_get.call_count == 1
+        assert [r["lat"] for r in results] == [10.0, 11.0, 12.0, 13.0]
+    
+    def test_single_request_unchanged(self, config_override):
+        """A lone request is sent as-is and gets the object back."""
+        from services.batcher import MicroBatcher
+        config_override(UPSTREAM_BATCH_WINDOW_MS=5)
+        batcher = MicroBatcher("https://api.example.com/v1/forecast", "test")
+        params = {"latitude": 47.35, "longitude": 8.55, "daily": ["x"]}
+        
+        with patch('services.upstream.get_json', return_value={"ok": 1}) as mock_get:
+            assert batcher.fetch(params) == {"ok": 1}
+        assert mock_get.call_args[0][1] == params
+    
+    def test_full_batch_sent_without_waiting(self, config_override):
+        """A batch at UPSTREAM_BATCH_MAX goes out before the window ends."""
+        from services.batcher import MicroBatcher
+        config_override(UPSTREAM_BATCH_WINDOW_MS=2000, UPSTREAM_BATCH_MAX=2)
+        batcher = MicroBatcher("https://api.example.com/v1/forecast", "test")
+        
+        with patch('services.upstream.get_json', return_value=[{"a": 1}, {"b": 2}]):
+            started = time.perf_counter()
+            results = self._concurrently([
+                lambda: batcher.fetch({"latitude": 1, "longitude": 1}),
+                lambda: batcher.fetch({"latitude": 2, "longitude": 2})])
+        
+        assert time.perf_counter() - started < 1.0
+        assert sorted(results, key=str) == [{"a": 1}, {"b": 2}]
+    
+    def test_failure_reaches_every_caller(self, config_override):
+        """A failed batch returns None to all of its callers."""
+        from services.batcher import MicroBatcher
+        config_override(UPSTREAM_BATCH_WINDOW_MS=100)
+        batcher = MicroBatcher("https://api.example.com/v1/forecast", "test")
+        
+        with patch('services.upstream.get_json', return_value=None):
+            results = self._concurrently([
+                lambda: batcher.fetch({"latitude": 1, "longitude": 1}),
+                lambda: batcher.fetch({"latitude": 2, "longitude": 2})])
+        assert results == [None, None]
+    
+    def test_batch_sent_at_highest_member_priority(self, config_override):
+        """An interactive request joining a prefetch-led batch lifts the batch's priority."""
+        import threading
+        from services import quota
+        from services.batcher import MicroBatcher
+        config_override(UPSTREAM_BATCH_WINDOW_MS=200)
+        batcher = MicroBatcher("https://api.example.com/v1/forecast", "test")
+        seen = []
+        
+        def get_json(url, params):
+            seen.append(quota.current_priority())
+            return [{"a": 1}, {"b": 2}]
+        
+        def prefetch():
+            with quota.priority(quota.PREFETCH):
+                batcher.fetch({"latitude": 1, "longitude": 1})
+        
+        with patch('services.upstream.get_json', side_effect=get_json):
+            leader = threading.Thread(target=prefetch)
+            leader.start()
+            time.sleep(0.05)
+            assert batcher.fetch({"latitude": 2, "longitude": 2}) == {"b": 2}
+            leader.join()
+        
+        assert seen == [quota.INTERACTIVE]
+    
+    def test_leader_deadline_does_not_bound_followers(self, config_override):
+        """A leader about to run out of time does not cut the batch short for others."""
+        import threading
+        from services import deadline
+        from services.batcher import MicroBatcher
+        config_override(UPSTREAM_BATCH_WINDOW_MS=100)
+        batcher = MicroBatcher("https://api.example.com/v1/forecast", "test")
+        budgets = []
+        
+        def get_json(url, params):
+            budgets.append(deadline.remaining())
+            time.sleep(0.2)
+            return [{"a": 1}, {"b": 2}]
+        
+        def hurried_leader():
+            with deadline.deadline(0.12), pytest.raises(deadline.DeadlineExceeded):
+                batcher.fetch({"latitude": 1, "longitude": 1})
+        
+        with patch('services.upstream.get_json', side_effect=get_json):
+            leader = threading.Thread(target=hurried_leader)
+            leader.start()
+            time.sleep(0.02)
+            with deadline.deadline(5.0):
+                assert batcher.fetch({"latitude": 2, "longitude": 2}) == {"b": 2}
+            leader.join()
+        
+        assert budgets[0] > 4.0
+    
+    def test_weather_cells_batched_and_cached(self, config_override):
+        """Concurrent weather misses for different cells fill every entry from one call."""
+        from services import weather_service
+        config_override(UPSTREAM_BATCH_WINDOW_MS=100)
+        weather_service._cache.clear()
+        
+        def get_json(url, params):
+            n = len(str(params["latitude"]).split(","))
+            return [{"daily": {"time": ["2024-01-15"], "weathercode": [i],
+                               "temperature_2m_max": [10], "temperature_2m_min": [2],
+                               "precipitation_sum": [0], "precipitation_probability_max": [0]}}
+                    for i in range(n)]
+        
+        with patch('services.upstream.get_json', side_effect=get_json) as mock_get:
+            results = self._concurrently([
+                lambda: weather_service.fetch_daily_weather(47.37, 8.54),
+                lambda: weather_service.fetch_daily_weather(52.52, 13.40)])
+            again = [weather_service.fetch_daily_weather(47.37, 8.54),
+                     weather_service.fetch_daily_weather(52.52, 13.40)]
+        
+        assert mock_get.call_count == 1
+        assert sorted(r["today"]["code"] for r in results) == [0, 1]
+        assert again == results
+
+
 class TestRateLimiter:
     """Tests for rate_limiter module."""
     
@@ -212,6 +1965,26 @@ class TestUpliftEngine:
         # Should be one of the expected scenarios
         assert scenario in ["rain_clearing_soon", "light_fighter", "post_solstice_grind", "stable_focus_light"]
     
+    def test_weather_and_solar_fetched_concurrently(self):
+        """A cold request waits for the slower fetch, not for both in turn."""
+        import threading
+        from services.uplift_engine import generate_uplift_data
+        threads = []
+        
+        def slow_weather(*args, **kwargs):
+            threads.append(threading.current_thread().name)
+            time.sleep(0.3)
+            return {}
+        
+        with patch('services.uplift_engine.fetch_daily_weather', side_effect=slow_weather), \
+             patch('services.uplift_engine.prefetch_daylight', side_effect=lambda *a: time.sleep(0.3)):
+            started = time.perf_counter()
+            generate_uplift_data(47.37, 8.54, "Zurich")
+            elapsed = time.perf_counter() - started
+        
+        assert elapsed < 0.55
+        assert threads[0].startswith("io")
+    
     def test_generate_uplift_data_returns_expected_keys(self):
         """Test that generate_uplift_data returns all expected keys."""
         from services.uplift_engine import generate_uplift_data